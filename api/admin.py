@@ -1,7 +1,7 @@
 from flask import request, jsonify, Blueprint
 from loguru import logger
 from services.db import dbs
-from services.exceptions import UnauthenticatedError
+from services.exceptions import UnauthenticatedError, NoAccessError
 
 
 admin_bp = Blueprint('admin', __name__)
@@ -12,6 +12,19 @@ def heartbeat():
     return 'OK'
 
 
+@admin_bp.route('/metrics')
+def metrics():
+    token = request.headers.get('Authorization')
+    try:
+        return jsonify(status=0, msg='OK', data=dbs.read_metrics(token))
+
+    except UnauthenticatedError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 401
+
+    except NoAccessError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 403
+
+
 @admin_bp.route('/login', methods=['POST'])
 def login():
     username = request.json.get('username')
@@ -32,9 +45,6 @@ def login():
     except Exception as e:
         return jsonify(status=1, msg=f'Failed to login: {e}'), 500
 
-    finally:
-        dbs.session.rollback()
-
 
 @admin_bp.route('/logout')
 def logout():
@@ -49,6 +59,3 @@ def logout():
         msg = f'Error when logout with token {token}: {e}'
         logger.error(msg)
         return jsonify(status=2, msg=msg), 500
-
-    finally:
-        dbs.session.rollback()
@@ -1,17 +1,32 @@
+import io
+import csv
+import json
 import datetime
 import traceback
 from loguru import logger
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 
-from services.db import dbs
+from db.models import JoggingInfo
+from db.pagination import encode_cursor, decode_cursor
+from services.db import dbs, RECORDS, REPORTS
 from services.config import DEFAULT_PAGE_NUM, DEFAULT_PAGE_SIZE
 from services import exceptions
-from filtering.conversion import convert_str_to_filters
+from filtering.conversion import convert_str_to_filters, parse_fields
+from filtering.models import FieldNotFound
 
 
 jogging_bp = Blueprint('jogging', __name__)
 
 
+def not_modified(etag):
+    """Return a 304 response if the request already has the representation with the given ETag, otherwise None
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+
 @jogging_bp.route('/record', methods=['PUT', 'POST'])
 def create_or_update_record():
     token = request.headers.get('Authorization')
@@ -28,6 +43,9 @@ def create_or_update_record():
     except exceptions.UnknownRecord as e:
         return jsonify(status=1, msg=f'ERROR: {e}'), 409
 
+    except exceptions.MissingInformation as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 400
+
     except exceptions.UnauthenticatedError as e:
         return jsonify(status=1, msg=f'ERROR: {e}'), 401
 
@@ -39,8 +57,35 @@ def create_or_update_record():
         logger.error(f'{request.method} request failed: {e}')
         return jsonify(status=1, msg=f'Error: {e}'), 500
 
-    finally:
-        dbs.session.rollback()
+
+@jogging_bp.route('/records/bulk', methods=['POST'])
+def create_records_in_bulk():
+    """Create many records at once from a JSON array, or from NDJSON with one record per line
+    """
+    token = request.headers.get('Authorization')
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            rows = [json.loads(line) for line in request.stream if line.strip()]
+        else:
+            rows = request.get_json(force=True)
+        if not isinstance(rows, list):
+            raise ValueError('expected a JSON array of records')
+
+    except Exception as e:
+        return jsonify(status=1, msg=f'Invalid request body: {e}'), 400
+
+    try:
+        created, errors = dbs.create_records(rows, token)
+        msg = 'OK' if not errors else f'{len(errors)} of {len(rows)} records rejected'
+        return jsonify(status=0, msg=msg, created=created, errors=errors)
+
+    except exceptions.UnauthenticatedError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 401
+
+    except Exception as e:
+        traceback.print_exc()
+        logger.error(f'Bulk record creation failed: {e}')
+        return jsonify(status=1, msg=f'Error: {e}'), 500
 
 
 @jogging_bp.route('/record/<rid>', methods=['DELETE'])
@@ -72,20 +117,34 @@ def delete_a_record(rid):
         logger.error(f'{request.method} request failed: {e}')
         return jsonify(status=1, msg=f'Error: {e}'), 500
 
-    finally:
-        dbs.session.rollback()
-
 
 @jogging_bp.route('/record')
 def read_records():
     try:
         page = int(request.args.get('page', DEFAULT_PAGE_NUM))
         page_size = int(request.args.get('pagesize', DEFAULT_PAGE_SIZE))
+        if page < 1 or page_size < 1:
+            raise ValueError('page and pagesize must be positive')
 
     except Exception as e:
         return jsonify(
             status=1, msg=f'Invalid page or pagesize: {e}'), 400
 
+    try:
+        fields = parse_fields(request.args.get('fields'), JoggingInfo)
+
+    except FieldNotFound as e:
+        return jsonify(status=1, msg=f'Invalid fields: {e}'), 400
+
+    # Cursor mode is turned on by the presence of `after`, an empty value starts from the first page
+    cursor_mode = 'after' in request.args
+    try:
+        after = request.args.get('after')
+        after = decode_cursor(after) if after else None
+
+    except ValueError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 400
+
     try:
         filter_str = request.args.get('filter')
         filters = convert_str_to_filters(filter_str)
@@ -97,9 +156,36 @@ def read_records():
     token = request.headers.get('Authorization')
 
     try:
-        logger.debug(f'Page {page}, page size: {page_size}, token {token}, filters {filters}')
-        data = dbs.read_records(token, filters, page, page_size)
-        return jsonify(status=0, msg='OK', data=data)
+        logger.debug(f'Page {page}, page size: {page_size}, after: {after}, token {token}, filters {filters}')
+        # The ETag is read before the records, so a change in between makes the next request read them again
+        etag = dbs.get_etag(RECORDS, token)
+        response = not_modified(etag)
+        if response:
+            return response
+
+        # Cached bodies are keyed by the ETag too, as writes made by other processes change it but not
+        # the generations of this one, so a body is only ever sent with the ETag it was built for
+        with_total = request.args.get('with_total') == '1'
+        key = dbs.get_response_key(RECORDS, token, filters, page, page_size, tuple(fields or ()), cursor_mode,
+                                   after, with_total, etag)
+        cached = dbs.response_cache.get(key)
+        if cached is not None:
+            response = Response(cached, mimetype='application/json')
+            response.set_etag(etag, weak=True)
+            return response
+
+        result = {}
+        if cursor_mode:
+            data, next_key = dbs.read_records_after(token, filters, after, page_size, fields)
+            result['next_cursor'] = encode_cursor(*next_key) if next_key else None
+        else:
+            data = dbs.read_records(token, filters, page, page_size, fields)
+        if with_total:
+            result['total'] = dbs.count_records(token, filters)
+        response = jsonify(status=0, msg='OK', data=data, **result)
+        dbs.response_cache.set(key, response.get_data())
+        response.set_etag(etag, weak=True)
+        return response
 
     except exceptions.UnauthenticatedError as e:
         return jsonify(status=1, msg=f'ERROR: {e}'), 401
@@ -112,8 +198,65 @@ def read_records():
         logger.error(f'Failed to read jogging records: {e}')
         return jsonify(status=1, msg=f'ERROR: {e}'), 500
 
-    finally:
-        dbs.session.rollback()
+
+@jogging_bp.route('/record/export')
+def export_records():
+    """Stream all records the token has access to as NDJSON or CSV
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(status=1, msg=f'Invalid format {export_format}, choose from {", ".join(EXPORT_FORMATS)}'), 400
+
+    try:
+        filter_str = request.args.get('filter')
+        filters = convert_str_to_filters(filter_str)
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify(status=1, msg=f'Invalid filter {filter_str}: {e}'), 400
+
+    token = request.headers.get('Authorization')
+
+    try:
+        records = dbs.export_records(token, filters)
+
+    except exceptions.UnauthenticatedError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 401
+
+    except Exception as e:
+        traceback.print_exc()
+        logger.error(f'Failed to export jogging records: {e}')
+        return jsonify(status=1, msg=f'ERROR: {e}'), 500
+
+    generate, mimetype = EXPORT_FORMATS[export_format]
+    return Response(stream_with_context(generate(records)), mimetype=mimetype)
+
+
+def generate_ndjson(records):
+    for record in records:
+        yield json.dumps(record, default=str) + '\n'
+
+
+def generate_csv(records):
+    columns = [column.key for column in JoggingInfo.__table__.columns]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, columns)
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        # Send the buffered lines once they are big enough to be worth a chunk
+        if buffer.tell() > 8192:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    'ndjson': (generate_ndjson, 'application/x-ndjson'),
+    'csv': (generate_csv, 'text/csv'),
+}
 
 
 @jogging_bp.route('/report')
@@ -123,11 +266,18 @@ def make_weekly_report():
     if week_start_date:
         week_start_date = datetime.datetime.strptime(week_start_date, '%Y-%m-%d').date()
     else:
-        week_start_date = datetime.datetime.today() - datetime.timedelta(days=6)
+        week_start_date = datetime.date.today() - datetime.timedelta(days=6)
 
     try:
+        etag = dbs.get_etag(REPORTS, token, week_start_date)
+        response = not_modified(etag)
+        if response:
+            return response
+
         data = dbs.make_weekly_report(token, week_start_date)
-        return jsonify(status=0, msg='OK', data=data)
+        response = jsonify(status=0, msg='OK', data=data)
+        response.set_etag(etag, weak=True)
+        return response
 
     except exceptions.UnauthenticatedError as e:
         return jsonify(status=1, msg=f'ERROR: {e}'), 401
@@ -137,5 +287,35 @@ def make_weekly_report():
         logger.error(f'Failed to read jogging records: {e}')
         return jsonify(status=1, msg=f'ERROR: {e}'), 500
 
-    finally:
-        dbs.session.rollback()
+
+@jogging_bp.route('/report/series')
+def make_report_series():
+    token = request.headers.get('Authorization')
+    try:
+        from_date = datetime.datetime.strptime(request.args['from'], '%Y-%m-%d').date()
+        to_date = datetime.datetime.strptime(request.args['to'], '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+        return jsonify(status=1, msg='ERROR: from and to must be dates in YYYY-MM-DD format'), 400
+    bucket = request.args.get('bucket', 'week')
+
+    try:
+        etag = dbs.get_etag(REPORTS, token, from_date, to_date, bucket)
+        response = not_modified(etag)
+        if response:
+            return response
+
+        data = dbs.make_report_series(token, from_date, to_date, bucket)
+        response = jsonify(status=0, msg='OK', data=data)
+        response.set_etag(etag, weak=True)
+        return response
+
+    except exceptions.UnauthenticatedError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 401
+
+    except ValueError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 400
+
+    except Exception as e:
+        traceback.print_exc()
+        logger.error(f'Failed to read jogging records: {e}')
+        return jsonify(status=1, msg=f'ERROR: {e}'), 500
@@ -0,0 +1,43 @@
+import datetime
+import traceback
+from loguru import logger
+from flask import Blueprint, request, jsonify
+
+from services.db import dbs
+from services.config import DEFAULT_LEADERBOARD_LIMIT
+from services import exceptions
+
+
+stats_bp = Blueprint('stats', __name__)
+
+
+@stats_bp.route('/stats/leaderboard')
+def get_leaderboard():
+    token = request.headers.get('Authorization')
+    period = request.args.get('period', 'week')
+    metric = request.args.get('metric', 'distance')
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LEADERBOARD_LIMIT))
+        date = request.args.get('date')
+        if date:
+            date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+    except ValueError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 400
+
+    try:
+        data = dbs.get_leaderboard(token, period, metric, limit, date)
+        return jsonify(status=0, msg='OK', data=data)
+
+    except exceptions.UnauthenticatedError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 401
+
+    except exceptions.NoAccessError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 403
+
+    except ValueError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 400
+
+    except Exception as e:
+        traceback.print_exc()
+        logger.error(f'Failed to read stats: {e}')
+        return jsonify(status=1, msg=f'ERROR: {e}'), 500
@@ -1,11 +1,13 @@
 import traceback
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from loguru import logger
 
-from services.db import dbs
+from services.db import dbs, USERS
 from services.config import DEFAULT_PAGE_SIZE, DEFAULT_PAGE_NUM
 from services import exceptions
-from filtering.conversion import convert_str_to_filters
+from db.models import UserInfo
+from filtering.conversion import convert_str_to_filters, parse_fields
+from filtering.models import FieldNotFound
 
 
 user_bp = Blueprint('user', __name__)
@@ -42,8 +44,28 @@ def create_or_update_user():
         logger.error(f'{request.method} request failed: {e}')
         return jsonify(status=1, msg=f'Error: {e}'), 500
 
-    finally:
-        dbs.session.rollback()
+
+@user_bp.route('/users/bulk', methods=['PUT'])
+def create_users_in_bulk():
+    token = request.headers.get('Authorization')
+    rows = request.get_json(force=True, silent=True)
+    if not isinstance(rows, list):
+        return jsonify(status=1, msg='Invalid request body: expected a JSON array of users'), 400
+
+    try:
+        data = dbs.create_users(rows, token)
+        return jsonify(status=0, msg='OK', data=data)
+
+    except exceptions.UnauthenticatedError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 401
+
+    except exceptions.NoAccessError as e:
+        return jsonify(status=1, msg=f'ERROR: {e}'), 403
+
+    except Exception as e:
+        traceback.print_exc()
+        logger.error(f'Bulk user creation failed: {e}')
+        return jsonify(status=1, msg=f'Error: {e}'), 500
 
 
 @user_bp.route('/user/<username>', methods=['DELETE'])
@@ -70,8 +92,6 @@ def delete_user(username):
         traceback.print_exc()
         logger.error(f'{request.method} request failed: {e}')
         return jsonify(status=1, msg=f'Error: {e}'), 500
-    finally:
-        dbs.session.rollback()
 
 
 @user_bp.route('/user')
@@ -79,10 +99,18 @@ def read_user_info():
     try:
         page = int(request.args.get('page', DEFAULT_PAGE_NUM))
         page_size = int(request.args.get('pagesize', DEFAULT_PAGE_SIZE))
+        if page < 1 or page_size < 1:
+            raise ValueError('page and pagesize must be positive')
 
     except Exception as e:
         return jsonify(status=1, msg=f'Invalid page or pagesize: {e}'), 400
 
+    try:
+        fields = parse_fields(request.args.get('fields'), UserInfo)
+
+    except FieldNotFound as e:
+        return jsonify(status=1, msg=f'Invalid fields: {e}'), 400
+
     try:
         filter_str = request.args.get('filter')
         filters = convert_str_to_filters(filter_str)
@@ -95,8 +123,19 @@ def read_user_info():
 
     try:
         logger.debug(f'Token: {token}. Filters for string {filter_str}: {filters}')
-        data = dbs.read_user_info(token, filters, page, page_size)
-        return jsonify(status=0, msg='OK', data=data)
+        with_total = request.args.get('with_total') == '1'
+        key = dbs.get_response_key(USERS, token, filters, page, page_size, tuple(fields or ()), with_total)
+        cached = dbs.response_cache.get(key)
+        if cached is not None:
+            return Response(cached, mimetype='application/json')
+
+        data = dbs.read_user_info(token, filters, page, page_size, fields)
+        if with_total:
+            response = jsonify(status=0, msg='OK', data=data, total=dbs.count_user_info(token, filters))
+        else:
+            response = jsonify(status=0, msg='OK', data=data)
+        dbs.response_cache.set(key, response.get_data())
+        return response
 
     except exceptions.UnauthenticatedError as e:
         return jsonify(status=1, msg=f'ERROR: {e}'), 401
@@ -108,6 +147,3 @@ def read_user_info():
         traceback.print_exc()
         logger.error(f'Failed to read user information: {e}')
         return jsonify(status=1, msg=f'ERROR: {e}'), 500
-
-    finally:
-        dbs.session.rollback()
@@ -7,6 +7,8 @@ from flask.json import JSONEncoder
 from api.admin import admin_bp
 from api.user import user_bp
 from api.jogging import jogging_bp
+from api.stats import stats_bp
+from services.db import dbs
 
 
 def create_app():
@@ -21,9 +23,27 @@ def create_app():
     # configure_hook(app)
     app.json_encoder = CustomJSONEncoder
 
-    for bp in [admin_bp, user_bp, jogging_bp]:
+    for bp in [admin_bp, user_bp, jogging_bp, stats_bp]:
         app.register_blueprint(bp)
 
+    @app.teardown_appcontext
+    def remove_db_session(exception=None):
+        # Roll back whatever the request left open and give its connection back to the pool
+        dbs.session.remove()
+
+    @app.cli.command('rebuild-weekly-summary')
+    def rebuild_weekly_summary():
+        """Recompute the weekly report totals from all jogging records."""
+        weeks = dbs.rebuild_weekly_summary()
+        logger.info(f'Rebuilt weekly summary with {weeks} weeks')
+
+    @app.cli.command('redrive-weather')
+    def redrive_weather():
+        """Look up the weather again for records left 'Unknown' or 'Pending'."""
+        records = dbs.redrive_weather()
+        dbs.weather_enricher.join()
+        logger.info(f'Redrove weather of {records} records: {dbs.weather_enricher.stats()}')
+
     return app
 
 
@@ -0,0 +1,56 @@
+"""Time bulk record creation against creating records one by one.
+
+Weather is provided in every row, so no weather lookups are included.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_bulk_insert [number of records, default 10000]
+"""
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+import sys
+import time
+import random
+import tempfile
+
+from services.db import DBService
+
+
+ADMIN_TOKEN = 'a2258791-5dee-4cf7-a84c-56f35bdf1bc7'
+USERNAMES = [f'user{i}' for i in range(50)]
+
+
+def make_rows(num):
+    return [
+        {'username': random.choice(USERNAMES), 'date': f'2020-09-{random.randint(1, 30):02}', 'lat': 51.5, 'lon': -0.1,
+         'distance': random.randint(1000, 10000), 'time': random.randint(5, 60), 'weather': 'Clear'}
+        for _ in range(num)
+    ]
+
+
+def main(num):
+    rows = make_rows(num)
+    with tempfile.TemporaryDirectory() as folder:
+        service = DBService(os.path.join(folder, 'bench.db'))
+        service.create_admin_user({'username': 'admin', 'password': '', 'role': 'admin', 'token': ADMIN_TOKEN})
+        for username in USERNAMES:
+            service.create_admin_user({'username': username, 'password': '', 'role': 'user'})
+
+        start = time.perf_counter()
+        created, errors = service.create_records(rows, ADMIN_TOKEN)
+        bulk = time.perf_counter() - start
+
+        sample = rows[:min(num, 1000)]
+        start = time.perf_counter()
+        for row in sample:
+            service.create_a_record(row, ADMIN_TOKEN)
+        one_by_one = (time.perf_counter() - start) / len(sample) * num
+
+        service.engine.dispose()
+
+    print(f'bulk:       {created} records in {bulk:.3f}s ({len(errors)} errors)')
+    print(f'one by one: {one_by_one:.3f}s estimated for {num} records')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
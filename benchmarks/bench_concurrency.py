@@ -0,0 +1,87 @@
+"""Measure read throughput of DBService as the number of worker threads grows.
+
+Each thread behaves like a request handler of a threaded gunicorn worker: it reads a page
+of records with its own token, then releases its session as the request teardown does.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_concurrency [number of records, default 100000]
+"""
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+import sys
+import time
+import uuid
+import random
+import datetime
+import tempfile
+import threading
+
+from db.models import UserInfo, JoggingInfo
+from services.db import DBService
+
+
+USERS = 100
+REQUESTS_PER_THREAD = 300
+THREAD_COUNTS = [1, 2, 4, 8]
+
+
+def populate(service, num):
+    users = [
+        {'username': f'user{i}', 'password': '', 'forename': '', 'surname': '', 'email': '',
+         'role': 'user', 'token': str(uuid.uuid4())}
+        for i in range(USERS)
+    ]
+    start = datetime.date(2019, 1, 1)
+    records = [
+        {'username': f'user{random.randrange(USERS)}', 'date': start + datetime.timedelta(days=random.randrange(700)),
+         'lat': 0.0, 'lon': 0.0, 'distance': random.randint(1000, 10000), 'time': random.randint(5, 60), 'weather': 'Clear'}
+        for _ in range(num)
+    ]
+    with service.engine.begin() as conn:
+        conn.execute(UserInfo.__table__.insert(), users)
+        conn.execute(JoggingInfo.__table__.insert(), records)
+
+    return [u['token'] for u in users]
+
+
+def handle_requests(service, tokens, errors):
+    filters = {'field': 'distance', 'op': '>', 'value': 5000}
+    for _ in range(REQUESTS_PER_THREAD):
+        try:
+            service.read_records(random.choice(tokens), filters, page=random.randint(1, 5), page_size=20)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            service.session.remove()
+
+
+def run(service, tokens, thread_count):
+    errors = []
+    threads = [threading.Thread(target=handle_requests, args=(service, tokens, errors)) for _ in range(thread_count)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return thread_count * REQUESTS_PER_THREAD / elapsed, len(errors)
+
+
+def main(num):
+    with tempfile.TemporaryDirectory() as folder:
+        service = DBService(os.path.join(folder, 'bench.db'))
+        print(f'Populating {USERS} users and {num} records...')
+        tokens = populate(service, num)
+
+        print(f'{"threads":<10}{"requests/s":>14}{"errors":>10}')
+        for thread_count in THREAD_COUNTS:
+            throughput, errors = run(service, tokens, thread_count)
+            print(f'{thread_count:<10}{throughput:>14.1f}{errors:>10}')
+
+        service.engine.dispose()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,58 @@
+"""Time turning filter strings into filtered selects, with and without the filter caches.
+
+Uncached, every call parses the string, builds the Filter tree and inspects the mapper for
+field names, as `GET /record` used to. Cached, repeated filter shapes skip all of that and
+only put their values into the compiled filters.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_filters [number of calls per filter, default 10000]
+"""
+import sys
+import timeit
+from unittest.mock import patch
+
+from sqlalchemy import select
+
+import filtering.models
+from db.models import JoggingInfo
+from filtering.conversion import convert_str_to_filters, parse_filter_str
+from filtering.filters import apply_filters, build_filters
+
+
+FILTER_STRS = [
+    "date == '2020-09-23'",
+    '(distance > 2500) or (distance < 1000)',
+    "(username == 'helenkelly') and ((distance > 2500) or (distance < 1000))",
+    "(date >= '2020-09-01') and ((time > 30) or (weather == 'Rain'))",
+]
+
+
+def uncached(filter_str):
+    filter_dict = parse_filter_str.__wrapped__(filter_str)
+    filters = [f.format_for_sqlalchemy(None, JoggingInfo) for f in build_filters(filter_dict)]
+    return select(JoggingInfo.rid).filter(*filters)
+
+
+def cached(filter_str):
+    return apply_filters(select(JoggingInfo.rid), convert_str_to_filters(filter_str), JoggingInfo)
+
+
+def to_sql(query):
+    return str(query.compile(compile_kwargs={'literal_binds': True}))
+
+
+def main(number):
+    for filter_str in FILTER_STRS:
+        assert to_sql(uncached(filter_str)) == to_sql(cached(filter_str))
+
+        with patch.object(filtering.models, 'get_valid_field_names', filtering.models.get_valid_field_names.__wrapped__):
+            before = timeit.timeit(lambda: uncached(filter_str), number=number)
+        after = timeit.timeit(lambda: cached(filter_str), number=number)
+
+        print(f'{filter_str}')
+        print(f'    uncached: {before / number * 1e6:7.1f}us   cached: {after / number * 1e6:7.1f}us   '
+              f'({before / after:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,81 @@
+"""Compare hot lookups with and without the secondary indexes.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_indexes [number of rows, default 1000000]
+"""
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+import sys
+import uuid
+import random
+import datetime
+import tempfile
+import timeit
+
+from db.models import Base, UserInfo, JoggingInfo
+from services.db import DBService
+
+
+LOOKUPS = 200
+
+
+def populate(service, num):
+    """Insert `num` users and `num` records, one record per user"""
+    users = [
+        {'username': f'user{i}', 'password': '', 'forename': '', 'surname': '', 'email': '',
+         'role': 'user', 'token': str(uuid.uuid4())}
+        for i in range(num)
+    ]
+    start = datetime.date(2015, 1, 1)
+    records = [
+        {'username': f'user{random.randrange(num)}', 'date': start + datetime.timedelta(days=random.randrange(2000)),
+         'lat': 0.0, 'lon': 0.0, 'distance': random.randint(1000, 10000), 'time': random.randint(5, 60), 'weather': 'Clear'}
+        for _ in range(num)
+    ]
+    with service.engine.begin() as conn:
+        conn.execute(UserInfo.__table__.insert(), users)
+        conn.execute(JoggingInfo.__table__.insert(), records)
+
+    return [u['token'] for u in users], [u['username'] for u in users]
+
+
+def measure(service, tokens, usernames):
+    token_time = timeit.timeit(
+        lambda: service.user_table.get_a_user_by_token(random.choice(tokens)), number=LOOKUPS)
+
+    date_range = {
+        'and': [
+            {'field': 'date', 'op': '>=', 'value': datetime.date(2016, 1, 4)},
+            {'field': 'date', 'op': '<=', 'value': datetime.date(2016, 1, 10)},
+        ]
+    }
+    range_time = timeit.timeit(
+        lambda: service.jogging_table.get_records_of_a_user(random.choice(usernames), date_range), number=LOOKUPS)
+
+    return token_time / LOOKUPS, range_time / LOOKUPS
+
+
+def main(num):
+    with tempfile.TemporaryDirectory() as folder:
+        service = DBService(os.path.join(folder, 'bench.db'))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(service.engine)
+
+        print(f'Populating {num} users and {num} records...')
+        tokens, usernames = populate(service, num)
+
+        before = measure(service, tokens, usernames)
+        service.create_indexes()
+        after = measure(service, tokens, usernames)
+        service.session.close()
+        service.engine.dispose()
+
+    print(f'{"lookup":<32}{"no index (ms)":>16}{"indexed (ms)":>16}')
+    for name, b, a in zip(['token -> user', 'username + date range'], before, after):
+        print(f'{name:<32}{b * 1000:>16.3f}{a * 1000:>16.3f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
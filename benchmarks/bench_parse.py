@@ -0,0 +1,56 @@
+"""Time parsing long filter strings, to check parsing stays linear in the number of terms.
+
+Filters are parsed without the filter string cache. Each filter string has `terms`
+comparisons, either chained with `or`/`and`, nested in parentheses, or as the values
+of one `in`.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_parse [number of terms, default 1000]
+"""
+import sys
+import timeit
+
+from filtering.conversion import parse_filter_str
+
+
+ROUNDS = 5
+
+
+def make_chain(terms):
+    return ' or '.join(
+        f"(distance > {i} and date >= '2020-01-{i % 28 + 1:02d}')" if i % 2 else f"weather == 'Rain {i}'"
+        for i in range(terms)
+    )
+
+
+def make_nested(terms):
+    # Nested only as deep as parsing allows, then chained
+    depth = 50
+    groups = []
+    for start in range(0, terms, depth):
+        group = f'time > {start}'
+        for i in range(start + 1, min(start + depth, terms)):
+            group = f'(time > {i} and ({group}))'
+        groups.append(group)
+    return ' or '.join(groups)
+
+
+def make_in_list(terms):
+    return 'distance in [{}]'.format(', '.join(str(i * 1.5) for i in range(terms)))
+
+
+def time_parse(filter_str):
+    number = 10
+    best = min(timeit.repeat(lambda: parse_filter_str.__wrapped__(filter_str), number=number, repeat=ROUNDS))
+    return best / number
+
+
+def main(terms):
+    for name, make in [('chain', make_chain), ('nested', make_nested), ('in list', make_in_list)]:
+        small, large = time_parse(make(terms // 10)), time_parse(make(terms))
+        print(f'{name:8} {terms // 10:6} terms: {small * 1e3:8.2f}ms   {terms:6} terms: {large * 1e3:8.2f}ms   '
+              f'({large / terms * 1e6:.1f}us per term, {large / small:.1f}x for 10x the terms)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,75 @@
+"""Compare rows/sec of reading records through ORM instances against the Core select read path.
+
+The ORM path is what `JoggingTable.get_all_records` used to do: load `JoggingInfo`
+instances into the identity map and call `to_dict` on each of them.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_read_path [number of records, default 200000]
+"""
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+import sys
+import time
+import random
+import datetime
+import tempfile
+
+from db.models import JoggingInfo
+from filtering.filters import apply_filters
+from services.db import DBService
+
+
+USERNAMES = [f'user{i}' for i in range(50)]
+FILTERS = {'field': 'distance', 'op': '>', 'value': 0}
+ROUNDS = 3
+
+
+def make_rows(num):
+    start = datetime.date(2020, 1, 1)
+    return [
+        {'username': random.choice(USERNAMES), 'date': start + datetime.timedelta(days=random.randint(0, 365)),
+         'lat': 51.5, 'lon': -0.1, 'distance': random.randint(1000, 10000), 'time': random.randint(5, 60),
+         'weather': 'Clear'}
+        for _ in range(num)
+    ]
+
+
+def read_with_orm(session):
+    query = apply_filters(session.query(JoggingInfo), FILTERS).order_by(JoggingInfo.rid)
+    records = [r.to_dict() for r in query]
+    session.expunge_all()
+    return records
+
+
+def best_rate(read, num):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        records = read()
+        elapsed = time.perf_counter() - start
+        assert len(records) == num
+        best = elapsed if best is None else min(best, elapsed)
+
+    return num / best
+
+
+def main(num):
+    with tempfile.TemporaryDirectory() as folder:
+        service = DBService(os.path.join(folder, 'bench.db'))
+        for username in USERNAMES:
+            service.create_admin_user({'username': username, 'password': '', 'role': 'user'})
+        service.jogging_table.create_records(make_rows(num))
+
+        orm = best_rate(lambda: read_with_orm(service.session), num)
+        core = best_rate(lambda: service.jogging_table.get_all_records(FILTERS), num)
+
+        service.session.remove()
+        service.engine.dispose()
+
+    print(f'ORM instances: {orm:,.0f} rows/s')
+    print(f'Core select:   {core:,.0f} rows/s ({core / orm:.1f}x)')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
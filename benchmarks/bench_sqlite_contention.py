@@ -0,0 +1,91 @@
+"""Compare SQLite storage profiles under multi-process read/write contention.
+
+Several processes share one database file, like gunicorn workers do. Writers create records
+and readers page through them for a fixed time, then throughput, tail latency and errors
+are reported for each profile in services.config.SQLITE_PROFILES.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_sqlite_contention [writers, default 4] [readers, default 4] [seconds, default 10]
+"""
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+import sys
+import time
+import random
+import tempfile
+import multiprocessing
+
+from services.config import SQLITE_PROFILES
+from services.db import DBService
+
+
+ADMIN_TOKEN = 'a2258791-5dee-4cf7-a84c-56f35bdf1bc7'
+USERNAMES = [f'user{i}' for i in range(20)]
+
+
+def prepare(path, profile):
+    service = DBService(path, profile=profile)
+    service.create_admin_user({'username': 'admin', 'password': '', 'role': 'admin', 'token': ADMIN_TOKEN})
+    for username in USERNAMES:
+        service.create_admin_user({'username': username, 'password': '', 'role': 'user'})
+    service.engine.dispose()
+
+
+def work(path, profile, is_writer, seconds):
+    """Run in a child process, return (operations, errors, latencies)"""
+    service = DBService(path, profile=profile)
+    operations, errors, latencies = 0, 0, []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            if is_writer:
+                params = {'username': random.choice(USERNAMES), 'date': '2020-09-21', 'lat': 0.0, 'lon': 0.0,
+                          'distance': random.randint(1000, 10000), 'time': random.randint(5, 60), 'weather': 'Clear'}
+                service.create_a_record(params, ADMIN_TOKEN)
+            else:
+                filters = {'field': 'username', 'op': '==', 'value': random.choice(USERNAMES)}
+                service.read_records(ADMIN_TOKEN, filters, page=1, page_size=20)
+            operations += 1
+        except Exception:
+            errors += 1
+        finally:
+            service.session.remove()
+        latencies.append(time.perf_counter() - start)
+
+    service.engine.dispose()
+    return operations, errors, latencies
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0
+
+
+def run(profile, writers, readers, seconds):
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'bench.db')
+        prepare(path, profile)
+
+        jobs = [(path, profile, True, seconds)] * writers + [(path, profile, False, seconds)] * readers
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.starmap(work, jobs)
+
+    print(f'Profile `{profile}`')
+    for name, part in [('writes', results[:writers]), ('reads', results[writers:])]:
+        operations = sum(r[0] for r in part)
+        errors = sum(r[1] for r in part)
+        latencies = [x for r in part for x in r[2]]
+        print(f'  {name:<8}{operations / seconds:>10.1f} ops/s{percentile(latencies, 0.5) * 1000:>10.1f} ms p50'
+              f'{percentile(latencies, 0.99) * 1000:>10.1f} ms p99{errors:>8} errors')
+
+
+def main(writers, readers, seconds):
+    for profile in SQLITE_PROFILES:
+        run(profile, writers, readers, seconds)
+
+
+if __name__ == '__main__':
+    args = [int(x) for x in sys.argv[1:]]
+    main(*(args + [4, 4, 10][len(args):]))
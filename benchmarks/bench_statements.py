@@ -0,0 +1,74 @@
+"""Time reading a page of filtered records with and without the statement cache.
+
+Without it, every call builds the select, applies the filters and paginates, as
+`JoggingTable.get_all_records` used to, so SQLAlchemy works out the cache key of a new
+statement before it finds the compiled SQL. With it, a repeated filter shape reuses
+one statement and only its parameters change.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_statements [number of calls, default 2000]
+"""
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+import sys
+import random
+import timeit
+import datetime
+import tempfile
+
+from sqlalchemy import select
+from db.models import JoggingInfo
+from db.pagination import paginate
+from db.projection import to_dicts
+from db.statements import get_statement_cache_stats
+from filtering.conversion import convert_str_to_filters
+from filtering.filters import apply_filters
+from services.db import DBService
+
+
+FILTER_STR = "(date >= '{}') and ((time > {}) or (weather == 'Rain'))"
+PAGE_SIZE = 20
+
+
+def make_filters():
+    date = datetime.date(2020, 1, 1) + datetime.timedelta(days=random.randint(0, 200))
+    return convert_str_to_filters(FILTER_STR.format(date, random.randint(10, 50)))
+
+
+def read_without_cache(session, filter_dict, page):
+    query = select(*JoggingInfo.__table__.c)
+    query = apply_filters(query, filter_dict, JoggingInfo).order_by(JoggingInfo.rid)
+    return to_dicts(session.execute(paginate(query, page, PAGE_SIZE)))
+
+
+def main(number):
+    with tempfile.TemporaryDirectory() as folder:
+        service = DBService(os.path.join(folder, 'bench.db'))
+        service.create_admin_user({'username': 'jack', 'password': '', 'role': 'user'})
+        service.jogging_table.create_records([
+            {'username': 'jack', 'date': datetime.date(2020, 1, 1) + datetime.timedelta(days=i % 365),
+             'lat': 51.5, 'lon': -0.1, 'distance': 5000, 'time': i % 60, 'weather': random.choice(['Rain', 'Clear'])}
+            for i in range(5000)
+        ])
+        calls = [(make_filters(), random.randint(1, 5)) for _ in range(number)]
+        for filter_dict, page in calls[:10]:
+            assert read_without_cache(service.session, filter_dict, page) == \
+                service.jogging_table.get_all_records(filter_dict, page, PAGE_SIZE)
+
+        iterate = iter(calls * 10)
+        before = timeit.timeit(lambda: read_without_cache(service.session, *next(iterate)), number=number)
+        after = timeit.timeit(lambda: service.jogging_table.get_all_records(*next(iterate), PAGE_SIZE), number=number)
+        compile_cache = service.compile_cache.stats()
+
+        service.session.remove()
+        service.engine.dispose()
+
+    print(f'without statement cache: {before / number * 1e6:7.1f}us per page')
+    print(f'with statement cache:    {after / number * 1e6:7.1f}us per page ({before / after:.1f}x)')
+    print(f'statement cache: {get_statement_cache_stats()}')
+    print(f'compiled SQL cache: {compile_cache}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
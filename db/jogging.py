@@ -1,5 +1,20 @@
-from db.models import JoggingInfo
-from filtering.filters import apply_filters
+from collections import defaultdict
+from sqlalchemy import select, update, delete, func, tuple_, bindparam
+from sqlalchemy.dialects.sqlite import insert
+from db.models import JoggingInfo, WeeklySummary, DataVersion
+from db.projection import select_count, to_dicts, iter_dicts
+from db.statements import get_statement, get_page_params, select_page, select_after
+
+
+# What runners can be ranked by on the leaderboard
+LEADERBOARD_METRICS = {
+    'distance': func.coalesce(func.sum(JoggingInfo.distance), 0),
+    'time': func.coalesce(func.sum(JoggingInfo.time), 0),
+    'runs': func.count(),
+}
+
+# The data version scope of the records of every user, next to the scope of each username
+ALL_RECORDS = ''
 
 
 class JoggingTable:
@@ -7,58 +22,402 @@ class JoggingTable:
         self.session = session
 
     def create_a_record(self, params):
-        self.session.add(JoggingInfo(**params))
+        """Insert a record.
+
+        :return: the rid of the new record
+        """
+        record = JoggingInfo(**params)
+        self.session.add(record)
+        self.session.flush()
+        self.add_to_weekly_summary([self.summarise(record)])
+        self.bump_data_versions([record.username])
+        rid = record.rid
+        self.session.commit()
+        return rid
+
+    def create_records(self, params_list):
+        """Insert many records with one executemany in a single transaction.
+
+        :param params_list: a list of dicts of record parameters, all with the same keys
+        :return: a list of the rids of the new records, in the order of params_list
+        """
+        rids = []
+        if params_list:
+            self.session.execute(JoggingInfo.__table__.insert(), params_list)
+            self.add_to_weekly_summary(self.summarise_many(params_list))
+            self.bump_data_versions({params['username'] for params in params_list})
+            # The transaction holds the write lock, and SQLite hands out rowids in order, one past the largest.
+            # SQLAlchemy 1.4 has no RETURNING for SQLite, so the rows at the derived rids are checked instead.
+            last_rid = self.session.execute(select(func.max(JoggingInfo.rid))).scalar()
+            rids = list(range(last_rid - len(params_list) + 1, last_rid + 1))
+            query = select(JoggingInfo.username, JoggingInfo.date).where(JoggingInfo.rid >= rids[0]).order_by(JoggingInfo.rid)
+            if [tuple(row) for row in self.session.execute(query)] != [(p['username'], p['date']) for p in params_list]:
+                self.session.rollback()
+                raise RuntimeError(f'The {len(params_list)} new records did not get rids {rids[0]} to {rids[-1]}')
         self.session.commit()
+        return rids
 
     def delete_a_record(self, record):
+        self.subtract_from_weekly_summary(self.summarise(record))
+        self.bump_data_versions([record.username])
         self.session.delete(record)
         self.session.commit()
 
     def clear(self):
-        """Delete all rows in jogging table
+        """Delete all rows in jogging table, and the weekly summary with them.
+        Data versions are bumped rather than deleted, so ETags handed out before never match again.
 
         :return:
         """
         self.session.query(JoggingInfo).delete()
+        self.session.query(WeeklySummary).delete()
+        self.bump_data_versions(self.session.execute(select(DataVersion.scope)).scalars().all())
         self.session.commit()
 
     def update_a_record(self, params):
+        """Update a record with the given parameters.
+
+        :return: a tuple of the username of the record and its date before the update
+        """
         record = self.session.query(JoggingInfo).filter(JoggingInfo.rid == params['rid']).one()
+        old_date = record.date
+        self.subtract_from_weekly_summary(self.summarise(record))
         for k, v in params.items():
             if k not in ['rid', 'username']:
                 setattr(record, k, v)
+        self.add_to_weekly_summary([self.summarise(record)])
+        self.bump_data_versions([record.username])
 
         self.session.commit()
+        return record.username, old_date
 
     def get_a_record_by_id(self, rid):
         return self.session.query(JoggingInfo).filter(JoggingInfo.rid == rid).one()
 
-    def get_all_records(self, filter_dict):
+    def get_all_records(self, filter_dict, page=None, page_size=None, fields=None):
         """Given a filter dict, return filtered records.
-        
+
         :param filter_dict: a dict of filters
+        :param page: page number, all records are returned if it is None
+        :param page_size: the number of items in each page
+        :param fields: a list of field names to return, or None for all fields
+
         :return: a list of record dicts
         """
-        records = apply_filters(self.session.query(JoggingInfo), filter_dict)
-        return [r.to_dict() for r in records]
+        page_params = get_page_params(page, page_size)
+        query, params = get_statement(
+            JoggingInfo, filter_dict, select_page, tuple(fields or ()), ('rid', ), bool(page_params))
+        return to_dicts(self.session.execute(query, dict(params, **page_params)))
+
+    def count_all_records(self, filter_dict):
+        """Given a filter dict, return the number of filtered records.
+
+        :param filter_dict: a dict of filters
+        :return: an integer
+        """
+        query, params = get_statement(JoggingInfo, filter_dict, select_count)
+        return self.session.execute(query, params).scalar()
 
-    def get_records_of_a_user(self, username, filter_dict):
+    def get_records_of_a_user(self, username, filter_dict, page=None, page_size=None, fields=None):
         """Given a usename and a filter dict, return filtered records that belongs to the user.
 
         :param username: a username of a user
         :param filter_dict: a dict of filters
+        :param page: page number, all records are returned if it is None
+        :param page_size: the number of items in each page
+        :param fields: a list of field names to return, or None for all fields
+
+        :return: a list of record dicts
+        """
+        filter_dict = self.make_user_filter(username, filter_dict)
+        return self.get_all_records(filter_dict, page, page_size, fields)
+
+    def count_records_of_a_user(self, username, filter_dict):
+        """Given a usename and a filter dict, return the number of filtered records that belongs to the user.
+
+        :param username: a username of a user
+        :param filter_dict: a dict of filters
+
+        :return: an integer
+        """
+        filter_dict = self.make_user_filter(username, filter_dict)
+        return self.count_all_records(filter_dict)
+
+    def seek_records(self, filter_dict, after, page_size, username=None, fields=None):
+        """Given a filter dict, return filtered records ordered by (date, rid) that come after a sort key.
+
+        :param filter_dict: a dict of filters
+        :param after: the (date, rid) of the last-seen record, or None to start from the beginning
+        :param page_size: the maximum number of records to return
+        :param username: if provided, only return records that belong to this user
+        :param fields: a list of field names to return, or None for all fields
 
-        :return: a list of record objects
+        :return: a list of record dicts
         """
+        if username is not None:
+            filter_dict = self.make_user_filter(username, filter_dict)
+        sort_key = ('date', 'rid')
+        query, params = get_statement(
+            JoggingInfo, filter_dict, select_after, tuple(fields or ()), sort_key, after is not None, page_size is not None)
+        if after is not None:
+            params.update((f'after_{name}', value) for name, value in zip(sort_key, after))
+        if page_size is not None:
+            params['page_limit'] = page_size
+        return to_dicts(self.session.execute(query, params))
+
+    def iter_records(self, filter_dict, batch_size, username=None):
+        """Given a filter dict, lazily iterate over filtered records ordered by rid.
+
+        Rows are fetched from the cursor `batch_size` at a time, so memory does not grow
+        with the number of records.
+
+        :param filter_dict: a dict of filters
+        :param batch_size: the number of rows fetched at a time
+        :param username: if provided, only return records that belong to this user
+
+        :return: an iterator of record dicts
+        """
+        if username is not None:
+            filter_dict = self.make_user_filter(username, filter_dict)
+        query, params = get_statement(JoggingInfo, filter_dict, select_page, (), ('rid', ), False)
+        return iter_dicts(self.session.execute(query, params).yield_per(batch_size))
+
+    def sum_records_of_a_user(self, username, start_date, end_date):
+        """Given a username and a date range, add up the records of the user in one aggregate query.
+
+        :param username: a username of a user
+        :param start_date: the first date of the range
+        :param end_date: the last date of the range, inclusive
+
+        :return: a tuple of total distance, total time and the number of records
+        """
+        query = select(
+            func.coalesce(func.sum(JoggingInfo.distance), 0),
+            func.coalesce(func.sum(JoggingInfo.time), 0),
+            func.count(),
+        ).where(
+            JoggingInfo.username == username,
+            JoggingInfo.date.between(start_date, end_date),
+        )
+        return tuple(self.session.execute(query).one())
+
+    def set_weathers(self, updates, replaceable):
+        """Save looked up weather of some records in one executemany.
+
+        :param updates: a list of dicts of rid and weather
+        :param replaceable: the weathers that may be overwritten, so a weather set by a user in the meantime is kept
+        :return: a set of the usernames of the records
+        """
+        usernames = set()
+        if updates:
+            query = select(JoggingInfo.username).where(JoggingInfo.rid.in_([u['rid'] for u in updates])).distinct()
+            usernames = set(self.session.execute(query).scalars())
+            stmt = update(JoggingInfo.__table__).where(
+                JoggingInfo.rid == bindparam('b_rid'),
+                JoggingInfo.weather.in_(replaceable),
+            ).values(weather=bindparam('b_weather'))
+            self.session.execute(stmt, [{'b_rid': u['rid'], 'b_weather': u['weather']} for u in updates])
+            self.bump_data_versions(usernames)
+        self.session.commit()
+        return usernames
+
+    def get_records_by_weather(self, weathers):
+        """Given some weathers, return the records with one of them.
+
+        :return: a list of dicts of rid, date, lat and lon
+        """
+        query = select(JoggingInfo.rid, JoggingInfo.date, JoggingInfo.lat, JoggingInfo.lon)
+        query = query.where(JoggingInfo.weather.in_(weathers)).order_by(JoggingInfo.rid)
+        return to_dicts(self.session.execute(query))
+
+    def get_leaderboard(self, metric, start_date=None, end_date=None, limit=None):
+        """Rank users by a metric of their records in a date range, in one grouped query.
+
+        Users with the same value share a rank, as with SQL RANK().
+
+        :param metric: a key of LEADERBOARD_METRICS
+        :param start_date: the first date of the range, or None for no lower bound
+        :param end_date: the last date of the range inclusive, or None for no upper bound
+        :param limit: the maximum number of users to return, or None for all of them
+
+        :return: a list of dicts of rank, username and value, best first
+        """
+        value = LEADERBOARD_METRICS[metric].label('value')
+        rank = func.rank().over(order_by=value.desc()).label('rank')
+        query = select(rank, JoggingInfo.username, value).where(*self.make_date_range(start_date, end_date))
+        query = query.group_by(JoggingInfo.username).order_by(value.desc(), JoggingInfo.username).limit(limit)
+        return to_dicts(self.session.execute(query))
+
+    def sum_records(self, start_date=None, end_date=None):
+        """Add up all records in a date range in one aggregate query.
+
+        :param start_date: the first date of the range, or None for no lower bound
+        :param end_date: the last date of the range inclusive, or None for no upper bound
+
+        :return: a tuple of total distance, total time, the number of records and the number of users
+        """
+        query = select(
+            func.coalesce(func.sum(JoggingInfo.distance), 0),
+            func.coalesce(func.sum(JoggingInfo.time), 0),
+            func.count(),
+            func.count(JoggingInfo.username.distinct()),
+        ).where(*self.make_date_range(start_date, end_date))
+        return tuple(self.session.execute(query).one())
+
+    @staticmethod
+    def make_date_range(start_date=None, end_date=None):
+        """Return the conditions that restrict records to a date range, either end of which may be open."""
+        conditions = []
+        if start_date is not None:
+            conditions.append(JoggingInfo.date >= start_date)
+        if end_date is not None:
+            conditions.append(JoggingInfo.date <= end_date)
+        return conditions
+
+    @staticmethod
+    def summarise(record):
+        """Given a record, return a weekly summary row that counts it once."""
+        iso_year, iso_week, _ = record.date.isocalendar()
+        # Distance and time are optional, and count as 0 as they do in a SQL sum
+        return {'username': record.username, 'iso_year': iso_year, 'iso_week': iso_week,
+                'total_distance': record.distance or 0, 'total_time': record.time or 0, 'run_count': 1}
+
+    @staticmethod
+    def summarise_many(params_list):
+        """Given a list of dicts of record parameters, return weekly summary rows that add them up."""
+        totals = defaultdict(lambda: [0, 0, 0])
+        for params in params_list:
+            iso_year, iso_week, _ = params['date'].isocalendar()
+            total = totals[params['username'], iso_year, iso_week]
+            total[0] += params['distance'] or 0
+            total[1] += params['time'] or 0
+            total[2] += 1
+
+        return [
+            {'username': username, 'iso_year': iso_year, 'iso_week': iso_week,
+             'total_distance': distance, 'total_time': time, 'run_count': count}
+            for (username, iso_year, iso_week), (distance, time, count) in totals.items()
+        ]
+
+    def get_data_version(self, scope):
+        """Given a username, or ALL_RECORDS, return how many times its records have changed
+        """
+        query = select(DataVersion.version).where(DataVersion.scope == scope)
+        return self.session.execute(query).scalar() or 0
+
+    def bump_data_versions(self, usernames):
+        """Count a change to the records of some users, and so to ALL_RECORDS.
+
+        Runs in the caller's transaction, so the versions are committed together with the records.
+        """
+        stmt = insert(DataVersion.__table__)
+        stmt = stmt.on_conflict_do_update(index_elements=['scope'], set_={'version': DataVersion.version + 1})
+        self.session.execute(stmt, [{'scope': scope, 'version': 1} for scope in {ALL_RECORDS, *usernames}])
+
+    def add_to_weekly_summary(self, rows):
+        """Add weekly summary rows onto the stored totals, creating the weeks that are not there yet.
+
+        Runs in the caller's transaction, so the summary is committed together with the records.
+        """
+        if not rows:
+            return
+
+        stmt = insert(WeeklySummary.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['username', 'iso_year', 'iso_week'],
+            set_={
+                'total_distance': WeeklySummary.total_distance + stmt.excluded.total_distance,
+                'total_time': WeeklySummary.total_time + stmt.excluded.total_time,
+                'run_count': WeeklySummary.run_count + stmt.excluded.run_count,
+            },
+        )
+        self.session.execute(stmt, rows)
+
+    def subtract_from_weekly_summary(self, row):
+        """Take a weekly summary row off the stored totals, dropping the week once it has no runs left."""
+        key = (WeeklySummary.username == row['username'], WeeklySummary.iso_year == row['iso_year'],
+               WeeklySummary.iso_week == row['iso_week'])
+        self.session.query(WeeklySummary).filter(*key).update({
+            'total_distance': WeeklySummary.total_distance - row['total_distance'],
+            'total_time': WeeklySummary.total_time - row['total_time'],
+            'run_count': WeeklySummary.run_count - row['run_count'],
+        }, synchronize_session=False)
+        self.session.execute(delete(WeeklySummary).where(*key, WeeklySummary.run_count <= 0))
+
+    def get_weekly_summary(self, username, iso_year, iso_week):
+        """Given a username and an ISO week, look up the totals of the user in that week by primary key.
+
+        :return: a tuple of total distance, total time and the number of records
+        """
+        summary = self.session.get(WeeklySummary, (username, iso_year, iso_week))
+        if summary is None:
+            return 0, 0, 0
+
+        return summary.total_distance, summary.total_time, summary.run_count
+
+    def get_weekly_summaries(self, username, first_week, last_week):
+        """Given a username and a range of ISO weeks, return the totals of the user in each week that has runs.
+
+        :param username: a username of a user
+        :param first_week: an (ISO year, ISO week) tuple of the first week
+        :param last_week: an (ISO year, ISO week) tuple of the last week, inclusive
+
+        :return: a dict of (ISO year, ISO week) to a tuple of total distance, total time and the number of records
+        """
+        query = select(
+            WeeklySummary.iso_year, WeeklySummary.iso_week,
+            WeeklySummary.total_distance, WeeklySummary.total_time, WeeklySummary.run_count,
+        ).where(
+            WeeklySummary.username == username,
+            tuple_(WeeklySummary.iso_year, WeeklySummary.iso_week).between(tuple_(*first_week), tuple_(*last_week)),
+        )
+        return {(iso_year, iso_week): totals for iso_year, iso_week, *totals in self.session.execute(query)}
+
+    def sum_records_of_a_user_by_month(self, username, start_date, end_date):
+        """Given a username and a date range, add up the records of the user in each month in one grouped query.
+
+        :param username: a username of a user
+        :param start_date: the first date of the range
+        :param end_date: the last date of the range, inclusive
+
+        :return: a dict of 'YYYY-MM' to a tuple of total distance, total time and the number of records
+        """
+        month = func.strftime('%Y-%m', JoggingInfo.date)
+        query = select(
+            month,
+            func.coalesce(func.sum(JoggingInfo.distance), 0),
+            func.coalesce(func.sum(JoggingInfo.time), 0),
+            func.count(),
+        ).where(
+            JoggingInfo.username == username,
+            JoggingInfo.date.between(start_date, end_date),
+        ).group_by(month)
+        return {month: tuple(totals) for month, *totals in self.session.execute(query)}
+
+    def rebuild_weekly_summary(self, batch_size):
+        """Recompute the weekly summary from all records, e.g. for a database created before it existed.
+
+        :param batch_size: the number of records read at a time
+        :return: the number of weeks in the summary
+        """
+        query = select(JoggingInfo.username, JoggingInfo.date, JoggingInfo.distance, JoggingInfo.time)
+        rows = self.summarise_many(self.session.execute(query).yield_per(batch_size).mappings())
+
+        self.session.query(WeeklySummary).delete()
+        if rows:
+            self.session.execute(WeeklySummary.__table__.insert(), rows)
+        self.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def make_user_filter(username, filter_dict):
+        """Restrict a filter dict to the records of a user."""
         if filter_dict:
-            filter_dict = {
+            return {
                 'and': [
                     {'field': 'username', 'op': '==', 'value': username},
                     filter_dict,
                 ]
             }
-        else:
-            filter_dict = {'field': 'username', 'op': '==', 'value': username}
 
-        records = apply_filters(self.session.query(JoggingInfo), filter_dict)
-        return [r.to_dict() for r in records]
+        return {'field': 'username', 'op': '==', 'value': username}
@@ -1,9 +1,13 @@
-from sqlalchemy import Column, String, Integer, Float, Date, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, Date, ForeignKey, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 
 
 Base = declarative_base()
 
+# Logged-out users share the empty token, so the token index only covers real tokens.
+# SQLite only uses a partial index when the query repeats its WHERE clause verbatim.
+HAS_TOKEN = text("token != ''")
+
 
 class UserInfo(Base):
     __tablename__ = 'user_info'
@@ -16,18 +20,18 @@ class UserInfo(Base):
     role = Column(String, default='user')
     token = Column(String, default='')
 
+    __table_args__ = (
+        Index('ix_user_info_token', 'token', unique=True, sqlite_where=HAS_TOKEN),
+    )
+
     def __repr__(self):
         return f"<User('{self.username}')>"
 
+    # Fields returned to clients, which can also be selected with `fields`. The password is never returned.
+    FIELDS = ('username', 'forename', 'surname', 'email', 'role', 'token')
+
     def to_dict(self):
-        return {
-            'username': self.username,
-            'forename': self.forename,
-            'surname': self.surname,
-            'email': self.email,
-            'role': self.role,
-            'token': self.token,
-        }
+        return {field: getattr(self, field) for field in self.FIELDS}
 
 
 class JoggingInfo(Base):
@@ -42,17 +46,45 @@ class JoggingInfo(Base):
     time = Column(Integer)  # minute
     weather = Column(String)
 
+    __table_args__ = (
+        Index('ix_jogging_info_username_date', 'username', 'date'),
+    )
+
     def __repr__(self):
         return f"<JoggingInfo(username='{self.username}', rid='{self.rid}'))>"
 
+    # Fields returned to clients, which can also be selected with `fields`
+    FIELDS = ('rid', 'username', 'date', 'lat', 'lon', 'distance', 'time', 'weather')
+
     def to_dict(self):
-        return {
-            'rid': self.rid,
-            'username': self.username,
-            'date': self.date,
-            'lat': self.lat,
-            'lon': self.lon,
-            'distance': self.distance,
-            'time': self.time,
-            'weather': self.weather,
-        }
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class WeeklySummary(Base):
+    """Totals of the records of a user in an ISO week, kept up to date as records change."""
+    __tablename__ = 'weekly_summary'
+
+    username = Column(String, primary_key=True)
+    iso_year = Column(Integer, primary_key=True)
+    iso_week = Column(Integer, primary_key=True)
+    total_distance = Column(Integer, nullable=False, default=0)  # meter
+    total_time = Column(Integer, nullable=False, default=0)  # minute
+    run_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<WeeklySummary(username='{self.username}', week='{self.iso_year}-W{self.iso_week:02}')>"
+
+
+class DataVersion(Base):
+    """A counter of the changes to the records of a user, or of every user, used to make ETags.
+
+    Versions are only ever incremented, in the transaction that changes the records, so all
+    processes sharing the database agree on them and a version is never handed out twice.
+    """
+    __tablename__ = 'data_version'
+
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DataVersion(scope='{self.scope}', version={self.version})>"
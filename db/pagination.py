@@ -0,0 +1,62 @@
+import json
+import base64
+import datetime
+from sqlalchemy import tuple_
+
+
+def paginate(query, page=None, page_size=None):
+    """Limit a query to one page of results.
+
+    :param query: a :class:`sqlalchemy.orm.Query` instance or a Core select
+    :param page: page number, starting from 1. No paging if it is None
+    :param page_size: the number of items in each page. No paging if it is None
+
+    :return: the query with LIMIT/OFFSET applied
+    """
+    if page is None or page_size is None:
+        return query
+
+    return query.limit(page_size).offset((page - 1) * page_size)
+
+
+def seek(query, columns, after=None, page_size=None):
+    """Keyset pagination: order a query by `columns` and skip everything up to and including `after`.
+
+    Unlike LIMIT/OFFSET, the database seeks straight to the last-seen key,
+    so a deep page costs the same as the first one.
+
+    :param query: a :class:`sqlalchemy.orm.Query` instance or a Core select
+    :param columns: a list of columns that uniquely orders the rows, e.g. [JoggingInfo.date, JoggingInfo.rid]
+    :param after: a tuple of values of `columns` of the last-seen row, or of bound parameters for them.
+        Start from the beginning if it is None
+    :param page_size: the number of items in each page, or a bound parameter for it. No limit if it is None
+
+    :return: the ordered, limited query
+    """
+    if after is not None:
+        query = query.filter(tuple_(*columns) > tuple_(*after))
+
+    query = query.order_by(*columns)
+    if page_size is not None:
+        query = query.limit(page_size)
+
+    return query
+
+
+def encode_cursor(date, rid):
+    """Given the sort key of a record, return an opaque cursor string
+    """
+    payload = json.dumps([date.isoformat(), rid]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor):
+    """Given a cursor string made by `encode_cursor`, return the (date, rid) sort key
+
+    :raise ValueError: if the cursor is malformed
+    """
+    try:
+        date, rid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.strptime(date, '%Y-%m-%d').date(), int(rid)
+    except Exception as e:
+        raise ValueError(f'Invalid cursor {cursor}: {e}')
@@ -0,0 +1,38 @@
+from sqlalchemy import select, func
+from filtering.models import get_projection
+
+
+def select_fields(model, fields=None):
+    """Build a Core select of some fields of a model.
+
+    Rows come back as plain tuples, so no ORM instances are built or tracked in the identity map.
+
+    :param model: a model class with a `FIELDS` attribute
+    :param fields: a list of field names, or None for all the fields in `model.FIELDS`
+
+    :return: a :class:`sqlalchemy.sql.Select` instance
+    """
+    fields = fields or model.FIELDS
+    # Validate the names against the model, but select the table columns to stay out of the ORM
+    get_projection(model, fields)
+    columns = model.__table__.c
+    return select(*[columns[field] for field in fields])
+
+
+def select_count(model):
+    """Build a Core select that counts the rows of a model's table.
+    """
+    return select(func.count()).select_from(model.__table__)
+
+
+def to_dicts(result):
+    """Given the result of executing a select made by `select_fields`, return a list of dicts
+    """
+    return list(iter_dicts(result))
+
+
+def iter_dicts(result):
+    """Given the result of executing a select made by `select_fields`, lazily yield dicts
+    """
+    keys = tuple(result.keys())
+    return (dict(zip(keys, row)) for row in result)
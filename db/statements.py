@@ -0,0 +1,115 @@
+import threading
+from functools import lru_cache
+from sqlalchemy import bindparam, event, Integer
+from sqlalchemy.engine import default
+from db.pagination import seek
+from db.projection import select_fields
+from filtering.filters import split_filters, bind_filters, apply_filters, is_hashable
+
+
+# The number of statements kept, one for each way of building a statement and filter shape
+STATEMENT_CACHE_SIZE = 256
+
+PAGE_LIMIT = bindparam('page_limit', type_=Integer())
+PAGE_OFFSET = bindparam('page_offset', type_=Integer())
+
+
+def get_statement(model, filter_dict, build, *args):
+    """Return the Core statement `build(model, *args)` with filters applied, and the values of
+    the filters to execute it with.
+
+    Statements are cached by how they are built and the shape of their filters, with values
+    left as bound parameters. A repeated shape skips building the statement, and SQLAlchemy
+    finds its compiled SQL without working out its cache key again.
+
+    :param model: the model the filtered fields belong to
+    :param filter_dict: a dict of filters
+    :param build: a module level function that makes the statement without filters
+    :param args: hashable arguments of `build`, e.g. tuples rather than lists
+
+    :return: a tuple of the statement and a dict of parameters
+    """
+    shape, values = split_filters(filter_dict, model)
+    if not is_hashable(shape):
+        # e.g. a malformed filter, built without the cache to report the error
+        return apply_filters(build(model, *args), filter_dict, model), {}
+
+    return make_statement(build, args, model, shape), values
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def make_statement(build, args, model, shape):
+    return bind_filters(build(model, *args), model, shape)
+
+
+def get_statement_cache_stats():
+    """Return counters of the statement cache for monitoring"""
+    info = make_statement.cache_info()
+    return {'size': info.currsize, 'maxsize': info.maxsize, 'hits': info.hits, 'misses': info.misses}
+
+
+def select_page(model, fields, order_by, paged):
+    """Build a select of some fields ordered by some columns, with its page left as bound parameters
+
+    :param fields: a tuple of field names, empty for all the fields
+    :param order_by: a tuple of column names
+    :param paged: whether to limit the select to a page, see `get_page_params`
+    """
+    columns = model.__table__.c
+    query = select_fields(model, fields).order_by(*[columns[name] for name in order_by])
+    if paged:
+        query = query.limit(PAGE_LIMIT).offset(PAGE_OFFSET)
+    return query
+
+
+def get_page_params(page, page_size):
+    """Return the parameters of a select made by `select_page` for one page, or an empty dict
+    if page or page_size is None
+    """
+    if page is None or page_size is None:
+        return {}
+
+    return {'page_limit': page_size, 'page_offset': (page - 1) * page_size}
+
+
+def select_after(model, fields, sort_key, after, limited):
+    """Build a select of some fields that seeks past a sort key, see `db.pagination.seek`.
+
+    :param fields: a tuple of field names, empty for all the fields
+    :param sort_key: a tuple of the names of the columns that uniquely order the rows
+    :param after: whether to skip rows up to a sort key, given as parameters `after_<column name>`
+    :param limited: whether to limit the number of rows to the parameter `page_limit`
+    """
+    columns = [model.__table__.c[name] for name in sort_key]
+    after = [bindparam(f'after_{column.key}', type_=column.type) for column in columns] if after else None
+    return seek(select_fields(model, fields), columns, after, PAGE_LIMIT if limited else None)
+
+
+class CompileCacheCounter:
+    """Count how often SQLAlchemy finds the compiled SQL of an executed statement in its cache"""
+
+    def __init__(self, engine):
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'after_cursor_execute', self.count)
+
+    def count(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            if context.cache_hit is default.CACHE_HIT:
+                self.hits += 1
+            elif context.cache_hit is default.CACHE_MISS:
+                self.misses += 1
+            else:
+                # e.g. DDL, or SQL text run with exec_driver_sql
+                self.uncached += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'uncached': self.uncached,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
@@ -1,7 +1,9 @@
 import uuid
 import hashlib
-from db.models import UserInfo
-from filtering.filters import apply_filters
+from sqlalchemy import select, exc, or_, and_
+from db.models import UserInfo, HAS_TOKEN
+from db.projection import select_count, to_dicts
+from db.statements import get_statement, get_page_params, select_page
 
 
 class UserTable:
@@ -25,6 +27,58 @@ class UserTable:
         self.session.add(UserInfo(**params))
         self.session.commit()
 
+    def create_users(self, params_list, chunk_size, attempts=3):
+        """Insert many users in chunks of executemany within one transaction.
+
+        Users whose username or token is taken, by a stored user or an earlier one in the list,
+        are found up front and skipped, so the others are inserted together and any error
+        rolls back all of them. If another process takes a user in the meantime, the taken
+        users are looked up again and the insert is retried.
+
+        :param params_list: a list of dicts of user parameters, all with the same keys
+        :param chunk_size: the number of users in each executemany, and in each lookup of taken ones
+        :param attempts: the number of times to try the insert
+        :return: the set of indexes in params_list that were not created because they are duplicates
+        """
+        insert = UserInfo.__table__.insert()
+        for attempt in range(attempts):
+            duplicates = self.find_duplicates(params_list, chunk_size)
+            new = [params for index, params in enumerate(params_list) if index not in duplicates]
+            try:
+                for start in range(0, len(new), chunk_size):
+                    self.session.execute(insert, new[start:start + chunk_size])
+                self.session.commit()
+                return duplicates
+            except exc.IntegrityError:
+                # A user taken by another process after the lookup
+                self.session.rollback()
+                if attempt == attempts - 1:
+                    raise
+
+    def find_duplicates(self, params_list, chunk_size):
+        """Return the set of indexes in params_list of the users whose username or token is taken,
+        by a stored user or an earlier one in the list
+        """
+        usernames, tokens = set(), set()
+        for start in range(0, len(params_list), chunk_size):
+            chunk = params_list[start:start + chunk_size]
+            query = select(UserInfo.username, UserInfo.token).where(or_(
+                UserInfo.username.in_([params['username'] for params in chunk]),
+                and_(UserInfo.token.in_([params['token'] for params in chunk if params['token']]), HAS_TOKEN),
+            ))
+            for username, token in self.session.execute(query):
+                usernames.add(username)
+                tokens.add(token)
+
+        duplicates = set()
+        for index, params in enumerate(params_list):
+            if params['username'] in usernames or (params['token'] and params['token'] in tokens):
+                duplicates.add(index)
+            else:
+                usernames.add(params['username'])
+                tokens.add(params['token'])
+        return duplicates
+
     def delete_a_user(self, user):
         """Given a user object, delete it from user table
         :param user: user object
@@ -50,7 +104,7 @@ class UserTable:
         self.session.commit()
 
     def get_a_user_by_token(self, token):
-        return self.session.query(UserInfo).filter(UserInfo.token == token).one()
+        return self.session.query(UserInfo).filter(UserInfo.token == token, HAS_TOKEN).one()
 
     def get_a_user_by_un_and_pw(self, username, password):
         return self.session.query(UserInfo).filter(UserInfo.username == username, UserInfo.password == password).one()
@@ -58,5 +112,17 @@ class UserTable:
     def get_a_user_by_username(self, username):
         return self.session.query(UserInfo).filter(UserInfo.username == username).one()
 
-    def get_all_users(self, filters):
-        return apply_filters(self.session.query(UserInfo), filters)
+    def get_existing_usernames(self, usernames):
+        """Given some usernames, return the set of those that exist in user table
+        """
+        query = self.session.query(UserInfo.username).filter(UserInfo.username.in_(list(usernames)))
+        return {username for username, in query}
+
+    def get_all_users(self, filters, page=None, page_size=None, fields=None):
+        page_params = get_page_params(page, page_size)
+        query, params = get_statement(UserInfo, filters, select_page, tuple(fields or ()), (), bool(page_params))
+        return to_dicts(self.session.execute(query, dict(params, **page_params)))
+
+    def count_all_users(self, filters):
+        query, params = get_statement(UserInfo, filters, select_count)
+        return self.session.execute(query, params).scalar()
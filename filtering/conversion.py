@@ -1,71 +1,259 @@
+import re
 import datetime
+import itertools
+from functools import lru_cache
+from filtering.filters import BadFilterFormat
+from filtering.models import get_projection
 
 
-def make_lv1_filters(filter_str):
-    if filter_str.startswith('(') and filter_str.endswith(')'):
-        filter_str = filter_str[1:-1]
-    field, op, value = [x for x in filter_str.split(' ') if x]
+# The number of distinct filter strings whose filter dicts are kept
+FILTER_STR_CACHE_SIZE = 256
 
-    value = eval(value)
-    if isinstance(value, str):
+# The deepest nesting of parentheses and `not` allowed in a filter string
+MAX_FILTER_DEPTH = 100
+
+# One alternation tried in the order tokens are most common in filter strings. Anything else
+# is matched as a single character token, which no rule of the parser accepts.
+TOKEN_RE = re.compile(r"""
+    \s*(
+        [A-Za-z_]\w*                                  # fields, keywords and constants
+      | ==|!=|>=|<=|>|<                                # operators
+      | [()\[\],]                                      # punctuation
+      | '(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"            # strings
+      | \d{4}-\d{2}-\d{2}(?![\w.])                     # dates
+      | -?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?      # numbers
+      | \S
+    )
+""", re.VERBOSE)
+
+ESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+# The first characters of the kinds of tokens
+NAME_START = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_')
+NUMBER_START = frozenset('0123456789-.')
+QUOTES = frozenset('\'"')
+
+OPERATORS = {'==', '!=', '>=', '<=', '>', '<'}
+
+
+def spellings(keyword):
+    """Return every way to write a keyword in upper and lower case, so tokens are looked up without lowering them"""
+    return {''.join(letters) for letters in itertools.product(*({c.lower(), c.upper()} for c in keyword))}
+
+
+AND, OR, NOT, IN = spellings('and'), spellings('or'), spellings('not'), spellings('in')
+
+# Operators spelt as words, the symbols are taken as they are
+WORD_OPERATORS = {'eq', 'ne', 'gt', 'lt', 'ge', 'le', 'in', 'not_in'}
+
+CONSTANTS = {'None': None, 'null': None, 'True': True, 'true': True, 'False': False, 'false': False}
+
+
+def parse_date(value):
+    """Return the date of a string in the format of YYYY-MM-DD, or the string if it is not a date"""
+    if len(value) == 10 and DATE_RE.fullmatch(value):
         try:
-            value = datetime.datetime.strptime(value, '%Y-%m-%d').date()
-        except Exception:
+            return datetime.date(int(value[:4]), int(value[5:7]), int(value[8:]))
+        except ValueError:
             pass
-    return {
-        'field': field,
-        'op': op,
-        'value': value,
-    }
+    return value
+
+
+def tokenize(filter_str):
+    """Split a filter string into the texts of its tokens in one pass, followed by an empty string for the end
+
+    Values are converted by the parser, where one is expected.
+    """
+    tokens = TOKEN_RE.findall(filter_str)
+    tokens.append('')
+    return tokens
+
+
+class FilterParser:
+    """A recursive descent parser of filter strings, with `and` binding tighter than `or`:
+
+        expression := conjunction ('or' conjunction)*
+        conjunction := negation ('and' negation)*
+        negation := 'not' negation | '(' expression ')' | comparison
+        comparison := field operator value
+        value := scalar | '[' scalar, ... ']' | '(' scalar, ... ')'
+        scalar := string | number | date | None | True | False
+    """
+
+    def __init__(self, filter_str):
+        self.filter_str = filter_str
+        self.tokens = tokenize(filter_str)
+        self.index = 0
+        self.depth = 0
+
+    def parse(self):
+        filters = self.parse_expression()
+        self.expect('')
+        return filters
+
+    def accept(self, text):
+        if self.tokens[self.index] == text:
+            self.index += 1
+            return True
+        return False
+
+    def accept_keyword(self, keyword):
+        if self.tokens[self.index] in keyword:
+            self.index += 1
+            return True
+        return False
 
+    def expect(self, text):
+        if not self.accept(text):
+            raise self.error(f'`{text}`' if text else 'the end')
 
-def make_lv2_filters(filter_list):
-    if isinstance(filter_list, list):
-        return {
-            filter_list[1].lower(): [
-                make_lv2_filters(filter_list[0]),
-                make_lv2_filters(filter_list[2])
-            ]
-        }
-    else:
-        return make_lv1_filters(filter_list)
+    def error(self, expected):
+        """Return the error of finding something else than expected at the current token.
+        Tokens are located only here, as they are kept without their positions.
+        """
+        token = self.tokens[self.index]
+        found = f'`{token}`' if token else 'the end'
+        if token:
+            position = [m.start(1) for m in TOKEN_RE.finditer(self.filter_str)][self.index]
+        else:
+            position = len(self.filter_str)
+        return BadFilterFormat(f'Expected {expected} but found {found} at position {position}')
+
+    def parse_expression(self):
+        operands = [self.parse_conjunction()]
+        while self.accept_keyword(OR):
+            operands.append(self.parse_conjunction())
+        return operands[0] if len(operands) == 1 else {'or': operands}
+
+    def parse_conjunction(self):
+        operands = [self.parse_negation()]
+        while self.accept_keyword(AND):
+            operands.append(self.parse_negation())
+        return operands[0] if len(operands) == 1 else {'and': operands}
+
+    def parse_negation(self):
+        # Each `not` nests the filters one level deeper, like a parenthesis
+        token = self.tokens[self.index]
+        if token != '(' and token not in NOT:
+            return self.parse_comparison()
+
+        negations = 0
+        while self.accept_keyword(NOT):
+            negations += 1
+            self.enter()
+
+        if self.accept('('):
+            self.enter()
+            filters = self.parse_expression()
+            self.expect(')')
+            self.depth -= 1
+        else:
+            filters = self.parse_comparison()
+
+        self.depth -= negations
+        for _ in range(negations):
+            filters = {'not': [filters]}
+        return filters
+
+    def enter(self):
+        self.depth += 1
+        if self.depth > MAX_FILTER_DEPTH:
+            raise BadFilterFormat(f'Filters can not be nested more than {MAX_FILTER_DEPTH} levels deep')
+
+    def parse_comparison(self):
+        tokens = self.tokens
+        field = tokens[self.index]
+        if field[:1] not in NAME_START:
+            raise self.error('a field')
+        self.index += 1
+
+        op = tokens[self.index]
+        if op not in OPERATORS:
+            if op in NOT and tokens[self.index + 1] in IN:
+                op = 'not_in'
+                self.index += 1
+            elif op.lower() in WORD_OPERATORS:
+                op = op.lower()
+            else:
+                raise self.error(f'an operator after `{field}`')
+        self.index += 1
+
+        token = tokens[self.index]
+        if token == '(' or token == '[':
+            value = self.parse_list()
+        else:
+            value = self.parse_scalar()
+        return {'field': field, 'op': op, 'value': value}
+
+    def parse_list(self):
+        closing = ')' if self.tokens[self.index] == '(' else ']'
+        self.index += 1
+        values = []
+        while not self.accept(closing):
+            values.append(self.parse_scalar())
+            if not self.accept(','):
+                self.expect(closing)
+                break
+        return values
+
+    def parse_scalar(self):
+        token = self.tokens[self.index]
+        first = token[:1]
+        if first in QUOTES and len(token) > 1:
+            value = token[1:-1]
+            if '\\' in value:
+                value = ESCAPE_RE.sub(r'\1', value)
+            value = parse_date(value)
+        elif first in NUMBER_START and token not in ('-', '.'):
+            if len(token) == 10 and DATE_RE.fullmatch(token):
+                value = parse_date(token)
+            elif token.lstrip('-').isdigit():
+                value = int(token)
+            else:
+                value = float(token)
+        elif token in CONSTANTS:
+            value = CONSTANTS[token]
+        else:
+            raise self.error('a value')
+
+        self.index += 1
+        return value
 
 
 def convert_str_to_filters(filter_str):
     """Given a filter string, return corresponding filter dict
 
+    The filter dicts of recent filter strings are cached. The same dict is returned for
+    the same filter, so do not modify it.
+
     :param filter_str: a string representation of filters, e.g. "(username == 'john') and ((distance > 2500) or (distance < 1000))"
     :return: a dict of filters
+    :raises BadFilterFormat: if the filter string can not be parsed
     """
     if filter_str is None:
         return {}
 
-    if '(' not in filter_str and ')' not in filter_str:
-        return make_lv1_filters(filter_str)
-
-    list1 = []
-    temp = ''
-    for x in filter_str:
-        if x == '(' and temp:
-            list1.append(temp.strip())
-            temp = ''
-        temp += x
-        if x == ')':
-            list1.append(temp.strip())
-            temp = ''
-    list2 = []
-    temp = []
-    flag = False
-    for x in list1:
-        if flag and x not in ['(', ')']:
-            temp.append(x)
-        elif x not in ['(', ')']:
-            list2.append(x)
-
-        if x == '(':
-            flag = True
-        elif x == ')':
-            flag = False
-            list2.append(temp)
-
-    return make_lv2_filters(list2)
+    return parse_filter_str(filter_str.strip())
+
+
+@lru_cache(maxsize=FILTER_STR_CACHE_SIZE)
+def parse_filter_str(filter_str):
+    """Given a filter string, return corresponding filter dict
+    """
+    return FilterParser(filter_str).parse()
+
+
+def parse_fields(fields_str, model):
+    """Given a comma separated string of field names, return them as a list after validation
+
+    :param fields_str: a string of field names, e.g. "date,distance,time"
+    :param model: the model the fields belong to
+    :return: a list of field names in the order first given, or None if no fields are given
+    """
+    if not fields_str:
+        return None
+
+    fields = list(dict.fromkeys(f.strip() for f in fields_str.split(',') if f.strip()))
+    get_projection(model, fields)
+    return fields or None
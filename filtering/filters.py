@@ -1,11 +1,15 @@
+import datetime
 from collections import namedtuple
 from collections.abc import Iterable
+from functools import lru_cache
 from inspect import signature
 from itertools import chain
 
-from sqlalchemy import and_, or_, not_
+from sqlalchemy import and_, or_, not_, false, bindparam
+from sqlalchemy.types import Integer, Float, String, Boolean, Date, DateTime
 
 from filtering.models import Field, get_query_model
+from filtering.optimizer import optimize, CONTRADICTION
 
 
 BooleanFunction = namedtuple(
@@ -39,7 +43,9 @@ class Operator:
         'le': lambda f, a: f <= a,
         'in': lambda f, a: f.in_(a),
         'not_in': lambda f, a: ~f.in_(a),
+        'between': lambda f, a: f.between(*a),
     }
+    ARITIES = {operator: len(signature(function).parameters) for operator, function in OPERATORS.items()}
 
     def __init__(self, operator=None):
         if operator not in self.OPERATORS:
@@ -47,7 +53,7 @@ class Operator:
 
         self.operator = operator
         self.function = self.OPERATORS[operator]
-        self.arity = len(signature(self.function).parameters)
+        self.arity = self.ARITIES[operator]
 
 
 class Filter:
@@ -78,7 +84,7 @@ class Filter:
         operator = self.operator
         value = self.value
 
-        model = get_query_model(query)
+        model = get_query_model(query) if query is not None else default_model
 
         function = operator.function
         arity = operator.arity
@@ -93,6 +99,23 @@ class Filter:
         if arity == 2:
             return function(sqlalchemy_field, value)
 
+    def compile(self, model):
+        """Return a function that builds the SQLAlchemy expression of this filter from the
+        values of a filter shape, see `compile_filters`.
+        """
+        function = self.operator.function
+        sqlalchemy_field = Field(model, self.filter_dict['field']).get_sqlalchemy_field()
+        value = self.value
+
+        if isinstance(value, Placeholder):
+            return lambda values: function(sqlalchemy_field, values[value.name])
+
+        if isinstance(value, list) and value and all(isinstance(item, Placeholder) for item in value):
+            return lambda values: function(sqlalchemy_field, [values[item.name] for item in value])
+
+        expression = self.format_for_sqlalchemy(None, model)
+        return lambda values: expression
+
 
 class BooleanFilter:
     def __init__(self, function, *filters):
@@ -111,6 +134,11 @@ class BooleanFilter:
             for filter in self.filters
         ])
 
+    def compile(self, model):
+        function = self.function
+        builders = [filter.compile(model) for filter in self.filters]
+        return lambda values: function(*[build(values) for build in builders])
+
 
 def is_iterable_filter(filter_dict):
     return isinstance(filter_dict, Iterable) and not isinstance(filter_dict, ((str, ), dict))
@@ -158,27 +186,187 @@ def build_filters(filter_dict):
     return [Filter(filter_dict)]
 
 
-def apply_filters(query, filter_dict):
+# The number of filter shapes whose SQLAlchemy expressions are kept for reuse
+COMPILED_FILTER_CACHE_SIZE = 256
+
+# Stands for the value of a filter in a filter shape, see `parameterize`
+# The type of the value, or of its first item for a list, is kept so that the shape can be
+# compiled into bound parameters of the right type, see `bind_filters`.
+Placeholder = namedtuple('Placeholder', ('name', 'type', 'expanding'))
+
+# The SQLAlchemy types of bound parameters by the type of their values, as SQLAlchemy picks
+# them for literal values compared with a column
+VALUE_TYPES = {
+    int: Integer,
+    float: Float,
+    str: String,
+    bool: Boolean,
+    datetime.date: Date,
+    datetime.datetime: DateTime,
+}
+
+
+class FrozenDict(tuple):
+    """The items of a filter dict in a filter shape, see `parameterize`"""
+
+
+def parameterize(filter_dict, values):
+    """Split a filter dict into its shape and its values.
+
+    The shape is a hashable copy of the filter dict where every value is replaced by a
+    Placeholder, so filters that only differ by their values have the same shape.
+
+    :param filter_dict: a filter dict as taken by `apply_filters`
+    :param values: a dict that the values are added to, keyed by placeholder name
+
+    :returns: the shape of the filter dict
+    """
+    if is_iterable_filter(filter_dict):
+        return tuple(parameterize(item, values) for item in filter_dict)
+
+    if isinstance(filter_dict, dict):
+        items = []
+        for key, value in filter_dict.items():
+            if key == 'value' and value is not None:
+                if filter_dict.get('op') == 'between' and is_iterable_filter(value):
+                    value = tuple(make_placeholder(item, values) for item in value)
+                else:
+                    value = make_placeholder(value, values)
+            elif is_iterable_filter(value):
+                value = parameterize(value, values)
+            items.append((key, value))
+        return FrozenDict(sorted(items))
+
+    return filter_dict
+
+
+def make_placeholder(value, values):
+    name = 'filter_{}'.format(len(values))
+    values[name] = value
+    expanding = is_iterable_filter(value)
+    sample = next(iter(value), None) if expanding else value
+    return Placeholder(name, type(sample), expanding)
+
+
+def iter_placeholders(shape):
+    if isinstance(shape, Placeholder):
+        yield shape
+    elif isinstance(shape, tuple):
+        for item in shape:
+            yield from iter_placeholders(item)
+
+
+def split_filters(filter_dict, model):
+    """Optimize a filter dict and split it into its shape and its values, see `parameterize`.
+
+    :returns: a tuple of the shape and a dict of values. The shape is None if there are no
+        filters, and False if no record can match them.
+    """
+    if not filter_dict:
+        return None, {}
+
+    filter_dict = optimize(filter_dict, model)
+    if filter_dict is CONTRADICTION:
+        return False, {}
+
+    values = {}
+    return parameterize(filter_dict, values), values
+
+
+def is_hashable(shape):
+    """Return whether a filter shape can be a cache key"""
+    try:
+        hash(shape)
+    except TypeError:
+        return False
+    return True
+
+
+def thaw(shape):
+    """Turn a filter shape back into a filter dict, with its placeholders left as values"""
+    if isinstance(shape, FrozenDict):
+        return {key: thaw(value) for key, value in shape}
+
+    if isinstance(shape, tuple) and not isinstance(shape, Placeholder):
+        return [thaw(item) for item in shape]
+
+    return shape
+
+
+def bind_filters(query, model, shape):
+    """Apply a filter shape to a Core statement, with the values left as bound parameters
+    named after the placeholders. Execute the statement with the values from `split_filters`.
+    """
+    if shape is None:
+        return query
+
+    if shape is False:
+        return query.filter(false())
+
+    binds = {}
+    for placeholder in iter_placeholders(shape):
+        type_ = VALUE_TYPES.get(placeholder.type)
+        binds[placeholder.name] = bindparam(
+            placeholder.name, type_=type_() if type_ else None, expanding=placeholder.expanding)
+
+    return query.filter(*[build(binds) for build in compile_filters(model, shape)])
+
+
+@lru_cache(maxsize=COMPILED_FILTER_CACHE_SIZE)
+def compile_filters(model, shape):
+    """Given a model and a filter shape, return a function for each filter that builds its
+    SQLAlchemy expression from a dict of values keyed by placeholder name.
+
+    Parsing, validating field names and resolving operators are done once per shape, and
+    each value is still compared as a literal, e.g. a date column with a string.
+    """
+    return tuple(filter.compile(model) for filter in build_filters(thaw(shape)))
+
+
+def get_compile_cache_stats():
+    """Return counters of the compiled filter cache for monitoring"""
+    info = compile_filters.cache_info()
+    return {'size': info.currsize, 'maxsize': info.maxsize, 'hits': info.hits, 'misses': info.misses}
+
+
+def apply_filters(query, filter_dict, model=None):
     """Apply filters to a SQLAlchemy query.
 
+    Filters are first rewritten by `optimize`, so that SQLite can use its indexes. They are
+    compiled once per shape, i.e. per filter dict with its values taken out, and only the
+    values are put into the compiled filters on every call.
+
     :param query:
-        A :class:`sqlalchemy.orm.Query` instance.
+        A :class:`sqlalchemy.orm.Query` instance, or a Core
+        :class:`sqlalchemy.sql.Select` statement.
 
     :param filter_dict:
         A dict or an iterable of dicts, where each one includes
         the necesary information to create a filter to be applied to the
         query.
 
+    :param model:
+        The model the filtered fields belong to. Taken from the query if
+        not provided, so it is required for Core statements.
+
     :returns:
-        The :class:`sqlalchemy.orm.Query` instance after all the filters
-        have been applied.
+        The query instance after all the filters have been applied.
     """
     if not filter_dict:
         return query
 
-    filters = build_filters(filter_dict)
-    model = get_query_model(query)
-    sqlalchemy_filters = [filter.format_for_sqlalchemy(query, model) for filter in filters]
+    if model is None:
+        model = get_query_model(query)
+
+    shape, values = split_filters(filter_dict, model)
+    if shape is False:
+        return query.filter(false())
+
+    if is_hashable(shape):
+        sqlalchemy_filters = [build(values) for build in compile_filters(model, shape)]
+    else:
+        # e.g. a malformed filter, compiled without the cache to report the error
+        sqlalchemy_filters = [filter.format_for_sqlalchemy(None, model) for filter in build_filters(filter_dict)]
     if sqlalchemy_filters:
         query = query.filter(*sqlalchemy_filters)
 
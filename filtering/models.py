@@ -1,3 +1,4 @@
+from functools import lru_cache
 from sqlalchemy.inspection import inspect
 from sqlalchemy.util import symbol
 
@@ -23,17 +24,55 @@ class Field:
         return sqlalchemy_field
 
     def get_valid_field_names(self):
-        inspect_mapper = inspect(self.model)
-        columns = inspect_mapper.columns
-        orm_descriptors = inspect_mapper.all_orm_descriptors
+        return get_valid_field_names(self.model)
 
-        column_names = columns.keys()
-        hybrid_names = [
-            key for key, item in orm_descriptors.items()
-            if is_hybrid_property(item) or is_hybrid_method(item)
-        ]
 
-        return set(column_names) | set(hybrid_names)
+@lru_cache(maxsize=None)
+def get_valid_field_names(model):
+    """Get the names of the columns and hybrid attributes of a model.
+
+    Mappers do not change once configured, so this is worked out once per model.
+
+    :returns:
+        A frozenset of field names.
+    """
+    inspect_mapper = inspect(model)
+    columns = inspect_mapper.columns
+    orm_descriptors = inspect_mapper.all_orm_descriptors
+
+    column_names = columns.keys()
+    hybrid_names = [
+        key for key, item in orm_descriptors.items()
+        if is_hybrid_property(item) or is_hybrid_method(item)
+    ]
+
+    return frozenset(column_names) | frozenset(hybrid_names)
+
+
+def get_projection(model, field_names):
+    """Given a model and some field names, return the columns to select.
+
+    :param model:
+        A model with a `FIELDS` attribute that lists the fields clients may see.
+
+    :param field_names:
+        A list of field names.
+
+    :returns:
+        A list of model columns.
+    """
+    columns = []
+    for field_name in field_names:
+        sqlalchemy_field = Field(model, field_name).get_sqlalchemy_field()
+        if field_name not in model.FIELDS:
+            raise FieldNotFound(
+                'Field `{}` of model {} can not be selected.'.format(
+                    field_name, model
+                )
+            )
+        columns.append(sqlalchemy_field)
+
+    return columns
 
 
 def is_hybrid_property(orm_descriptor):
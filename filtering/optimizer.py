@@ -0,0 +1,282 @@
+import datetime
+from functools import lru_cache
+from sqlalchemy import types
+from filtering.models import Field, FieldNotFound
+
+
+# Returned by `optimize` for filters that no record can match
+CONTRADICTION = {'or': []}
+
+ALIASES = {'eq': '==', 'ne': '!=', 'gt': '>', 'lt': '<', 'ge': '>=', 'le': '<='}
+
+# The operator a comparison takes when a `not` is pushed down through it. This holds with NULLs
+# too, since a comparison with NULL is neither true nor false either way.
+NEGATIONS = {
+    '==': '!=',
+    '!=': '==',
+    '>': '<=',
+    '<=': '>',
+    '<': '>=',
+    '>=': '<',
+    'in': 'not_in',
+    'not_in': 'in',
+}
+
+BOOLEAN_KEYS = {'and': 'or', 'or': 'and', 'not': 'not'}
+
+# The kind of the values a column type compares alike in Python and SQLite. SQLite converts a
+# value to the affinity of its column first, e.g. '9' to 9 for an INTEGER column, so the values
+# of other kinds are compared differently there.
+COLUMN_KINDS = (
+    (types.Boolean, bool),
+    (types.Integer, 'number'),
+    (types.Float, 'number'),
+    (types.String, str),
+    (types.DateTime, datetime.datetime),
+    (types.Date, datetime.date),
+)
+
+
+def optimize(filter_dict, model):
+    """Rewrite a filter dict into an equivalent one that SQLite can answer with its indexes.
+
+    - `not` is pushed down to the comparisons, e.g. not (date < x) becomes date >= x
+    - nested `and`/`or` are flattened
+    - equalities on the same field in an `or` are folded into one `in`
+    - comparisons on the same field in an `and` are merged, e.g. into one `between`
+
+    Anything that is not understood, such as a malformed filter, is left as it is for
+    `build_filters` to report.
+
+    :param filter_dict: a dict or a list of dicts of filters, as taken by `apply_filters`
+    :param model: the model the filtered fields belong to
+    :return: a filter dict, or CONTRADICTION if no record can match the filters
+    """
+    if is_list(filter_dict):
+        filter_dict = {'and': list(filter_dict)}
+
+    return rewrite(filter_dict, False, model)
+
+
+def is_list(value):
+    # Other iterables are left for `build_filters` to handle
+    return isinstance(value, (list, tuple))
+
+
+def is_comparison(node):
+    return (isinstance(node, dict) and 'field' in node and 'value' in node
+            and (node.get('op') in NEGATIONS or node.get('op') in ALIASES))
+
+
+def is_boolean(node):
+    if not isinstance(node, dict) or len(node) != 1:
+        return False
+
+    key, children = next(iter(node.items()))
+    return key in BOOLEAN_KEYS and is_list(children) and (key != 'not' or len(children) == 1)
+
+
+def rewrite(node, negate, model):
+    if is_comparison(node):
+        op = ALIASES.get(node['op'], node['op'])
+        return dict(node, op=NEGATIONS[op] if negate else op)
+
+    if is_boolean(node):
+        key, children = next(iter(node.items()))
+        if key == 'not':
+            return rewrite(children[0], not negate, model)
+
+        key = BOOLEAN_KEYS[key] if negate else key
+        return combine(key, [rewrite(child, negate, model) for child in children], model)
+
+    return {'not': [node]} if negate else node
+
+
+def combine(key, children, model):
+    """Given `and` or `or` and some rewritten filters, return the filters combined by it"""
+    flat = []
+    for child in children:
+        if child is not CONTRADICTION and is_boolean(child) and key in child:
+            flat.extend(child[key])
+        else:
+            flat.append(child)
+
+    if key == 'and':
+        if any(child is CONTRADICTION for child in flat):
+            return CONTRADICTION
+        flat = merge_fields(flat, merge_conjunction, model)
+        if flat is CONTRADICTION:
+            return CONTRADICTION
+    else:
+        flat = [child for child in flat if child is not CONTRADICTION]
+        if not flat:
+            return CONTRADICTION
+        flat = merge_fields(flat, merge_disjunction, model)
+
+    return flat[0] if len(flat) == 1 else {key: flat}
+
+
+def get_mergeable_key(node):
+    """Return what a comparison is on if its value can be compared with others, otherwise None"""
+    if not is_comparison(node) or node['op'] not in NEGATIONS:
+        return None
+
+    value = node['value']
+    values = value if node['op'] in ('in', 'not_in') else [value]
+    if not is_list(values) or any(v is None or is_list(v) or isinstance(v, dict) for v in values):
+        return None
+
+    return node.get('model'), node['field']
+
+
+def get_value_kinds(group):
+    """Return the kinds of the values of some comparisons, as SQLite may convert between kinds
+    but only numbers compare alike in Python and SQLite"""
+    kinds = set()
+    for node in group:
+        for value in (node['value'] if node['op'] in ('in', 'not_in') else [node['value']]):
+            kinds.add('number' if isinstance(value, (int, float)) and not isinstance(value, bool) else type(value))
+    return kinds
+
+
+@lru_cache(maxsize=None)
+def get_column_kind(model, field_name):
+    """Return the kind of the values a field compares alike in Python and SQLite, or None if
+    it is not known. Mappers do not change once configured, so this is worked out once per field.
+    """
+    try:
+        column_type = Field(model, field_name).get_sqlalchemy_field().type
+    except (FieldNotFound, AttributeError):
+        return None
+
+    for type_, kind in COLUMN_KINDS:
+        if isinstance(column_type, type_):
+            return kind
+    return None
+
+
+def merge_fields(filters, merge, model):
+    """Merge the comparisons on each field with `merge`, in place of the first one of them.
+
+    Only comparisons whose values are all of the kind of their column are merged, as SQLite
+    compares other values after converting them, e.g. distance > '9' as distance > 9.
+
+    :param filters: a list of filters
+    :param merge: a function that takes the comparisons on one field and returns them merged,
+        CONTRADICTION, or None to leave them as they are
+    :param model: the model the filtered fields belong to
+    """
+    groups = {}
+    for node in filters:
+        key = get_mergeable_key(node)
+        if key is not None:
+            groups.setdefault(key, []).append(node)
+
+    merged = {}
+    for key, group in groups.items():
+        if len(group) > 1 and get_value_kinds(group) == {get_column_kind(model, key[1])}:
+            try:
+                result = merge(group)
+            except TypeError:
+                result = None
+            if result is CONTRADICTION:
+                return CONTRADICTION
+            if result:
+                merged[key] = result
+
+    if not merged:
+        return filters
+
+    result = []
+    for node in filters:
+        key = get_mergeable_key(node)
+        if key not in merged:
+            result.append(node)
+        elif merged[key] is not None:
+            result.extend(merged[key])
+            merged[key] = None
+    return result
+
+
+def make_comparison(like, op, value):
+    """Make a comparison on the same field as `like`"""
+    return dict(like, op=op, value=value)
+
+
+def unique(values):
+    result = []
+    for value in values:
+        if value not in result:
+            result.append(value)
+    return result
+
+
+def merge_disjunction(group):
+    """Fold equalities on one field that are or-ed into one `in`"""
+    equalities = [node for node in group if node['op'] in ('==', 'in')]
+    if len(equalities) < 2:
+        return None
+
+    values = unique(v for node in equalities for v in (node['value'] if node['op'] == 'in' else [node['value']]))
+    folded = make_comparison(equalities[0], 'in', values)
+    return [folded] + [node for node in group if node['op'] not in ('==', 'in')]
+
+
+def merge_conjunction(group):
+    """Merge comparisons on one field that are and-ed into the fewest comparisons"""
+    allowed = None
+    excluded = []
+    lower = upper = None
+    for node in group:
+        op, value = node['op'], node['value']
+        if op in ('==', 'in'):
+            values = value if op == 'in' else [value]
+            allowed = unique(values) if allowed is None else [v for v in allowed if v in values]
+        elif op == '!=':
+            excluded.append(value)
+        elif op == 'not_in':
+            excluded.extend(value)
+        elif op in ('>', '>='):
+            bound = (value, op == '>=')
+            if lower is None or value > lower[0] or (value == lower[0] and not bound[1]):
+                lower = bound
+        else:
+            bound = (value, op == '<=')
+            if upper is None or value < upper[0] or (value == upper[0] and not bound[1]):
+                upper = bound
+
+    def within(value):
+        return ((lower is None or value > lower[0] or (value == lower[0] and lower[1]))
+                and (upper is None or value < upper[0] or (value == upper[0] and upper[1])))
+
+    first = group[0]
+    if allowed is not None:
+        allowed = [v for v in allowed if within(v) and v not in excluded]
+        if not allowed:
+            return CONTRADICTION
+        return [make_comparison(first, '==', allowed[0]) if len(allowed) == 1 else make_comparison(first, 'in', allowed)]
+
+    if lower is not None and upper is not None and (
+            lower[0] > upper[0] or (lower[0] == upper[0] and not (lower[1] and upper[1]))):
+        return CONTRADICTION
+
+    result = []
+    if lower is not None and upper is not None and lower[1] and upper[1]:
+        if lower[0] == upper[0]:
+            if lower[0] in excluded:
+                return CONTRADICTION
+            return [make_comparison(first, '==', lower[0])]
+        result.append(make_comparison(first, 'between', [lower[0], upper[0]]))
+    else:
+        if lower is not None:
+            result.append(make_comparison(first, '>=' if lower[1] else '>', lower[0]))
+        if upper is not None:
+            result.append(make_comparison(first, '<=' if upper[1] else '<', upper[0]))
+
+    excluded = unique(v for v in excluded if within(v))
+    if len(excluded) == 1:
+        result.append(make_comparison(first, '!=', excluded[0]))
+    elif excluded:
+        result.append(make_comparison(first, 'not_in', excluded))
+
+    return result or None
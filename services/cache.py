@@ -0,0 +1,176 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A thread-safe least-recently-used cache with an optional time-to-live.
+
+    Hits and misses are counted so the cache can be monitored.
+    """
+
+    def __init__(self, maxsize, ttl=None, maxbytes=None):
+        """
+        :param maxsize: the maximum number of entries, the least recently used one is evicted beyond it
+        :param ttl: seconds an entry stays valid for, or None to keep entries until evicted
+        :param maxbytes: the maximum total length of the values, e.g. of bytes, or None for no limit.
+            The least recently used entries are evicted beyond it, and longer values are not kept at all.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Given a key, return its value, or `default` if it is missing or expired
+        """
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if self.maxbytes is not None:
+                if len(value) > self.maxbytes:
+                    return
+                self.nbytes += len(value)
+
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def _remove(self, key):
+        """Remove an entry, with the lock held"""
+        value, _ = self._data.pop(key)
+        if self.maxbytes is not None:
+            self.nbytes -= len(value)
+
+    def discard_where(self, predicate):
+        """Remove all entries for which predicate(key, value) is true
+        """
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(k, v)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        stats = {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+        if self.maxbytes is not None:
+            stats.update(bytes=self.nbytes, maxbytes=self.maxbytes)
+        return stats
+
+
+class Generations:
+    """Counters of how many times the data in some scopes has changed.
+
+    Cache keys include the generations of the scopes their entries depend on. Bumping a
+    generation when its data changes makes those entries unreachable, so they are never
+    served again and age out of the cache.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, *scopes):
+        """Given some scopes, return a tuple of their generations"""
+        with self._lock:
+            return tuple(self._counters.get(scope, 0) for scope in scopes)
+
+    def bump(self, *scopes):
+        with self._lock:
+            for scope in scopes:
+                self._counters[scope] = self._counters.get(scope, 0) + 1
+
+
+class SingleFlight:
+    """Run a function once for concurrent callers with the same key, and share its result with all of them.
+
+    Callers that arrive while a call for their key is in flight wait for it instead of making their own,
+    and are counted as coalesced.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """Given a key and a function without arguments, return the result of the function,
+        or of the call for the same key that is already in flight. Its exception is raised to every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {
+            'in_flight': len(self._calls),
+            'coalesced': self.coalesced,
+        }
+
+
+class _Call:
+    """A call in flight of SingleFlight"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
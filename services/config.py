@@ -1,3 +1,82 @@
+import os
 
 DEFAULT_PAGE_NUM = 1
 DEFAULT_PAGE_SIZE = 10
+
+# The number of rows in each executemany of bulk endpoints
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 1000))
+
+# The number of rows fetched from the database at a time when exporting records
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+
+# Resolved token owners are cached for TOKEN_CACHE_TTL seconds. Logins and logouts handled by
+# other worker processes are only picked up once the entry expires, so keep the TTL short.
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', 60))
+
+# Leaderboards are cached per period and dropped when a record in the period changes. Changes
+# made by other worker processes are only picked up once the entry expires after STATS_CACHE_TTL seconds.
+STATS_PERIODS = ('week', 'month', 'year', 'all')
+STATS_CACHE_SIZE = int(os.environ.get('STATS_CACHE_SIZE', 1000))
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', 60))
+DEFAULT_LEADERBOARD_LIMIT = 10
+
+# Responses of GET /record and GET /user are cached as JSON, up to RESPONSE_CACHE_SIZE entries and
+# RESPONSE_CACHE_BYTES bytes. Writes in this process invalidate them right away, while writes made by
+# other worker processes are only picked up once an entry expires after RESPONSE_CACHE_TTL seconds.
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 10000))
+RESPONSE_CACHE_BYTES = int(os.environ.get('RESPONSE_CACHE_BYTES', 64 * 1024 * 1024))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 5))
+
+# Weather is cached per date and grid cell of WEATHER_GRID_RESOLUTION degrees (0.1 is about 11km),
+# with the most recent WEATHER_CACHE_SIZE cells in memory and all of them in a table of the database file
+WEATHER_GRID_RESOLUTION = float(os.environ.get('WEATHER_GRID_RESOLUTION', 0.1))
+WEATHER_CACHE_SIZE = int(os.environ.get('WEATHER_CACHE_SIZE', 10000))
+
+# New records are saved with weather 'Pending', and WEATHER_WORKERS threads per process look it up
+# and save it for up to WEATHER_BATCH_SIZE records at a time
+WEATHER_WORKERS = int(os.environ.get('WEATHER_WORKERS', 4))
+WEATHER_BATCH_SIZE = int(os.environ.get('WEATHER_BATCH_SIZE', 50))
+
+# Weather API requests time out after WEATHER_CONNECT_TIMEOUT/WEATHER_READ_TIMEOUT seconds and are retried
+# WEATHER_RETRIES times with exponential backoff. After WEATHER_BREAKER_THRESHOLD failures in a row the API
+# is not called for WEATHER_BREAKER_RESET_TIMEOUT seconds, and weather is 'Unknown' meanwhile.
+WEATHER_API_URL = os.environ.get('WEATHER_API_URL', 'http://api.openweathermap.org/data/2.5/onecall/timemachine')
+WEATHER_CONNECT_TIMEOUT = float(os.environ.get('WEATHER_CONNECT_TIMEOUT', 3.05))
+WEATHER_READ_TIMEOUT = float(os.environ.get('WEATHER_READ_TIMEOUT', 10))
+WEATHER_RETRIES = int(os.environ.get('WEATHER_RETRIES', 2))
+WEATHER_RETRY_BACKOFF = float(os.environ.get('WEATHER_RETRY_BACKOFF', 0.5))
+WEATHER_BREAKER_THRESHOLD = int(os.environ.get('WEATHER_BREAKER_THRESHOLD', 5))
+WEATHER_BREAKER_RESET_TIMEOUT = float(os.environ.get('WEATHER_BREAKER_RESET_TIMEOUT', 30))
+
+# Connection pool of a file-backed database. Each thread serving a request holds one connection.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_POOL_MAX_OVERFLOW = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 8))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+
+# Buckets of GET /report/series, and how many of them one request may ask for
+REPORT_BUCKETS = ('week', 'month')
+REPORT_SERIES_MAX_BUCKETS = int(os.environ.get('REPORT_SERIES_MAX_BUCKETS', 520))
+
+# Named sets of SQLite PRAGMAs applied to every new connection, pick one with SQLITE_PROFILE.
+# Use 'performance' when several processes share one database file, e.g. under gunicorn:
+# WAL lets readers run alongside the writer, and the busy timeout makes writers queue up
+# instead of failing with "database is locked".
+SQLITE_PROFILES = {
+    'default': {
+        'foreign_keys': 'ON',
+    },
+    'performance': {
+        'foreign_keys': 'ON',
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # negative means KiB, i.e. 64MB
+        'busy_timeout': 5000,  # milliseconds
+    },
+}
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+
+# Writes that still hit SQLITE_BUSY are retried with jittered exponential backoff
+SQLITE_BUSY_RETRIES = int(os.environ.get('SQLITE_BUSY_RETRIES', 5))
+SQLITE_BUSY_RETRY_DELAY = float(os.environ.get('SQLITE_BUSY_RETRY_DELAY', 0.05))
@@ -1,54 +1,280 @@
 import os
+import time
 import uuid
+import random
 import hashlib
+import json
+import calendar
 import datetime
+import functools
+from collections import namedtuple
 from loguru import logger
-from sqlalchemy.orm import sessionmaker, exc as ormexc
-from sqlalchemy import create_engine, exc, event
-from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker, scoped_session, exc as ormexc
+from sqlalchemy import create_engine, exc, event, inspect
+from sqlalchemy.pool import QueuePool, StaticPool
 from sqlite3 import Connection as SQLite3Connection
 
-from db.models import Base
+from db.models import Base, JoggingInfo, WeeklySummary
 from db.user import UserTable
-from db.jogging import JoggingTable
-from services.weather import WeatherAPI
-from services.config import DEFAULT_PAGE_NUM, DEFAULT_PAGE_SIZE
+from db.jogging import JoggingTable, LEADERBOARD_METRICS, ALL_RECORDS
+from db.statements import CompileCacheCounter, get_statement_cache_stats
+from filtering.filters import get_compile_cache_stats
+from services.weather import WeatherAPI, WeatherCache, UNKNOWN_WEATHER
+from services.enrichment import WeatherEnricher, WeatherTask, PENDING
+from services.cache import LRUCache, Generations
+from services.config import (
+    DEFAULT_PAGE_NUM, DEFAULT_PAGE_SIZE, BULK_CHUNK_SIZE, EXPORT_BATCH_SIZE, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL,
+    DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    SQLITE_PROFILES, SQLITE_PROFILE, SQLITE_BUSY_RETRIES, SQLITE_BUSY_RETRY_DELAY,
+    REPORT_BUCKETS, REPORT_SERIES_MAX_BUCKETS, STATS_PERIODS, STATS_CACHE_SIZE, STATS_CACHE_TTL,
+    DEFAULT_LEADERBOARD_LIMIT, WEATHER_WORKERS, WEATHER_BATCH_SIZE,
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_BYTES, RESPONSE_CACHE_TTL,
+)
 from services import exceptions
 
 
-@event.listens_for(Engine, "connect")
-def _set_sqlite_pragma(dbapi_connection, connection_record):
-    """Turn on foreign key constraint in sqlite manually
+# What the token cache keeps about a token owner. A detached snapshot rather than the
+# ORM object, so cached entries never trigger lazy loads on a session.
+TokenOwner = namedtuple('TokenOwner', ('username', 'role'))
+
+# Scopes of the generations that cached responses depend on. Records of one user are in scope
+# (RECORDS, username), and those seen by admins, i.e. of every user, in scope (RECORDS, None).
+RECORDS = 'records'
+USERS = 'users'
+
+# Reports of a token owner, which are made from their own records only
+REPORTS = 'reports'
+
+
+def _set_sqlite_pragma(dbapi_connection, pragmas):
+    """Apply PRAGMAs of a storage profile to a new sqlite connection, e.g. turn on foreign key constraint
     """
     if isinstance(dbapi_connection, SQLite3Connection):
         cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA foreign_keys=ON;")
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value};")
         cursor.close()
 
 
+def is_database_locked(error):
+    return isinstance(error, exc.OperationalError) and 'database is locked' in str(error)
+
+
+def retry_on_busy(method):
+    """Retry a DBService write with jittered exponential backoff while sqlite reports the database is locked.
+
+    The busy timeout already makes writers wait for the lock, but sqlite gives up at once when
+    waiting could deadlock, e.g. a read transaction upgrading to a write one. Starting over is the fix.
+    The decorated method must not modify its arguments, as it may run several times.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        for attempt in range(SQLITE_BUSY_RETRIES + 1):
+            try:
+                return method(self, *args, **kwargs)
+            except exc.OperationalError as e:
+                if not is_database_locked(e) or attempt == SQLITE_BUSY_RETRIES:
+                    raise
+
+                self.session.rollback()
+                delay = random.uniform(0, SQLITE_BUSY_RETRY_DELAY * 2 ** attempt)
+                logger.warning(f'Database is locked when calling {method.__name__}, retry in {delay:.3f}s')
+                time.sleep(delay)
+
+    return wrapper
+
+
 class DBService:
-    def __init__(self, db_name, in_memory=False):
+    def __init__(self, db_name, in_memory=False, profile=SQLITE_PROFILE):
         self.db_name = db_name
+        self.profile = profile
         self.engine = None
         self.session = self.initialise_db(in_memory)
+        self.compile_cache = CompileCacheCounter(self.engine)
         self.user_table = UserTable(self.session)
         self.jogging_table = JoggingTable(self.session)
-        self.weather_api = WeatherAPI()
+        if WeeklySummary.__tablename__ in self.new_tables and JoggingInfo.__tablename__ not in self.new_tables:
+            # A database created before the weekly summary existed has records that it does not count yet
+            weeks = self.rebuild_weekly_summary()
+            logger.info(f'Weekly summary filled in with {weeks} weeks')
+        # The weather cache has its own connection, to the same database file and with the same PRAGMAs
+        self.weather_api = WeatherAPI(WeatherCache(self.engine.url.database or ':memory:',
+                                                   pragmas=SQLITE_PROFILES[profile]))
+        # An in-memory database has a single connection, so weather is looked up right away there
+        self.weather_enricher = WeatherEnricher(self.weather_api.get_weather, self.save_weathers,
+                                                0 if in_memory else WEATHER_WORKERS, WEATHER_BATCH_SIZE)
+        self.token_cache = LRUCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+        self.stats_cache = LRUCache(STATS_CACHE_SIZE, STATS_CACHE_TTL)
+        self.response_cache = LRUCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_BYTES)
+        self.generations = Generations()
 
     def initialise_db(self, in_memory):
+        """Create the engine and tables, and return a session registry.
+
+        The registry hands every thread its own session, so concurrent requests do not share
+        transactions. Call `self.session.remove()` once a request is done with it.
+        The names of the tables that did not exist yet are kept in `self.new_tables`.
+        """
         if in_memory:
-            path = ':memory:'
+            # Every connection to ':memory:' opens a new empty database, so they all share one
+            self.engine = create_engine(
+                'sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
         else:
             path = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', self.db_name)
-
-        self.engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+            self.engine = create_engine(
+                f'sqlite:///{path}',
+                connect_args={'check_same_thread': False},
+                poolclass=QueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_POOL_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+            )
+
+        pragmas = SQLITE_PROFILES[self.profile]
+
+        @event.listens_for(self.engine, 'connect')
+        def set_sqlite_pragma(dbapi_connection, connection_record):
+            _set_sqlite_pragma(dbapi_connection, pragmas)
+
+        self.new_tables = set(Base.metadata.tables) - set(inspect(self.engine).get_table_names())
         Base.metadata.create_all(self.engine)
-        Session = sessionmaker(self.engine)
-        return Session()
+        self.create_indexes()
+        return scoped_session(sessionmaker(self.engine))
+
+    def create_indexes(self):
+        """Create missing indexes on existing tables.
+
+        `create_all` only creates indexes along with new tables, so databases created
+        before an index was declared need it added here. Safe to run on every startup.
+        """
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                try:
+                    index.create(self.engine, checkfirst=True)
+                except exc.IntegrityError as e:
+                    logger.error(f'Failed to create index {index.name}, the existing data violates it: {e}')
 
     def drop_all_tables(self):
         Base.metadata.drop_all(self.engine)
 
+    def get_token_owner(self, token):
+        """Given a token, return the username and role of its owner.
+
+        Owners are served from the token cache when possible, which saves a query on
+        every authenticated request.
+
+        :param token: a login token
+        :return: a TokenOwner
+        """
+        token_owner = self.token_cache.get(token)
+        if token_owner is None:
+            try:
+                user = self.user_table.get_a_user_by_token(token)
+            except ormexc.NoResultFound:
+                msg = f'Permission Denied. Unknown token: {token}'
+                logger.error(msg)
+                raise exceptions.UnauthenticatedError(msg)
+
+            token_owner = TokenOwner(user.username, user.role)
+            self.token_cache.set(token, token_owner)
+
+        return token_owner
+
+    def forget_tokens_of_user(self, username):
+        """Drop cached token owners of a user whose token or role may have changed
+        """
+        self.token_cache.discard_where(lambda token, owner: owner.username == username)
+
+    def read_metrics(self, token):
+        """Given an admin token, return counters of the in-process caches, see `get_metrics`
+        """
+        token_owner = self.get_token_owner(token)
+
+        if token_owner.role != 'admin':
+            msg = f'Permission Denied: {token_owner} can not read metrics'
+            logger.error(msg)
+            raise exceptions.NoAccessError(msg)
+
+        return self.get_metrics()
+
+    def get_metrics(self):
+        """Return counters of the in-process caches for monitoring
+        """
+        return {
+            'token_cache': self.token_cache.stats(),
+            'stats_cache': self.stats_cache.stats(),
+            'response_cache': self.response_cache.stats(),
+            'weather_cache': self.weather_api.cache.stats(),
+            'weather_api': self.weather_api.stats(),
+            'filter_cache': get_compile_cache_stats(),
+            'statement_cache': get_statement_cache_stats(),
+            'sql_compile_cache': self.compile_cache.stats(),
+            'weather_enrichment': self.weather_enricher.stats(),
+        }
+
+    def get_response_key(self, view, token, filter_dict, *params):
+        """Return the key of a cached response of a read view for a token.
+
+        The key includes the owner of the token and the generations of the data the view shows,
+        so a write makes the responses that could have changed unreachable without looking for them.
+
+        :param view: RECORDS or USERS
+        :param token: a login token
+        :param filter_dict: a dict of filters, normalized so equal filters give equal keys
+        :param params: hashable parameters of the request, e.g. the page
+        """
+        token_owner = self.get_token_owner(token)
+
+        if view == USERS:
+            scopes = (USERS, )
+        else:
+            scopes = (RECORDS, (RECORDS, None if token_owner.role == 'admin' else token_owner.username))
+        filters = json.dumps(filter_dict, sort_keys=True, default=repr)
+        return view, token_owner.username, token_owner.role, filters, params, self.generations.get(*scopes)
+
+    def get_etag(self, view, token, *params):
+        """Return a weak ETag of what a read view shows a token, made from the persisted data version
+        of the records in view, so every process gives the same ETag until the records change.
+
+        :param view: RECORDS or REPORTS
+        :param token: a login token
+        :param params: parameters the response depends on that are not in the URL, e.g. today's date
+        :return: an opaque string
+        """
+        token_owner = self.get_token_owner(token)
+
+        scope = ALL_RECORDS if view == RECORDS and token_owner.role == 'admin' else token_owner.username
+        version = self.jogging_table.get_data_version(scope)
+        return hashlib.sha1(repr((view, scope, version) + params).encode()).hexdigest()
+
+    def forget_responses_of_records(self, usernames=None):
+        """Make cached responses that show records of some users unreachable
+
+        :param usernames: an iterable of usernames, or None for all the users
+        """
+        if usernames is None:
+            self.generations.bump(RECORDS)
+        else:
+            self.generations.bump((RECORDS, None), *[(RECORDS, username) for username in usernames])
+
+    def forget_responses_of_users(self):
+        """Make cached responses that show users unreachable
+        """
+        self.generations.bump(USERS)
+
+    def forget_stats_of_dates(self, dates):
+        """Drop cached stats of the periods that include any of the given record dates
+        """
+        dates = set(dates)
+
+        def covers_any_date(key, stats):
+            start, end = stats['start'], stats['end']
+            return any((start is None or start <= date) and (end is None or date <= end) for date in dates)
+
+        if dates:
+            self.stats_cache.discard_where(covers_any_date)
+
+    @retry_on_busy
     def login(self, username, password):
         encrypted_pw = hashlib.sha1(password.encode()).hexdigest()
         try:
@@ -64,22 +290,23 @@ class DBService:
             'username': username,
         }
         self.user_table.update_a_user(params)
+        self.forget_tokens_of_user(username)
+        self.forget_responses_of_users()
         return token
 
+    @retry_on_busy
     def logout(self, token):
-        try:
-            token_owner = self.user_table.get_a_user_by_token(token)
-        except ormexc.NoResultFound:
-            msg = f'Permission Denied. Unknown token: {token}'
-            logger.error(msg)
-            raise exceptions.UnauthenticatedError(msg)
+        token_owner = self.get_token_owner(token)
 
         if token_owner:
             self.user_table.update_a_user({
                 'username': token_owner.username,
                 'token': '',
             })
+            self.forget_tokens_of_user(token_owner.username)
+            self.forget_responses_of_users()
 
+    @retry_on_busy
     def create_a_user(self, params, token):
         """Given some parameters and a token, add a user to user table if the token has permission.
 
@@ -87,12 +314,7 @@ class DBService:
         :param token: a login token
         :return:
         """
-        try:
-            token_owner = self.user_table.get_a_user_by_token(token)
-        except ormexc.NoResultFound:
-            msg = f'Permission Denied. Unknown token: {token}'
-            logger.error(msg)
-            raise exceptions.UnauthenticatedError(msg)
+        token_owner = self.get_token_owner(token)
 
         if token_owner.role in ['admin', 'staff']:
             if not params.get('username') or not params.get('password'):
@@ -100,23 +322,89 @@ class DBService:
                 logger.error(msg)
                 raise exceptions.MissingInformation(msg)
 
-            params['password'] = hashlib.sha1(params['password'].encode()).hexdigest()
+            params = dict(params, password=hashlib.sha1(params['password'].encode()).hexdigest())
             try:
                 self.user_table.create_a_user(params)
             except exc.IntegrityError as e:
                 msg = f"User {params['username']} already exists: {e}"
                 logger.error(msg)
                 raise exceptions.DuplicateUser(msg)
+            self.forget_responses_of_users()
         else:
             msg = f'Permission Denied: {token_owner} can not create new user'
             logger.error(msg)
             raise exceptions.NoAccessError(msg)
 
+    @retry_on_busy
+    def create_users(self, rows, token):
+        """Given a list of user parameters and a token, add the users to user table in one transaction
+        if the token has permission.
+
+        :param rows: a list of dicts of parameters for new users
+        :param token: a login token
+        :return: a list of dicts of username, status ('created', 'duplicate' or 'invalid') and message, one per row
+        """
+        token_owner = self.get_token_owner(token)
+
+        if token_owner.role not in ['admin', 'staff']:
+            msg = f'Permission Denied: {token_owner} can not create new user'
+            logger.error(msg)
+            raise exceptions.NoAccessError(msg)
+
+        results = []
+        valid = []
+        for row in rows:
+            try:
+                params = self.validate_user(row)
+            except ValueError as e:
+                username = row.get('username') if isinstance(row, dict) else None
+                results.append({'username': username, 'status': 'invalid', 'msg': str(e)})
+                continue
+
+            results.append({'username': params['username'], 'status': 'created', 'msg': 'OK'})
+            valid.append((len(results) - 1, params))
+
+        duplicates = self.user_table.create_users([params for _, params in valid], BULK_CHUNK_SIZE)
+        self.forget_responses_of_users()
+        for i in duplicates:
+            index = valid[i][0]
+            results[index]['status'] = 'duplicate'
+            results[index]['msg'] = f"User {results[index]['username']} or its token already exists"
+
+        logger.info(f'{len(valid) - len(duplicates)} of {len(rows)} users created in bulk')
+        return results
+
+    @staticmethod
+    def validate_user(row):
+        """Given the parameters of a new user, return a copy ready to insert, with the password hashed.
+
+        :raise ValueError: if the username or password is missing, or a field is not a string
+        """
+        if not isinstance(row, dict) or not row.get('username') or not row.get('password'):
+            raise ValueError('Username and password must be provided to create a new user')
+
+        for field in ['username', 'password', 'forename', 'surname', 'email', 'role', 'token']:
+            if row.get(field) is not None and not isinstance(row[field], str):
+                raise ValueError(f'Field {field} must be a string, got {row[field]!r}')
+
+        return {
+            'username': row['username'],
+            'password': hashlib.sha1(row['password'].encode()).hexdigest(),
+            'forename': row.get('forename'),
+            'surname': row.get('surname'),
+            'email': row.get('email'),
+            'role': row.get('role') or 'user',
+            'token': row.get('token') or '',
+        }
+
+    @retry_on_busy
     def create_admin_user(self, params):
         """Create admin user
         """
         self.user_table.create_a_user(params)
+        self.forget_responses_of_users()
 
+    @retry_on_busy
     def update_a_user(self, params, token):
         """Given some parameters and a token, update the user in user table if the token has permission.
 
@@ -124,12 +412,7 @@ class DBService:
         :param token: a login token
         :return:
         """
-        try:
-            token_owner = self.user_table.get_a_user_by_token(token)
-        except ormexc.NoResultFound:
-            msg = f'Permission Denied. Unknown token: {token}'
-            logger.error(msg)
-            raise exceptions.UnauthenticatedError(msg)
+        token_owner = self.get_token_owner(token)
 
         if token_owner.role in ['admin', 'staff']:
             try:
@@ -138,11 +421,14 @@ class DBService:
                 msg = f"Failed to update user ({params.get('username')}) who does not exist"
                 logger.error(msg)
                 raise exceptions.UnknownUser(msg)
+            self.forget_tokens_of_user(params['username'])
+            self.forget_responses_of_users()
         else:
             msg = f'Permission Denied: {token_owner} can not update user'
             logger.error(msg)
             raise exceptions.NoAccessError(msg)
 
+    @retry_on_busy
     def delete_a_user(self, username, token):
         """Given a username and a token, delete the user if the token has permission.
 
@@ -154,12 +440,7 @@ class DBService:
 
         :return:
         """
-        try:
-            token_owner = self.user_table.get_a_user_by_token(token)
-        except ormexc.NoResultFound:
-            msg = f'Permission Denied. Unknown token: {token}'
-            logger.error(msg)
-            raise exceptions.UnauthenticatedError(msg)
+        token_owner = self.get_token_owner(token)
 
         try:
             user = self.user_table.get_a_user_by_username(username)
@@ -175,32 +456,46 @@ class DBService:
                 msg = f'Can not delete a user that has records: {e}'
                 logger.error(msg)
                 raise exceptions.UserStillHasRecords(msg)
+            self.forget_tokens_of_user(username)
+            self.forget_responses_of_users()
         else:
             msg = f'Permission Denied: {token_owner} can not delete user {user}'
             logger.error(msg)
             raise exceptions.NoAccessError(msg)
 
-    def read_user_info(self, token, filters, page=DEFAULT_PAGE_NUM, page_size=DEFAULT_PAGE_SIZE):
+    def read_user_info(self, token, filters, page=DEFAULT_PAGE_NUM, page_size=DEFAULT_PAGE_SIZE, fields=None):
         """Given a token and a filter dict, return all user information that the token has access to.
 
         :param token: a login token
         :param filters: a dict of filters
         :param page: page number
         :param page_size: the number of items in each page
+        :param fields: a list of field names to return, or None for all fields
 
         :return: a dict of user information
         """
-        try:
-            token_owner = self.user_table.get_a_user_by_token(token)
-        except ormexc.NoResultFound:
-            msg = f'Permission Denied. Unknown token: {token}'
+        token_owner = self.get_token_owner(token)
+
+        if token_owner.role in ['admin', 'staff']:
+            return self.user_table.get_all_users(filters, page, page_size, fields)
+
+        else:
+            msg = f'Permission Denied. Token {token} has no access to all users'
             logger.error(msg)
-            raise exceptions.UnauthenticatedError(msg)
+            raise exceptions.NoAccessError(msg)
+
+    def count_user_info(self, token, filters):
+        """Given a token and a filter dict, return the number of users that the token has access to.
+
+        :param token: a login token
+        :param filters: a dict of filters
+
+        :return: an integer
+        """
+        token_owner = self.get_token_owner(token)
 
         if token_owner.role in ['admin', 'staff']:
-            users = self.user_table.get_all_users(filters)
-            paged = users[(page - 1) * page_size: page * page_size]
-            return [user.to_dict() for user in paged]
+            return self.user_table.count_all_users(filters)
 
         else:
             msg = f'Permission Denied. Token {token} has no access to all users'
@@ -209,7 +504,10 @@ class DBService:
 
     def clear_user_table(self):
         self.user_table.clear()
+        self.token_cache.clear()
+        self.forget_responses_of_users()
 
+    @retry_on_busy
     def create_a_record(self, params, token):
         """Given some parameters and a token, add a record to jogging table if the token has permission.
 
@@ -217,28 +515,139 @@ class DBService:
         :param token: a login token
         :return:
         """
-        try:
-            token_owner = self.user_table.get_a_user_by_token(token)
-        except ormexc.NoResultFound:
-            msg = f'Permission Denied. Unknown token: {token}'
-            logger.error(msg)
-            raise exceptions.UnauthenticatedError(msg)
+        token_owner = self.get_token_owner(token)
 
         if token_owner.role == 'admin' or token_owner.username == params['username']:
-            params['date'] = datetime.datetime.strptime(params['date'], '%Y-%m-%d').date()
-            if 'weather' not in params:
-                params['weather'] = self.weather_api.get_weather(params['date'], params['lat'], params['lon'])
+            params = dict(params, date=datetime.datetime.strptime(params['date'], '%Y-%m-%d').date())
+            pending = 'weather' not in params
+            if pending:
+                if params.get('lat') is None or params.get('lon') is None:
+                    msg = 'Fields lat and lon must be provided to look up the weather of a new record'
+                    logger.error(msg)
+                    raise exceptions.MissingInformation(msg)
+                params['weather'] = PENDING
             try:
-                self.jogging_table.create_a_record(params)
+                rid = self.jogging_table.create_a_record(params)
             except exc.IntegrityError as e:
                 msg = f"Can not create record for unknown user {params['username']}: {e}"
                 logger.error(msg)
                 raise exceptions.UnknownUser(msg)
+            self.forget_stats_of_dates([params['date']])
+            self.forget_responses_of_records([params['username']])
+            if pending:
+                self.weather_enricher.submit([WeatherTask(rid, params['date'], params['lat'], params['lon'])])
         else:
             msg = f'Permission Denied: {token_owner} can not create new record'
             logger.error(msg)
             raise exceptions.NoAccessError(msg)
 
+    @retry_on_busy
+    def create_records(self, rows, token):
+        """Given a list of record parameters and a token, add the valid ones to jogging table in one transaction.
+
+        Permission and user existence are checked once per distinct username. Rows that fail
+        any check are skipped and reported instead of failing the whole batch.
+
+        :param rows: a list of dicts of parameters for new jogging records
+        :param token: a login token
+        :return: a tuple of the number of records created and a list of dicts of row index and error message
+        """
+        token_owner = self.get_token_owner(token)
+
+        errors = []
+        valid = []
+        for index, row in enumerate(rows):
+            try:
+                valid.append((index, self.validate_record(row)))
+            except ValueError as e:
+                errors.append({'index': index, 'msg': str(e)})
+
+        usernames = {params['username'] for _, params in valid}
+        if token_owner.role == 'admin':
+            allowed = usernames
+        else:
+            allowed = usernames & {token_owner.username}
+        existing = self.user_table.get_existing_usernames(allowed)
+
+        params_list = []
+        for index, params in valid:
+            if params['username'] not in allowed:
+                errors.append({'index': index, 'msg': f'Permission Denied: {token_owner} can not create record '
+                                                      f'for {params["username"]}'})
+            elif params['username'] not in existing:
+                errors.append({'index': index, 'msg': f'Can not create record for unknown user {params["username"]}'})
+            else:
+                params_list.append(params)
+
+        pending = [params['weather'] is None for params in params_list]
+        params_list = [dict(params, weather=PENDING) if p else params for params, p in zip(params_list, pending)]
+        rids = self.jogging_table.create_records(params_list)
+        self.forget_stats_of_dates(params['date'] for params in params_list)
+        self.forget_responses_of_records({params['username'] for params in params_list})
+        self.weather_enricher.submit(
+            WeatherTask(rid, params['date'], params['lat'], params['lon'])
+            for rid, params, p in zip(rids, params_list, pending) if p
+        )
+        errors.sort(key=lambda e: e['index'])
+        if errors:
+            logger.error(f'{len(errors)} of {len(rows)} records rejected in bulk creation')
+
+        return len(params_list), errors
+
+    @staticmethod
+    def validate_record(row):
+        """Given the parameters of a new record, return a copy ready to insert.
+
+        :raise ValueError: if a field is missing or has a wrong type
+        """
+        if not isinstance(row, dict):
+            raise ValueError(f'Record must be an object, got {row!r}')
+
+        missing = [f for f in ['username', 'date', 'lat', 'lon', 'distance', 'time'] if row.get(f) is None]
+        if missing:
+            raise ValueError(f'Missing fields: {", ".join(missing)}')
+
+        if not isinstance(row['username'], str):
+            raise ValueError(f'Field username must be a string, got {row["username"]!r}')
+
+        for field in ['lat', 'lon', 'distance', 'time']:
+            if isinstance(row[field], bool) or not isinstance(row[field], (int, float)):
+                raise ValueError(f'Field {field} must be a number, got {row[field]!r}')
+
+        try:
+            date = datetime.datetime.strptime(row['date'], '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid date {row["date"]!r}, expected YYYY-MM-DD')
+
+        return {
+            'username': row['username'],
+            'date': date,
+            'lat': row['lat'],
+            'lon': row['lon'],
+            'distance': row['distance'],
+            'time': row['time'],
+            'weather': row.get('weather'),
+        }
+
+    @retry_on_busy
+    def save_weathers(self, updates):
+        """Save looked up weather of some records, unless their weather was set in the meantime.
+
+        :param updates: a list of dicts of rid and weather
+        """
+        usernames = self.jogging_table.set_weathers(updates, [PENDING, UNKNOWN_WEATHER])
+        self.forget_responses_of_records(usernames)
+
+    def redrive_weather(self):
+        """Look up the weather again for records whose weather is unknown or was never looked up.
+
+        :return: the number of records submitted
+        """
+        records = self.jogging_table.get_records_by_weather([PENDING, UNKNOWN_WEATHER])
+        self.weather_enricher.submit(WeatherTask(**r) for r in records)
+        return len(records)
+
+    @retry_on_busy
     def update_a_record(self, params, token):
         """Given some parameters and a token, update a record in jogging table if the token has permission.
 
@@ -250,22 +659,19 @@ class DBService:
 
         :return:
         """
-        try:
-            token_owner = self.user_table.get_a_user_by_token(token)
-        except ormexc.NoResultFound:
-            msg = f'Permission Denied. Unknown token: {token}'
-            logger.error(msg)
-            raise exceptions.UnauthenticatedError(msg)
+        token_owner = self.get_token_owner(token)
         if token_owner.role == 'admin' or token_owner.username == params['username']:
             if params.get('rid'):
                 if 'date' in params:
-                    params['date'] = datetime.datetime.strptime(params['date'], '%Y-%m-%d').date()
+                    params = dict(params, date=datetime.datetime.strptime(params['date'], '%Y-%m-%d').date())
                 try:
-                    self.jogging_table.update_a_record(params)
+                    username, old_date = self.jogging_table.update_a_record(params)
                 except ormexc.NoResultFound as e:
                     msg = f'Can not update unknown record: {e}'
                     logger.error(msg)
                     raise exceptions.UnknownRecord(msg)
+                self.forget_stats_of_dates([old_date, params.get('date', old_date)])
+                self.forget_responses_of_records([username])
             else:
                 msg = 'Update content does not have field "rid"'
                 logger.error(msg)
@@ -275,29 +681,79 @@ class DBService:
             logger.error(msg)
             raise exceptions.NoAccessError(msg)
 
-    def read_records(self, token, filter_dict, page=DEFAULT_PAGE_NUM, page_size=DEFAULT_PAGE_SIZE):
+    def read_records(self, token, filter_dict, page=DEFAULT_PAGE_NUM, page_size=DEFAULT_PAGE_SIZE, fields=None):
         """Given a token and some filters, return jogging records that the token has access to.
 
         :param token: a login token
         :param filter_dict: a dict of filters
         :param page: page number
         :param page_size: the number of items in each page
+        :param fields: a list of field names to return, or None for all fields
 
         :return: a dict of jogging records
         """
-        try:
-            token_owner = self.user_table.get_a_user_by_token(token)
-        except ormexc.NoResultFound:
-            msg = f'Permission Denied. Unknown token: {token}'
-            logger.error(msg)
-            raise exceptions.UnauthenticatedError(msg)
+        token_owner = self.get_token_owner(token)
+
+        if token_owner.role == 'admin':
+            return self.jogging_table.get_all_records(filter_dict, page, page_size, fields)
+        else:
+            return self.jogging_table.get_records_of_a_user(token_owner.username, filter_dict, page, page_size, fields)
+
+    def read_records_after(self, token, filter_dict, after=None, page_size=DEFAULT_PAGE_SIZE, fields=None):
+        """Given a token and some filters, return one page of jogging records ordered by (date, rid)
+        that the token has access to, starting after the given sort key.
+
+        :param token: a login token
+        :param filter_dict: a dict of filters
+        :param after: the (date, rid) of the last record of the previous page, or None for the first page
+        :param page_size: the number of items in each page
+        :param fields: a list of field names to return, or None for all fields.
+            `date` and `rid` are always returned as they make up the sort key.
+
+        :return: a tuple of a list of jogging records and the sort key to continue from (None on the last page)
+        """
+        token_owner = self.get_token_owner(token)
+
+        if fields:
+            fields = list(fields) + [f for f in ['date', 'rid'] if f not in fields]
+        username = None if token_owner.role == 'admin' else token_owner.username
+        # Fetch one extra record to tell whether there is a next page
+        records = self.jogging_table.seek_records(filter_dict, after, page_size + 1, username, fields)
+        if len(records) > page_size:
+            records = records[:page_size]
+            return records, (records[-1]['date'], records[-1]['rid'])
+
+        return records, None
+
+    def export_records(self, token, filter_dict):
+        """Given a token and some filters, return an iterator over all jogging records that the token has access to.
+
+        The token is checked right away, while records are read lazily as the iterator is consumed.
+
+        :param token: a login token
+        :param filter_dict: a dict of filters
+
+        :return: an iterator of jogging record dicts
+        """
+        token_owner = self.get_token_owner(token)
+
+        username = None if token_owner.role == 'admin' else token_owner.username
+        return self.jogging_table.iter_records(filter_dict, EXPORT_BATCH_SIZE, username)
+
+    def count_records(self, token, filter_dict):
+        """Given a token and some filters, return the number of jogging records that the token has access to.
+
+        :param token: a login token
+        :param filter_dict: a dict of filters
+
+        :return: an integer
+        """
+        token_owner = self.get_token_owner(token)
 
         if token_owner.role == 'admin':
-            records = self.jogging_table.get_all_records(filter_dict)
+            return self.jogging_table.count_all_records(filter_dict)
         else:
-            records = self.jogging_table.get_records_of_a_user(token_owner.username, filter_dict)
-        paged = records[(page - 1) * page_size: page * page_size]
-        return paged
+            return self.jogging_table.count_records_of_a_user(token_owner.username, filter_dict)
 
     def read_all_records_of_a_user(self, token, filter_dict):
         """Given a token and a filter dict, return all records that the token has permission to read.
@@ -307,15 +763,11 @@ class DBService:
 
         :return: a list of dicts of user information
         """
-        try:
-            token_owner = self.user_table.get_a_user_by_token(token)
-        except ormexc.NoResultFound:
-            msg = f'Permission Denied. Unknown token: {token}'
-            logger.error(msg)
-            raise exceptions.UnauthenticatedError(msg)
+        token_owner = self.get_token_owner(token)
 
         return self.jogging_table.get_records_of_a_user(token_owner.username, filter_dict)
 
+    @retry_on_busy
     def delete_a_record(self, rid, token):
         """Given a record id and a token, delete the record if the token has permission.
 
@@ -323,12 +775,7 @@ class DBService:
         :param token: a login token
         :return:
         """
-        try:
-            token_owner = self.user_table.get_a_user_by_token(token)
-        except ormexc.NoResultFound:
-            msg = f'Permission Denied. Unknown token: {token}'
-            logger.error(msg)
-            raise exceptions.UnauthenticatedError(msg)
+        token_owner = self.get_token_owner(token)
 
         try:
             record = self.jogging_table.get_a_record_by_id(rid)
@@ -338,7 +785,11 @@ class DBService:
             raise exceptions.UnknownRecord(msg)
 
         if token_owner.role == 'admin' or record.username == token_owner.username:
+            date = record.date
+            username = record.username
             self.jogging_table.delete_a_record(record)
+            self.forget_stats_of_dates([date])
+            self.forget_responses_of_records([username])
         else:
             msg = f'Permission Denied: {token_owner} can not delete record {rid}'
             logger.error(msg)
@@ -346,6 +797,8 @@ class DBService:
 
     def clear_record_table(self):
         self.jogging_table.clear()
+        self.stats_cache.clear()
+        self.forget_responses_of_records()
 
     def make_weekly_report(self, token, week_start_date):
         """Given a token and a week_start_date, return a jogging report for that user in that week
@@ -356,23 +809,142 @@ class DBService:
             a Monday date to indicate the start of that week
 
         :return:
-            a dict of total distance, total run time and average speed
-        """
-        week_end_date = week_start_date + datetime.timedelta(days=6)
-        filter_dict = {
-            'and': [
-                {'field': 'date', 'op': '>=', 'value': week_start_date},
-                {'field': 'date', 'op': '<=', 'value': week_end_date},
-            ]
-        }
-        records = self.read_all_records_of_a_user(token, filter_dict)
-        total_distance = 0
-        total_time = 0
-        for r in records:
-            total_distance += r['distance']
-            total_time += r['time']
-
-        return {'total_distance(meters)': total_distance, 'total_time(minutes)': total_time, 'speed': total_distance / total_time}
+            a dict of total distance, total run time, average speed and the number of runs
+        """
+        token_owner = self.get_token_owner(token)
+
+        if week_start_date.isoweekday() == 1:
+            iso_year, iso_week, _ = week_start_date.isocalendar()
+            total_distance, total_time, runs = self.jogging_table.get_weekly_summary(
+                token_owner.username, iso_year, iso_week)
+        else:
+            # The summary is kept per ISO week, so other 7-day windows are added up from the records
+            week_end_date = week_start_date + datetime.timedelta(days=6)
+            total_distance, total_time, runs = self.jogging_table.sum_records_of_a_user(
+                token_owner.username, week_start_date, week_end_date)
+        return make_report(total_distance, total_time, runs)
+
+    def make_report_series(self, token, from_date, to_date, bucket='week'):
+        """Given a token and a date range, return a jogging report of that user for each week or month in the range
+
+        :param token:
+            a login token
+        :param from_date:
+            a date in the first week or month
+        :param to_date:
+            a date in the last week or month
+        :param bucket:
+            'week' for ISO weeks starting on Monday, or 'month' for calendar months
+
+        :return:
+            a list of dicts like the weekly report with the start date of each bucket, including buckets without runs
+        """
+        if bucket not in REPORT_BUCKETS:
+            raise ValueError(f'Unknown bucket {bucket!r}, expected one of {", ".join(REPORT_BUCKETS)}')
+        if from_date > to_date:
+            raise ValueError(f'Start date {from_date} is after end date {to_date}')
+
+        token_owner = self.get_token_owner(token)
+
+        # The number of buckets is checked before they are made, so a huge range is rejected right away
+        if bucket == 'week':
+            first = from_date - datetime.timedelta(days=from_date.weekday())
+            count = (to_date - first).days // 7 + 1
+        else:
+            first = from_date.year * 12 + from_date.month - 1
+            count = to_date.year * 12 + to_date.month - first
+        if count > REPORT_SERIES_MAX_BUCKETS:
+            raise ValueError(f'Too many buckets: {count}, at most {REPORT_SERIES_MAX_BUCKETS} are allowed')
+
+        if bucket == 'week':
+            starts = [first + datetime.timedelta(days=7 * i) for i in range(count)]
+        else:
+            starts = [datetime.date((first + i) // 12, (first + i) % 12 + 1, 1) for i in range(count)]
+
+        if bucket == 'week':
+            keys = [start.isocalendar()[:2] for start in starts]
+            totals = self.jogging_table.get_weekly_summaries(token_owner.username, keys[0], keys[-1])
+        else:
+            keys = [start.strftime('%Y-%m') for start in starts]
+            end_date = starts[-1].replace(day=calendar.monthrange(starts[-1].year, starts[-1].month)[1])
+            totals = self.jogging_table.sum_records_of_a_user_by_month(token_owner.username, starts[0], end_date)
+
+        return [dict(make_report(*totals.get(key, (0, 0, 0))), start=start) for start, key in zip(starts, keys)]
+
+    def rebuild_weekly_summary(self):
+        """Recompute the weekly summary table from the jogging table.
+
+        :return: the number of weeks in the summary
+        """
+        return self.jogging_table.rebuild_weekly_summary(EXPORT_BATCH_SIZE)
+
+    def get_leaderboard(self, token, period='week', metric='distance', limit=DEFAULT_LEADERBOARD_LIMIT, date=None):
+        """Given an admin token, rank all users by a metric of their records in a period, along with the period totals.
+
+        Results are cached per period until a record in the period changes.
+
+        :param token: a login token of an admin
+        :param period: one of STATS_PERIODS
+        :param metric: what to rank users by, a key of LEADERBOARD_METRICS
+        :param limit: the maximum number of users on the leaderboard
+        :param date: a date in the period, today if it is None
+
+        :return: a dict of the period, the leaderboard and the totals of all records in the period
+        """
+        token_owner = self.get_token_owner(token)
+
+        if token_owner.role != 'admin':
+            msg = f'Permission Denied: {token_owner} can not read stats'
+            logger.error(msg)
+            raise exceptions.NoAccessError(msg)
+        if metric not in LEADERBOARD_METRICS:
+            raise ValueError(f'Unknown metric {metric!r}, expected one of {", ".join(LEADERBOARD_METRICS)}')
+        if limit < 1:
+            raise ValueError('limit must be positive')
+
+        start, end = get_period(period, date or datetime.date.today())
+        key = (start, end, metric, limit)
+        stats = self.stats_cache.get(key)
+        if stats is None:
+            total_distance, total_time, runs, runners = self.jogging_table.sum_records(start, end)
+            stats = {
+                'period': period,
+                'start': start,
+                'end': end,
+                'metric': metric,
+                'leaderboard': self.jogging_table.get_leaderboard(metric, start, end, limit),
+                'totals': dict(make_report(total_distance, total_time, runs), runners=runners),
+            }
+            self.stats_cache.set(key, stats)
+
+        return stats
+
+
+def make_report(total_distance, total_time, runs):
+    """Given the totals of some records, return a jogging report with the average speed
+    """
+    speed = total_distance / total_time if total_time else 0
+    return {'total_distance(meters)': total_distance, 'total_time(minutes)': total_time, 'speed': speed, 'runs': runs}
+
+
+def get_period(period, date):
+    """Given a period name and a date, return the first and last dates of the period that includes the date
+
+    :param period: one of STATS_PERIODS. The 'all' period has no bounds, so both dates are None
+    :param date: a date
+    :return: a tuple of two dates
+    """
+    if period == 'week':
+        start = date - datetime.timedelta(days=date.weekday())
+        return start, start + datetime.timedelta(days=6)
+    elif period == 'month':
+        return date.replace(day=1), date.replace(day=calendar.monthrange(date.year, date.month)[1])
+    elif period == 'year':
+        return datetime.date(date.year, 1, 1), datetime.date(date.year, 12, 31)
+    elif period == 'all':
+        return None, None
+
+    raise ValueError(f'Unknown period {period!r}, expected one of {", ".join(STATS_PERIODS)}')
 
 
 if os.environ.get('IN_MEMORY_DB'):
@@ -0,0 +1,97 @@
+import queue
+import threading
+from collections import namedtuple
+from loguru import logger
+
+
+# The weather of a record that is saved before its weather is looked up
+PENDING = 'Pending'
+
+# A record waiting for its weather
+WeatherTask = namedtuple('WeatherTask', ('rid', 'date', 'lat', 'lon'))
+
+
+class WeatherEnricher:
+    """Look up the weather of saved records in background threads and write it back in batches.
+
+    Records are saved with weather PENDING and submitted here, so creating a record does not
+    wait for the weather provider. Worker threads start on the first submit, i.e. after a
+    gunicorn worker has forked.
+    """
+
+    def __init__(self, get_weather, write, workers, batch_size):
+        """
+        :param get_weather: a function of (date, lat, lon) that returns the weather
+        :param write: a function that saves a list of dicts of rid and weather in one transaction
+        :param workers: the number of worker threads, or 0 to look up the weather right away in the submitting thread
+        :param batch_size: the maximum number of records a worker writes at a time
+        """
+        self.get_weather = get_weather
+        self.write = write
+        self.workers = workers
+        self.batch_size = batch_size
+        self.resolved = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, tasks):
+        """Given some WeatherTasks, look up and save their weather, in the background if there are workers
+        """
+        tasks = list(tasks)
+        if not self.workers:
+            for start in range(0, len(tasks), self.batch_size):
+                self.process(tasks[start:start + self.batch_size])
+            return
+
+        self.start()
+        for task in tasks:
+            self._queue.put(task)
+
+    def start(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self.work, name=f'weather-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def work(self):
+        while True:
+            tasks = [self._queue.get()]
+            while len(tasks) < self.batch_size:
+                try:
+                    tasks.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.process(tasks)
+            finally:
+                for _ in tasks:
+                    self._queue.task_done()
+
+    def process(self, tasks):
+        """Look up the weather of some tasks and save it in one write"""
+        try:
+            updates = [{'rid': t.rid, 'weather': self.get_weather(t.date, t.lat, t.lon)} for t in tasks]
+            self.write(updates)
+        except Exception as e:
+            logger.error(f'Failed to save the weather of {len(tasks)} records, redrive them later: {e}')
+            with self._lock:
+                self.failed += len(tasks)
+        else:
+            with self._lock:
+                self.resolved += len(tasks)
+
+    def join(self):
+        """Block until every submitted record is processed"""
+        self._queue.join()
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize(),
+            'workers': len(self._threads),
+            'resolved': self.resolved,
+            'failed': self.failed,
+        }
@@ -1,19 +1,205 @@
+import time
+import sqlite3
 import datetime
+import threading
 import requests
 from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from services.cache import LRUCache, SingleFlight
+from services.config import (
+    WEATHER_GRID_RESOLUTION, WEATHER_CACHE_SIZE, WEATHER_API_URL, WEATHER_WORKERS,
+    WEATHER_CONNECT_TIMEOUT, WEATHER_READ_TIMEOUT, WEATHER_RETRIES, WEATHER_RETRY_BACKOFF,
+    WEATHER_BREAKER_THRESHOLD, WEATHER_BREAKER_RESET_TIMEOUT,
+)
+
+
+# The weather of a record when the API can not tell
+UNKNOWN_WEATHER = 'Unknown'
+
+
+class WeatherCache:
+    """Weather by date and location grid cell, in an in-memory LRU in front of a SQLite table.
+
+    Runs on the same day within the same cell share one entry, and the table keeps them
+    across restarts.
+    """
+
+    def __init__(self, path, resolution=WEATHER_GRID_RESOLUTION, maxsize=WEATHER_CACHE_SIZE, pragmas=None):
+        """
+        :param path: the SQLite database file of the table, or ':memory:' to keep it in this process only
+        :param resolution: the size of a grid cell in degrees of latitude and longitude
+        :param maxsize: the maximum number of entries kept in memory
+        :param pragmas: a dict of SQLite PRAGMAs to apply to the connection, e.g. a busy timeout
+        """
+        self.resolution = resolution
+        self.memory = LRUCache(maxsize)
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        for name, value in (pragmas or {}).items():
+            self._conn.execute(f'PRAGMA {name}={value}')
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS weather_cache ('
+                'date TEXT NOT NULL, lat_cell INTEGER NOT NULL, lon_cell INTEGER NOT NULL, weather TEXT NOT NULL, '
+                'PRIMARY KEY (date, lat_cell, lon_cell)) WITHOUT ROWID'
+            )
+
+    def make_key(self, date, lat, lon):
+        """Given a date and a location, return the key of its grid cell"""
+        return date.isoformat(), round(lat / self.resolution), round(lon / self.resolution)
+
+    def get(self, date, lat, lon):
+        """Given a date and a location, return the cached weather of its grid cell, or None if it is not cached"""
+        key = self.make_key(date, lat, lon)
+        weather = self.memory.get(key)
+        if weather is None:
+            with self._lock:
+                row = self._conn.execute(
+                    'SELECT weather FROM weather_cache WHERE date = ? AND lat_cell = ? AND lon_cell = ?', key
+                ).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+            if row is not None:
+                weather = row[0]
+                self.memory.set(key, weather)
+
+        return weather
+
+    def set(self, date, lat, lon, weather):
+        key = self.make_key(date, lat, lon)
+        self.memory.set(key, weather)
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO weather_cache VALUES (?, ?, ?, ?)', key + (weather,))
+
+    def stats(self):
+        """Return counters of lookups served from memory, from the table, and missed altogether"""
+        memory = self.memory.stats()
+        lookups = memory['hits'] + memory['misses']
+        misses = memory['misses'] - self.disk_hits
+        return {
+            'size': memory['size'],
+            'maxsize': memory['maxsize'],
+            'memory_hits': memory['hits'],
+            'disk_hits': self.disk_hits,
+            'misses': misses,
+            'hit_rate': (lookups - misses) / lookups if lookups else 0,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+class CircuitBreaker:
+    """Stop calling a failing service for a while, so callers fail fast instead of piling up on it.
+
+    The circuit opens after `threshold` failures in a row. Once `reset_timeout` seconds have passed,
+    one trial call is let through: the circuit closes if it succeeds and opens again if it fails.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.rejected = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self._trial or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        """Return whether a call may go ahead"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._trial = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self.opened_at is None and self.failures >= self.threshold):
+                logger.warning(f'Circuit opened after {self.failures} failures in a row')
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+    def stats(self):
+        return {'state': self.state, 'failures': self.failures, 'rejected': self.rejected}
 
 
 class WeatherAPI:
-    """Request weather data from open weather: api.openweathermap.org"""
+    """Request weather data from open weather: api.openweathermap.org
+
+    Requests share a pool of keep-alive connections, time out, and are retried with backoff on
+    connection errors and 429/5xx responses. When the API keeps failing, the circuit breaker
+    answers 'Unknown' straight away until it has had time to recover.
+    """
 
     APPID = ''
-    URL = 'http://api.openweathermap.org/data/2.5/onecall/timemachine'
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, cache=None, url=WEATHER_API_URL, timeout=(WEATHER_CONNECT_TIMEOUT, WEATHER_READ_TIMEOUT),
+                 retries=WEATHER_RETRIES, backoff=WEATHER_RETRY_BACKOFF,
+                 breaker=None):
+        """
+        :param cache: a WeatherCache to look up before calling the API, or None to always call it
+        :param url: the URL of the API
+        :param timeout: a tuple of the connect and read timeouts in seconds
+        :param retries: the number of times a failed request is retried
+        :param backoff: the backoff factor between retries in seconds, doubled for every retry
+        :param breaker: a CircuitBreaker, one with the configured threshold and reset timeout if None
+        """
+        self.cache = cache
+        self.in_flight = SingleFlight()
+        self.url = url
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker(WEATHER_BREAKER_THRESHOLD, WEATHER_BREAKER_RESET_TIMEOUT)
+
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=self.RETRY_STATUSES,
+                      allowed_methods=['GET'], raise_on_status=False)
+        # One connection per worker thread looking up weather
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(WEATHER_WORKERS, 1), max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = 'application/json'
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
     def http_get(self, params):
+        if not self.breaker.allow():
+            logger.warning('Weather API is failing, skip the request')
+            return None
+
         params['appid'] = self.APPID
-        resp = requests.get(self.URL,
-                            headers={"Content-Type": "application/json"},
-                            params=params)
+        try:
+            resp = self.session.get(self.url, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            logger.error(f'ERROR: weather request failed: {e}')
+            return None
+
+        # A 4xx is an answer about this request, e.g. a date too far back, not a sign the API is down
+        if resp.status_code >= 500 or resp.status_code == 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
         if resp.status_code == 200:
             data = resp.json()
             return data
@@ -22,9 +208,29 @@ class WeatherAPI:
             logger.error(msg)
 
     def get_weather(self, date, lat, lon):
+        if self.cache is not None:
+            weather = self.cache.get(date, lat, lon)
+            if weather is not None:
+                return weather
+            key = self.cache.make_key(date, lat, lon)
+        else:
+            key = (date, lat, lon)
+
+        # Concurrent lookups of the same grid cell share one request
+        return self.in_flight.do(key, lambda: self.fetch_weather(date, lat, lon))
+
+    def fetch_weather(self, date, lat, lon):
         dt = round(datetime.datetime.combine(date, datetime.datetime.min.time()).timestamp())
         data = self.http_get({'dt': dt, 'lon': lon, 'lat': lat})
         if data:
-            return data['current']['weather'][0]['main']
+            weather = data['current']['weather'][0]['main']
+            if self.cache is not None:
+                self.cache.set(date, lat, lon, weather)
+            return weather
         else:
-            return 'Unknown'
+            # Not cached, the API may have the answer next time
+            return UNKNOWN_WEATHER
+
+    def stats(self):
+        """Return the state of the circuit breaker and the number of lookups that shared another one's request"""
+        return dict(self.breaker.stats(), **self.in_flight.stats())
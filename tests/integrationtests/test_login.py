@@ -85,3 +85,45 @@ class TestLogin(TestCase):
             {'username': 'jeffreywood', 'forename': 'Jeffrey', 'surname': 'Wood', 'email': 'jeffrey.wood@gmail.com', 'role': 'user', 'token': ''}
         ]
         self.assertEqual(result, expected)
+
+    def test_logout_invalidates_cached_token(self):
+        headers = {'content-type': 'application/json', 'Authorization': self.user_token}
+        resp = self.client.get('/record', headers=headers)
+        self.assertEqual(resp.status_code, 200)
+
+        self.client.get('/logout', headers=headers)
+        resp = self.client.get('/record', headers=headers)
+        self.assertEqual(resp.status_code, 401)
+
+    def test_login_invalidates_cached_token(self):
+        self.assertEqual('tonyfoltz', dbs.get_token_owner(self.user_token).username)
+
+        params = {'username': 'tonyfoltz', 'password': '7e24'}
+        resp = self.client.post('/login', data=json.dumps(params), headers={'content-type': 'application/json'})
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.client.get('/record',
+                               headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 401)
+
+    def test_update_user_invalidates_cached_token(self):
+        self.assertEqual('user', dbs.get_token_owner(self.user_token).role)
+
+        dbs.update_a_user({'username': 'tonyfoltz', 'role': 'staff'}, self.admin_token)
+        self.assertEqual('staff', dbs.get_token_owner(self.user_token).role)
+
+    def test_token_cache_metrics(self):
+        dbs.get_token_owner(self.admin_token)
+        dbs.get_token_owner(self.admin_token)
+
+        resp = self.client.get('/metrics', headers={'content-type': 'application/json', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreaterEqual(resp.json['data']['token_cache']['hits'], 1)
+        self.assertGreaterEqual(resp.json['data']['token_cache']['misses'], 1)
+
+    def test_metrics_need_an_admin_token(self):
+        resp = self.client.get('/metrics', headers={'content-type': 'application/json'})
+        self.assertEqual(resp.status_code, 401)
+
+        resp = self.client.get('/metrics', headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 403)
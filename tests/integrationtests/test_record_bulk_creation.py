@@ -0,0 +1,99 @@
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+import json
+import datetime
+from unittest import TestCase
+import pandas as pd
+from app import app
+from services.db import dbs
+from tests.utils import create_user_table_from_df
+
+
+class TestRecordBulkCreation(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.testing = True
+        cls.client = app.test_client()
+
+        cls.admin_token = 'a2258791-5dee-4cf7-a84c-56f35bdf1bc7'
+        cls.staff_token = 'f7462ade-e762-40d8-8bce-1dfa47ad1fff'
+        cls.user_token = '762b3b20-e7e3-4590-ae5a-a2abee69f50e'
+
+        cls.user_df = pd.DataFrame(
+            columns=['username', 'password', 'forename', 'surname', 'email', 'role', 'token'],
+            data=[
+                ['yiluzhu', '4a0c', 'Yilu', 'Zhu', 'yilu.zhu@gmail.com', 'admin', cls.admin_token],
+                ['alexzhu', 'c612', 'Alex', 'Zhu', 'alex.zhu@gmail.com', 'staff', cls.staff_token],
+                ['tonyfoltz', '7e24', 'Tony', 'Foltz', 'tony.foltz@gmail.com', 'user', cls.user_token],
+                ['jeffreywood', '7e24', 'Jeffrey', 'Wood', 'jeffrey.wood@gmail.com', 'user', ''],
+            ]
+        )
+        cls.rows = [
+            {'username': 'tonyfoltz', 'date': '2020-09-23', 'lat': 38.7, 'lon': 46.2, 'distance': 9369, 'time': 25, 'weather': 'Clouds'},
+            {'username': 'jeffreywood', 'date': '2020-09-21', 'lat': -26.2, 'lon': -82.0, 'distance': 8251, 'time': 10, 'weather': 'Clear'},
+            {'username': 'tonyfoltz', 'date': '2020-09-22', 'lat': -8.3, 'lon': 37.9, 'distance': 3979, 'time': 13, 'weather': 'Clear'},
+        ]
+
+        create_user_table_from_df(cls.user_df, cls.admin_token)
+
+    @classmethod
+    def tearDownClass(cls):
+        dbs.clear_user_table()
+
+    def tearDown(self):
+        dbs.clear_record_table()
+
+    def test_bulk_create_unauthenticated(self):
+        resp = self.client.post('/records/bulk', data=json.dumps(self.rows), headers={'content-type': 'application/json', 'Authorization': 'dummy token'})
+        self.assertEqual(resp.status_code, 401)
+
+    def test_bulk_create_admin_role(self):
+        resp = self.client.post('/records/bulk', data=json.dumps(self.rows), headers={'content-type': 'application/json', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(3, resp.json['created'])
+        self.assertEqual([], resp.json['errors'])
+
+        result = dbs.read_records(self.admin_token, {})
+        self.assertEqual([9369, 8251, 3979], [r['distance'] for r in result])
+
+    def test_bulk_create_user_role(self):
+        resp = self.client.post('/records/bulk', data=json.dumps(self.rows), headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(2, resp.json['created'])
+        self.assertEqual([1], [e['index'] for e in resp.json['errors']])
+        self.assertIn('Permission Denied', resp.json['errors'][0]['msg'])
+
+        result = dbs.read_records(self.admin_token, {})
+        self.assertEqual([9369, 3979], [r['distance'] for r in result])
+
+        report = dbs.make_weekly_report(self.user_token, datetime.date(2020, 9, 21))
+        self.assertEqual((13348, 38, 2), (report['total_distance(meters)'], report['total_time(minutes)'], report['runs']))
+
+    def test_bulk_create_reports_invalid_rows(self):
+        rows = [
+            {'username': 'unknown', 'date': '2020-09-23', 'lat': 38.7, 'lon': 46.2, 'distance': 9369, 'time': 25, 'weather': 'Clouds'},
+            {'username': 'tonyfoltz', 'date': '23/09/2020', 'lat': 38.7, 'lon': 46.2, 'distance': 9369, 'time': 25, 'weather': 'Clouds'},
+            {'username': 'tonyfoltz', 'date': '2020-09-23', 'lat': 38.7, 'lon': 46.2, 'distance': 'far', 'time': 25},
+            {'username': 'tonyfoltz', 'date': '2020-09-23'},
+            'not a record',
+            self.rows[0],
+            {'username': ['tonyfoltz'], 'date': '2020-09-23', 'lat': 38.7, 'lon': 46.2, 'distance': 9369, 'time': 25},
+        ]
+        resp = self.client.post('/records/bulk', data=json.dumps(rows), headers={'content-type': 'application/json', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(1, resp.json['created'])
+        self.assertEqual([0, 1, 2, 3, 4, 6], [e['index'] for e in resp.json['errors']])
+        self.assertIn('unknown user', resp.json['errors'][0]['msg'])
+        self.assertIn('Missing fields: lat, lon, distance, time', resp.json['errors'][3]['msg'])
+        self.assertIn('username must be a string', resp.json['errors'][5]['msg'])
+
+    def test_bulk_create_ndjson(self):
+        body = '\n'.join(json.dumps(row) for row in self.rows) + '\n'
+        resp = self.client.post('/records/bulk', data=body, headers={'content-type': 'application/x-ndjson', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(3, resp.json['created'])
+
+    def test_bulk_create_not_an_array(self):
+        resp = self.client.post('/records/bulk', data=json.dumps(self.rows[0]), headers={'content-type': 'application/json', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 400)
@@ -73,3 +73,22 @@ class TestRecordCreation(TestCase):
             {'date': self.yesterday, 'distance': 9000, 'lat': 38.7, 'lon': 46.2, 'rid': 1, 'time': 25, 'username': 'tonyfoltz', 'weather': ANY},
         ]
         self.assertEqual(result, expected)
+
+    def test_create_record_without_distance_and_time(self):
+        params = {k: v for k, v in self.params.items() if k not in ['distance', 'time']}
+        resp = self.client.put('/record', data=json.dumps(params), headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+
+        self.assertEqual({'speed': 0, 'total_distance(meters)': 0, 'total_time(minutes)': 0, 'runs': 1},
+                         dbs.make_weekly_report(self.user_token, self.yesterday))
+
+    def test_create_record_without_coordinates(self):
+        params = {k: v for k, v in self.params.items() if k not in ['lat', 'lon']}
+        resp = self.client.put('/record', data=json.dumps(params), headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual([], dbs.read_records(self.admin_token, {}))
+
+        params['weather'] = 'Sunny'
+        resp = self.client.put('/record', data=json.dumps(params), headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(['Sunny'], [r['weather'] for r in dbs.read_records(self.admin_token, {})])
@@ -0,0 +1,79 @@
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+import csv
+import json
+from unittest import TestCase
+from unittest.mock import patch
+import pandas as pd
+from app import app
+from services.db import dbs
+from tests.utils import create_user_table_from_df, create_record_table_from_df
+
+
+class TestRecordExport(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.testing = True
+        cls.client = app.test_client()
+
+        cls.admin_token = 'a2258791-5dee-4cf7-a84c-56f35bdf1bc7'
+        cls.user_token = '762b3b20-e7e3-4590-ae5a-a2abee69f50e'
+
+        cls.user_df = pd.DataFrame(
+            columns=['username', 'password', 'forename', 'surname', 'email', 'role', 'token'],
+            data=[
+                ['yiluzhu', '4a0c', 'Yilu', 'Zhu', 'yilu.zhu@gmail.com', 'admin', cls.admin_token],
+                ['tonyfoltz', '7e24', 'Tony', 'Foltz', 'tony.foltz@gmail.com', 'user', cls.user_token],
+                ['jeffreywood', '7e24', 'Jeffrey', 'Wood', 'jeffrey.wood@gmail.com', 'user', ''],
+            ]
+        )
+        cls.record_df = pd.DataFrame(
+            columns=['username', 'date', 'lat', 'lon', 'distance', 'time', 'weather'],
+            data=[
+                ['tonyfoltz', '2020-09-23', 38.7, 46.2, 9369, 25, 'Clouds'],
+                ['jeffreywood', '2020-09-21', -26.2, -82.0, 8251, 10, 'Clear'],
+                ['tonyfoltz', '2020-09-22', -8.3, 37.9, 3979, 13, 'Clear'],
+                ['jeffreywood', '2020-09-24', 13.3, 32.9, 6581, 13, 'Clouds'],
+                ['tonyfoltz', '2020-09-22', 19.3, 144.2, 4951, 45, 'Clouds'],
+            ]
+        )
+
+        create_user_table_from_df(cls.user_df, cls.admin_token)
+        create_record_table_from_df(cls.record_df, cls.admin_token)
+
+    @classmethod
+    def tearDownClass(cls):
+        dbs.clear_record_table()
+        dbs.clear_user_table()
+
+    def test_export_unauthenticated(self):
+        resp = self.client.get('/record/export', headers={'Authorization': 'dummy token'})
+        self.assertEqual(resp.status_code, 401)
+
+    def test_export_invalid_format(self):
+        resp = self.client.get('/record/export?format=xml', headers={'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_export_ndjson_user_role(self):
+        resp = self.client.get("/record/export?filter=distance > 4000", headers={'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual('application/x-ndjson', resp.mimetype)
+
+        expected = [
+            {'date': '2020-09-23', 'distance': 9369, 'lat': 38.7, 'lon': 46.2, 'rid': 1, 'time': 25, 'username': 'tonyfoltz', 'weather': 'Clouds'},
+            {'date': '2020-09-22', 'distance': 4951, 'lat': 19.3, 'lon': 144.2, 'rid': 5, 'time': 45, 'username': 'tonyfoltz', 'weather': 'Clouds'},
+        ]
+        self.assertEqual(expected, [json.loads(line) for line in resp.data.decode().splitlines()])
+
+    def test_export_csv_admin_role(self):
+        # A small batch size makes the export go through several fetches
+        with patch('services.db.EXPORT_BATCH_SIZE', 2):
+            resp = self.client.get('/record/export?format=csv', headers={'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual('text/csv', resp.mimetype)
+
+        rows = list(csv.DictReader(resp.data.decode().splitlines()))
+        self.assertEqual(['1', '2', '3', '4', '5'], [r['rid'] for r in rows])
+        self.assertEqual({'rid': '2', 'username': 'jeffreywood', 'date': '2020-09-21', 'lat': '-26.2', 'lon': '-82.0',
+                          'distance': '8251', 'time': '10', 'weather': 'Clear'}, rows[1])
@@ -118,3 +118,91 @@ class TestRecordReading(TestCase):
         resp = self.client.get("/record?filter=date ==",
                                headers={'content-type': 'application/json', 'Authorization': self.admin_token})
         self.assertEqual(resp.status_code, 400)
+
+    def test_record_paging(self):
+        resp = self.client.get('/record?page=2&pagesize=3',
+                               headers={'content-type': 'application/json', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = [
+            {'date': '2020-09-22', 'distance': 3979, 'lat': -8.3, 'lon': 37.9, 'rid': 4, 'time': 13, 'username': 'tonyfoltz', 'weather': 'Clear'},
+            {'date': '2020-09-24', 'distance': 5131, 'lat': 51.0, 'lon': -119.8, 'rid': 5, 'time': 29, 'username': 'antoniasimcox', 'weather': 'Rain'},
+            {'date': '2020-09-23', 'distance': 8743, 'lat': 27.1, 'lon': 19.9, 'rid': 6, 'time': 43, 'username': 'tonyfoltz', 'weather': 'Clear'},
+        ]
+        self.assertEqual(expected, resp.json['data'])
+        self.assertNotIn('total', resp.json)
+
+    def test_record_paging_with_total(self):
+        resp = self.client.get('/record?page=2&pagesize=3&with_total=1',
+                               headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = [
+            {'date': '2020-09-22', 'distance': 4951, 'lat': 19.3, 'lon': 144.2, 'rid': 8, 'time': 45, 'username': 'tonyfoltz', 'weather': 'Clouds'},
+        ]
+        self.assertEqual(expected, resp.json['data'])
+        self.assertEqual(4, resp.json['total'])
+
+    def test_record_invalid_paging(self):
+        resp = self.client.get('/record?page=0',
+                               headers={'content-type': 'application/json', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_record_cursor_paging(self):
+        headers = {'content-type': 'application/json', 'Authorization': self.admin_token}
+        resp = self.client.get('/record?after=&pagesize=4', headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([2, 3, 4, 8], [r['rid'] for r in resp.json['data']])
+
+        resp = self.client.get(f"/record?after={resp.json['next_cursor']}&pagesize=4", headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([1, 6, 5, 7], [r['rid'] for r in resp.json['data']])
+
+        resp = self.client.get(f"/record?after={resp.json['next_cursor']}&pagesize=4", headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([9, 10], [r['rid'] for r in resp.json['data']])
+        self.assertIsNone(resp.json['next_cursor'])
+
+    def test_record_cursor_paging_with_filter(self):
+        headers = {'content-type': 'application/json', 'Authorization': self.user_token}
+        resp = self.client.get("/record?after=&pagesize=2&filter=distance > 4000", headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([8, 1], [r['rid'] for r in resp.json['data']])
+
+        resp = self.client.get(f"/record?after={resp.json['next_cursor']}&pagesize=2&filter=distance > 4000", headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([6], [r['rid'] for r in resp.json['data']])
+        self.assertIsNone(resp.json['next_cursor'])
+
+    def test_record_invalid_cursor(self):
+        resp = self.client.get('/record?after=abc',
+                               headers={'content-type': 'application/json', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_record_fields(self):
+        resp = self.client.get("/record?fields=date,distance,time&filter=date == '2020-09-23'",
+                               headers={'content-type': 'application/json', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = [
+            {'date': '2020-09-23', 'distance': 9369, 'time': 25},
+            {'date': '2020-09-23', 'distance': 8743, 'time': 43},
+        ]
+        self.assertEqual(expected, resp.json['data'])
+
+    def test_record_fields_with_cursor(self):
+        resp = self.client.get('/record?fields=distance&after=&pagesize=2',
+                               headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = [
+            {'date': '2020-09-22', 'distance': 3979, 'rid': 4},
+            {'date': '2020-09-22', 'distance': 4951, 'rid': 8},
+        ]
+        self.assertEqual(expected, resp.json['data'])
+        self.assertIsNotNone(resp.json['next_cursor'])
+
+    def test_record_invalid_fields(self):
+        resp = self.client.get('/record?fields=date,speed',
+                               headers={'content-type': 'application/json', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 400)
@@ -4,9 +4,12 @@ os.environ['IN_MEMORY_DB'] = 'Y'
 import json
 from datetime import date
 from unittest import TestCase
+from unittest.mock import patch
 import pandas as pd
+from sqlalchemy import update
 from app import app
 from services.db import dbs
+from db.models import JoggingInfo
 from tests.utils import create_user_table_from_df, create_record_table_from_df
 
 
@@ -96,3 +99,58 @@ class TestRecordUpdate(TestCase):
             {'date': date(2020, 9, 23), 'distance': 8743, 'lat': 27.1, 'lon': 19.9, 'rid': 4, 'time': 43, 'username': 'tonyfoltz', 'weather': 'Clear'},
         ]
         self.assertEqual(result, expected)
+
+    def get_records(self, token):
+        resp = self.client.get('/record', headers={'content-type': 'application/json', 'Authorization': token})
+        self.assertEqual(resp.status_code, 200)
+        return resp.json['data']
+
+    def test_repeated_read_is_served_from_cache(self):
+        first = self.get_records(self.user_token1)
+        with patch.object(dbs, 'read_records', side_effect=AssertionError('read from the database')):
+            self.assertEqual(first, self.get_records(self.user_token1))
+
+    def test_update_invalidates_cached_reads_of_the_owner_and_admins(self):
+        for token in [self.admin_token, self.user_token1, self.user_token2]:
+            self.get_records(token)
+
+        resp = self.client.post('/record', data=json.dumps(self.params), headers={'content-type': 'application/json', 'Authorization': self.user_token1})
+        self.assertEqual(resp.status_code, 200)
+
+        with patch.object(dbs, 'read_records', wraps=dbs.read_records) as read_records:
+            self.assertEqual(5000, self.get_records(self.user_token1)[1]['distance'])
+            self.assertEqual(5000, self.get_records(self.admin_token)[1]['distance'])
+            self.get_records(self.user_token2)
+        self.assertEqual([self.user_token1, self.admin_token], [c.args[0] for c in read_records.call_args_list])
+
+    def test_update_changes_etags_of_the_owner_and_admins(self):
+        etags = {}
+        for token in [self.admin_token, self.user_token1, self.user_token2]:
+            resp = self.client.get('/record', headers={'content-type': 'application/json', 'Authorization': token})
+            etags[token] = resp.headers['ETag']
+
+        resp = self.client.post('/record', data=json.dumps(self.params), headers={'content-type': 'application/json', 'Authorization': self.user_token1})
+        self.assertEqual(resp.status_code, 200)
+
+        status_codes = []
+        for token in [self.admin_token, self.user_token1, self.user_token2]:
+            headers = {'content-type': 'application/json', 'Authorization': token, 'If-None-Match': etags[token]}
+            status_codes.append(self.client.get('/record', headers=headers).status_code)
+        self.assertEqual([200, 200, 304], status_codes)
+
+    def test_write_of_another_process_is_not_served_from_cache(self):
+        resp = self.client.get('/record', headers={'content-type': 'application/json', 'Authorization': self.user_token1})
+        etag = resp.headers['ETag']
+
+        # What another process does: change the record and its data version, but not the generations of this one
+        dbs.session.execute(update(JoggingInfo.__table__).where(JoggingInfo.rid == 2).values(distance=1000))
+        dbs.jogging_table.bump_data_versions(['tonyfoltz'])
+        dbs.session.commit()
+
+        headers = {'content-type': 'application/json', 'Authorization': self.user_token1, 'If-None-Match': etag}
+        resp = self.client.get('/record', headers=headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(1000, resp.json['data'][1]['distance'])
+
+        headers['If-None-Match'] = resp.headers['ETag']
+        self.assertEqual(304, self.client.get('/record', headers=headers).status_code)
@@ -1,10 +1,13 @@
 import os
 os.environ['IN_MEMORY_DB'] = 'Y'
 
+import datetime
 from unittest import TestCase
+from unittest.mock import patch
 import pandas as pd
 from app import app
 from services.db import dbs
+from db.models import WeeklySummary
 from tests.utils import create_user_table_from_df, create_record_table_from_df
 
 
@@ -60,6 +63,125 @@ class TestReport(TestCase):
         resp = self.client.get("/report?week_start_date=2020-09-21", headers={'content-type': 'application/json', 'Authorization': self.user_token})
         self.assertEqual(resp.status_code, 200)
 
-        expected = {'speed': 214.61904761904762, 'total_distance(meters)': 27042, 'total_time(minutes)': 126}
+        expected = {'speed': 214.61904761904762, 'total_distance(meters)': 27042, 'total_time(minutes)': 126, 'runs': 4}
         self.assertEqual(expected, resp.json['data'])
 
+    def test_make_report_for_week_without_runs(self):
+        resp = self.client.get("/report?week_start_date=2020-09-28", headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = {'speed': 0, 'total_distance(meters)': 0, 'total_time(minutes)': 0, 'runs': 0}
+        self.assertEqual(expected, resp.json['data'])
+
+    def test_make_report_for_window_not_starting_on_monday(self):
+        resp = self.client.get("/report?week_start_date=2020-09-23", headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = {'speed': 18112 / 68, 'total_distance(meters)': 18112, 'total_time(minutes)': 68, 'runs': 2}
+        self.assertEqual(expected, resp.json['data'])
+
+    def test_report_follows_record_changes(self):
+        week = {'field': 'date', 'op': '==', 'value': '2020-09-27'}
+        dbs.create_a_record({'username': 'tonyfoltz', 'date': '2020-09-27', 'lat': 1.0, 'lon': 2.0, 'distance': 1000,
+                             'time': 10, 'weather': 'Clear'}, self.user_token)
+        rid = dbs.read_records(self.user_token, week)[0]['rid']
+        self.assertEqual({'speed': 28042 / 136, 'total_distance(meters)': 28042, 'total_time(minutes)': 136, 'runs': 5},
+                         dbs.make_weekly_report(self.user_token, datetime.date(2020, 9, 21)))
+
+        dbs.update_a_record({'rid': rid, 'username': 'tonyfoltz', 'date': '2020-09-28', 'distance': 2000}, self.user_token)
+        self.assertEqual({'speed': 200, 'total_distance(meters)': 2000, 'total_time(minutes)': 10, 'runs': 1},
+                         dbs.make_weekly_report(self.user_token, datetime.date(2020, 9, 28)))
+        self.assertEqual(4, dbs.make_weekly_report(self.user_token, datetime.date(2020, 9, 21))['runs'])
+
+        dbs.delete_a_record(rid, self.user_token)
+        self.assertEqual({'speed': 0, 'total_distance(meters)': 0, 'total_time(minutes)': 0, 'runs': 0},
+                         dbs.make_weekly_report(self.user_token, datetime.date(2020, 9, 28)))
+        self.assertEqual(0, dbs.session.query(WeeklySummary).filter(WeeklySummary.iso_week == 40).count())
+
+    def test_rebuild_weekly_summary(self):
+        dbs.session.query(WeeklySummary).delete()
+        dbs.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['rebuild-weekly-summary'])
+        self.assertEqual(0, result.exit_code)
+
+        resp = self.client.get("/report?week_start_date=2020-09-21", headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(27042, resp.json['data']['total_distance(meters)'])
+        self.assertEqual(2, dbs.session.query(WeeklySummary).count())
+
+    def test_make_report_series_by_week(self):
+        resp = self.client.get("/report/series?from=2020-09-16&to=2020-10-01", headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = [
+            {'start': '2020-09-14', 'speed': 0, 'total_distance(meters)': 0, 'total_time(minutes)': 0, 'runs': 0},
+            {'start': '2020-09-21', 'speed': 214.61904761904762, 'total_distance(meters)': 27042, 'total_time(minutes)': 126, 'runs': 4},
+            {'start': '2020-09-28', 'speed': 0, 'total_distance(meters)': 0, 'total_time(minutes)': 0, 'runs': 0},
+        ]
+        self.assertEqual(expected, resp.json['data'])
+
+    def test_make_report_series_by_month(self):
+        resp = self.client.get("/report/series?from=2020-08-31&to=2020-10-01&bucket=month", headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+
+        self.assertEqual(['2020-08-01', '2020-09-01', '2020-10-01'], [r['start'] for r in resp.json['data']])
+        self.assertEqual([0, 4, 0], [r['runs'] for r in resp.json['data']])
+        self.assertEqual(27042, resp.json['data'][1]['total_distance(meters)'])
+
+    def test_make_report_series_by_month_without_distance_and_time(self):
+        dbs.create_a_record({'username': 'tonyfoltz', 'date': '2020-11-03', 'lat': 1.0, 'lon': 2.0, 'weather': 'Clear'}, self.user_token)
+        rid = dbs.read_records(self.user_token, {'field': 'date', 'op': '==', 'value': '2020-11-03'})[0]['rid']
+        try:
+            resp = self.client.get("/report/series?from=2020-11-01&to=2020-11-30&bucket=month", headers={'content-type': 'application/json', 'Authorization': self.user_token})
+            self.assertEqual(resp.status_code, 200)
+
+            expected = [{'start': '2020-11-01', 'speed': 0, 'total_distance(meters)': 0, 'total_time(minutes)': 0, 'runs': 1}]
+            self.assertEqual(expected, resp.json['data'])
+        finally:
+            dbs.delete_a_record(rid, self.user_token)
+
+    def test_make_report_series_across_years(self):
+        resp = self.client.get("/report/series?from=2019-12-25&to=2020-01-08", headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(['2019-12-23', '2019-12-30', '2020-01-06'], [r['start'] for r in resp.json['data']])
+
+    def test_make_report_series_unauthenticated(self):
+        resp = self.client.get("/report/series?from=2020-09-01&to=2020-10-01", headers={'content-type': 'application/json', 'Authorization': 'dummy'})
+        self.assertEqual(resp.status_code, 401)
+
+    def test_make_report_series_invalid_arguments(self):
+        for query in ['from=2020-09-01', 'from=2020-10-01&to=2020-09-01', 'from=2020-09-01&to=2020-10-01&bucket=day',
+                      'from=2000-01-01&to=2020-01-01', 'from=0001-01-01&to=9999-12-31',
+                      'from=0001-01-01&to=9999-12-31&bucket=month']:
+            resp = self.client.get(f"/report/series?{query}", headers={'content-type': 'application/json', 'Authorization': self.user_token})
+            self.assertEqual(resp.status_code, 400, query)
+
+    def test_report_not_modified(self):
+        url = '/report?week_start_date=2020-09-21'
+        resp = self.client.get(url, headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        etag = resp.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        headers = {'content-type': 'application/json', 'Authorization': self.user_token, 'If-None-Match': etag}
+        with patch.object(dbs, 'make_weekly_report', side_effect=AssertionError('made the report')):
+            resp = self.client.get(url, headers=headers)
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(etag, resp.headers['ETag'])
+
+        # The ETag of another week, or of the same week after a change, is different
+        resp = self.client.get('/report?week_start_date=2020-09-28', headers=headers)
+        self.assertEqual(200, resp.status_code)
+        dbs.create_a_record({'username': 'tonyfoltz', 'date': '2020-10-27', 'lat': 1.0, 'lon': 2.0, 'distance': 1000,
+                             'time': 10, 'weather': 'Clear'}, self.user_token)
+        dbs.delete_a_record(dbs.read_records(self.user_token, {'field': 'date', 'op': '==', 'value': '2020-10-27'})[0]['rid'],
+                            self.user_token)
+        resp = self.client.get(url, headers=headers)
+        self.assertEqual(200, resp.status_code)
+        self.assertNotEqual(etag, resp.headers['ETag'])
+
+    def test_report_series_not_modified(self):
+        url = '/report/series?from=2020-09-16&to=2020-10-01'
+        resp = self.client.get(url, headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        headers = {'content-type': 'application/json', 'Authorization': self.user_token, 'If-None-Match': resp.headers['ETag']}
+        resp = self.client.get(url, headers=headers)
+        self.assertEqual(304, resp.status_code)
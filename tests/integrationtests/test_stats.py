@@ -0,0 +1,144 @@
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+from unittest import TestCase
+import pandas as pd
+from app import app
+from services.db import dbs
+from tests.utils import create_user_table_from_df, create_record_table_from_df
+
+
+class TestLeaderboard(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.testing = True
+        cls.client = app.test_client()
+
+        cls.admin_token = 'a2258791-5dee-4cf7-a84c-56f35bdf1bc7'
+        cls.staff_token = 'f7462ade-e762-40d8-8bce-1dfa47ad1fff'
+        cls.user_token = '762b3b20-e7e3-4590-ae5a-a2abee69f50e'
+
+        cls.user_df = pd.DataFrame(
+            columns=['username', 'password', 'forename', 'surname', 'email', 'role', 'token'],
+            data=[
+                ['yiluzhu', '4a0c', 'Yilu', 'Zhu', 'yilu.zhu@gmail.com', 'admin', cls.admin_token],
+                ['alexzhu', 'c612', 'Alex', 'Zhu', 'alex.zhu@gmail.com', 'staff', cls.staff_token],
+                ['tonyfoltz', '7e24', 'Tony', 'Foltz', 'tony.foltz@gmail.com', 'user', cls.user_token],
+                ['jeffreywood', '7e24', 'Jeffrey', 'Wood', 'jeffrey.wood@gmail.com', 'user', ''],
+                ['antoniasimcox', '7e24', 'Antonia', 'Simcox', 'antonia.simcox@gmail.com', 'user', ''],
+            ]
+        )
+        cls.record_df = pd.DataFrame(
+            columns=['username', 'date', 'lat', 'lon', 'distance', 'time', 'weather'],
+            data=[
+                ['tonyfoltz', '2020-09-23', 38.7, 46.2, 9369, 25, 'Clouds'],
+                ['jeffreywood', '2020-09-21', -26.2, -82.0, 8251, 10, 'Clear'],
+                ['jeffreywood', '2020-09-21', 37.8, -145.6, 7572, 7, 'Clouds'],
+                ['tonyfoltz', '2020-09-22', -8.3, 37.9, 3979, 13, 'Clear'],
+                ['jeffreywood', '2020-09-24', 51.0, -119.8, 5131, 29, 'Rain'],
+                ['tonyfoltz',  '2020-09-23', 27.1, 19.9, 8743, 43, 'Clear'],
+                ['jeffreywood', '2020-09-24', 13.3, 32.9, 6581, 13, 'Clouds'],
+                ['tonyfoltz', '2020-09-22', 19.3, 144.2, 4951, 45, 'Clouds'],
+                ['jeffreywood',  '2020-09-25', -46.3, -24.4, 5337, 50, 'Clouds'],
+                ['jeffreywood', '2020-09-25', 46.5, -177.4, 3223, 39, 'Rain'],
+                ['antoniasimcox', '2020-10-02', 46.5, -177.4, 3000, 20, 'Rain'],
+            ]
+        )
+
+        create_user_table_from_df(cls.user_df, cls.admin_token)
+        create_record_table_from_df(cls.record_df, cls.admin_token)
+
+    @classmethod
+    def tearDownClass(cls):
+        dbs.clear_record_table()
+        dbs.clear_user_table()
+
+    def setUp(self):
+        dbs.stats_cache.clear()
+
+    def get_leaderboard(self, query, token=None):
+        return self.client.get(f"/stats/leaderboard?{query}", headers={'content-type': 'application/json', 'Authorization': token or self.admin_token})
+
+    def test_leaderboard_unauthenticated(self):
+        resp = self.get_leaderboard('period=week&date=2020-09-23', 'dummy')
+        self.assertEqual(resp.status_code, 401)
+
+    def test_leaderboard_non_admin_role(self):
+        for token in [self.staff_token, self.user_token]:
+            resp = self.get_leaderboard('period=week&date=2020-09-23', token)
+            self.assertEqual(resp.status_code, 403)
+
+    def test_leaderboard_by_distance(self):
+        resp = self.get_leaderboard('period=week&metric=distance&date=2020-09-23')
+        self.assertEqual(resp.status_code, 200)
+
+        data = resp.json['data']
+        self.assertEqual(('2020-09-21', '2020-09-27'), (data['start'], data['end']))
+        expected = [
+            {'rank': 1, 'username': 'jeffreywood', 'value': 36095},
+            {'rank': 2, 'username': 'tonyfoltz', 'value': 27042},
+        ]
+        self.assertEqual(expected, data['leaderboard'])
+        self.assertEqual({'total_distance(meters)': 63137, 'total_time(minutes)': 274, 'speed': 63137 / 274,
+                          'runs': 10, 'runners': 2}, data['totals'])
+
+    def test_leaderboard_by_runs_with_limit(self):
+        resp = self.get_leaderboard('period=month&metric=runs&limit=1&date=2020-09-01')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([{'rank': 1, 'username': 'jeffreywood', 'value': 6}], resp.json['data']['leaderboard'])
+
+    def test_leaderboard_of_all_time(self):
+        resp = self.get_leaderboard('period=all&metric=time')
+        self.assertEqual(resp.status_code, 200)
+
+        data = resp.json['data']
+        self.assertEqual((None, None), (data['start'], data['end']))
+        self.assertEqual(['jeffreywood', 'tonyfoltz', 'antoniasimcox'], [r['username'] for r in data['leaderboard']])
+        self.assertEqual(3, data['totals']['runners'])
+
+    def test_leaderboard_counts_missing_distance_as_zero(self):
+        dbs.create_a_record({'username': 'tonyfoltz', 'date': '2020-11-03', 'lat': 1.0, 'lon': 2.0,
+                             'distance': 1000, 'time': 10, 'weather': 'Clear'}, self.admin_token)
+        dbs.create_a_record({'username': 'jeffreywood', 'date': '2020-11-04', 'lat': 1.0, 'lon': 2.0,
+                             'weather': 'Clear'}, self.admin_token)
+        try:
+            resp = self.get_leaderboard('period=week&metric=distance&date=2020-11-03')
+            self.assertEqual(resp.status_code, 200)
+
+            expected = [
+                {'rank': 1, 'username': 'tonyfoltz', 'value': 1000},
+                {'rank': 2, 'username': 'jeffreywood', 'value': 0},
+            ]
+            self.assertEqual(expected, resp.json['data']['leaderboard'])
+        finally:
+            week = {'field': 'date', 'op': '>=', 'value': '2020-11-02'}
+            for record in dbs.read_records(self.admin_token, week):
+                dbs.delete_a_record(record['rid'], self.admin_token)
+
+    def test_leaderboard_invalid_arguments(self):
+        for query in ['period=day', 'metric=speed', 'limit=0', 'limit=ten', 'date=23/09/2020']:
+            resp = self.get_leaderboard(query)
+            self.assertEqual(resp.status_code, 400, query)
+
+    def test_leaderboard_is_cached_until_records_of_the_period_change(self):
+        self.get_leaderboard('period=week&date=2020-09-23')
+        hits = dbs.stats_cache.stats()['hits']
+        self.get_leaderboard('period=week&date=2020-09-21')
+        self.assertEqual(hits + 1, dbs.stats_cache.stats()['hits'])
+
+        dbs.create_a_record({'username': 'antoniasimcox', 'date': '2020-10-05', 'lat': 1.0, 'lon': 2.0,
+                             'distance': 50000, 'time': 300, 'weather': 'Clear'}, self.admin_token)
+        self.assertEqual(1, len(dbs.stats_cache))
+
+        dbs.create_a_record({'username': 'antoniasimcox', 'date': '2020-09-26', 'lat': 1.0, 'lon': 2.0,
+                             'distance': 50000, 'time': 300, 'weather': 'Clear'}, self.admin_token)
+        self.assertEqual(0, len(dbs.stats_cache))
+
+        resp = self.get_leaderboard('period=week&date=2020-09-23')
+        self.assertEqual({'rank': 1, 'username': 'antoniasimcox', 'value': 50000}, resp.json['data']['leaderboard'][0])
+
+        for date in ['2020-10-05', '2020-09-26']:
+            rid = dbs.read_records(self.admin_token, {'field': 'date', 'op': '==', 'value': date})[0]['rid']
+            dbs.delete_a_record(rid, self.admin_token)
+        resp = self.get_leaderboard('period=week&date=2020-09-23')
+        self.assertEqual('jeffreywood', resp.json['data']['leaderboard'][0]['username'])
@@ -0,0 +1,157 @@
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+import json
+from unittest import TestCase
+from unittest.mock import patch
+import pandas as pd
+from sqlalchemy import exc
+from app import app
+from db.models import UserInfo
+from services.db import dbs
+from tests.utils import create_user_table_from_df
+
+
+class TestUserBulkCreation(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        app.testing = True
+        cls.client = app.test_client()
+
+        cls.admin_token = 'a2258791-5dee-4cf7-a84c-56f35bdf1bc7'
+        cls.staff_token = 'f7462ade-e762-40d8-8bce-1dfa47ad1fff'
+        cls.user_token = '762b3b20-e7e3-4590-ae5a-a2abee69f50e'
+
+        cls.user_df = pd.DataFrame(
+            columns=['username', 'password', 'forename', 'surname', 'email', 'role', 'token'],
+            data=[
+                ['yiluzhu', '4a0c', 'Yilu', 'Zhu', 'yilu.zhu@gmail.com', 'admin', cls.admin_token],
+                ['alexzhu', 'c612', 'Alex', 'Zhu', 'alex.zhu@gmail.com', 'staff', cls.staff_token],
+                ['tonyfoltz', '7e24', 'Tony', 'Foltz', 'tony.foltz@gmail.com', 'user', cls.user_token],
+            ]
+        )
+
+        cls.rows = [
+            {'forename': 'Jeffrey', 'surname': 'Wood', 'username': 'jeffreywood', 'password': '7e24', 'email': 'jeffrey.wood@gmail.com'},
+            {'forename': 'Tony', 'surname': 'Foltz', 'username': 'tonyfoltz', 'password': '7e24', 'email': 'tony.foltz@gmail.com'},
+            {'forename': 'Antonia', 'surname': 'Simcox', 'username': 'antoniasimcox', 'email': 'antonia.simcox@gmail.com'},
+            {'forename': 'Jeffrey', 'surname': 'Wood', 'username': 'jeffreywood', 'password': '7e24', 'email': 'jeffrey.wood@gmail.com'},
+            {'forename': 'Helen', 'surname': 'Kelly', 'username': 'helenkelly', 'password': 'abc', 'email': 'helen.kelly@gmail.com', 'role': 'staff'},
+        ]
+
+    def setUp(self):
+        create_user_table_from_df(self.user_df, self.admin_token)
+
+    def tearDown(self):
+        dbs.clear_user_table()
+
+    def test_bulk_create_unauthenticated(self):
+        resp = self.client.put('/users/bulk', data=json.dumps(self.rows), headers={'content-type': 'application/json', 'Authorization': 'dummy token'})
+        self.assertEqual(resp.status_code, 401)
+
+    def test_bulk_create_user_role(self):
+        resp = self.client.put('/users/bulk', data=json.dumps(self.rows), headers={'content-type': 'application/json', 'Authorization': self.user_token})
+        self.assertEqual(resp.status_code, 403)
+
+    def test_bulk_create_not_an_array(self):
+        resp = self.client.put('/users/bulk', data=json.dumps(self.rows[0]), headers={'content-type': 'application/json', 'Authorization': self.staff_token})
+        self.assertEqual(resp.status_code, 400)
+
+    def check_bulk_create(self):
+        resp = self.client.put('/users/bulk', data=json.dumps(self.rows), headers={'content-type': 'application/json', 'Authorization': self.staff_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = [
+            ('jeffreywood', 'created'),
+            ('tonyfoltz', 'duplicate'),
+            ('antoniasimcox', 'invalid'),
+            ('jeffreywood', 'duplicate'),
+            ('helenkelly', 'created'),
+        ]
+        self.assertEqual(expected, [(r['username'], r['status']) for r in resp.json['data']])
+
+        result = dbs.read_user_info(self.admin_token, {'field': 'username', 'op': 'in', 'value': ['jeffreywood', 'helenkelly']})
+        expected = [
+            {'username': 'jeffreywood', 'forename': 'Jeffrey', 'surname': 'Wood', 'email': 'jeffrey.wood@gmail.com', 'role': 'user', 'token': ''},
+            {'username': 'helenkelly', 'forename': 'Helen', 'surname': 'Kelly', 'email': 'helen.kelly@gmail.com', 'role': 'staff', 'token': ''},
+        ]
+        self.assertCountEqual(expected, result)
+
+        params = {'username': 'helenkelly', 'password': 'abc'}
+        resp = self.client.post('/login', data=json.dumps(params), headers={'content-type': 'application/json'})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_bulk_create(self):
+        self.check_bulk_create()
+
+    def test_bulk_create_in_small_chunks(self):
+        with patch('services.db.BULK_CHUNK_SIZE', 2):
+            self.check_bulk_create()
+
+    def test_bulk_create_invalid_types(self):
+        rows = [
+            {'username': 'jeffreywood', 'password': 123},
+            {'username': ['helenkelly'], 'password': 'abc'},
+            {'username': 'antoniasimcox', 'password': 'abc', 'token': 42},
+            {'username': 'helenkelly', 'password': 'abc'},
+        ]
+        resp = self.client.put('/users/bulk', data=json.dumps(rows), headers={'content-type': 'application/json', 'Authorization': self.staff_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = [
+            (rows[0]['username'], 'invalid'),
+            (rows[1]['username'], 'invalid'),
+            (rows[2]['username'], 'invalid'),
+            (rows[3]['username'], 'created'),
+        ]
+        self.assertEqual(expected, [(r['username'], r['status']) for r in resp.json['data']])
+        self.assertEqual('Field password must be a string, got 123', resp.json['data'][0]['msg'])
+
+    def test_bulk_create_is_one_transaction(self):
+        execute = dbs.session.execute
+        inserts = []
+
+        def fail_every_second_insert(statement, *args, **kwargs):
+            if getattr(statement, 'is_insert', False):
+                inserts.append(statement)
+                if len(inserts) % 2 == 0:
+                    raise exc.IntegrityError('INSERT', {}, Exception('taken by another process'))
+            return execute(statement, *args, **kwargs)
+
+        with patch('services.db.BULK_CHUNK_SIZE', 1), patch.object(dbs.session, 'execute', fail_every_second_insert):
+            resp = self.client.put('/users/bulk', data=json.dumps(self.rows), headers={'content-type': 'application/json', 'Authorization': self.staff_token})
+        self.assertEqual(resp.status_code, 500)
+
+        self.assertEqual(0, dbs.count_user_info(self.admin_token, {'field': 'username', 'op': 'in', 'value': ['jeffreywood', 'helenkelly']}))
+
+    def test_bulk_create_user_taken_meanwhile(self):
+        execute = dbs.session.execute
+        rollback = dbs.session.rollback
+        inserts = []
+
+        def fail_first_insert(statement, *args, **kwargs):
+            if getattr(statement, 'is_insert', False):
+                inserts.append(statement)
+                if len(inserts) == 1:
+                    raise exc.IntegrityError('INSERT', {}, Exception('taken by another process'))
+            return execute(statement, *args, **kwargs)
+
+        def take_helenkelly():
+            # Another process creates helenkelly between the lookup and the insert
+            rollback()
+            if len(inserts) == 1:
+                execute(UserInfo.__table__.insert(), [{'username': 'helenkelly', 'password': 'x', 'role': 'user', 'token': ''}])
+                dbs.session.commit()
+
+        with patch.object(dbs.session, 'execute', fail_first_insert), patch.object(dbs.session, 'rollback', take_helenkelly):
+            resp = self.client.put('/users/bulk', data=json.dumps(self.rows), headers={'content-type': 'application/json', 'Authorization': self.staff_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = [
+            ('jeffreywood', 'created'),
+            ('tonyfoltz', 'duplicate'),
+            ('antoniasimcox', 'invalid'),
+            ('jeffreywood', 'duplicate'),
+            ('helenkelly', 'duplicate'),
+        ]
+        self.assertEqual(expected, [(r['username'], r['status']) for r in resp.json['data']])
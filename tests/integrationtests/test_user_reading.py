@@ -104,3 +104,30 @@ class TestUserReading(TestCase):
         resp = self.client.get("/user?filter=email==a.b@gmail.com",
                                headers={'content-type': 'application/json', 'Authorization': self.admin_token})
         self.assertEqual(resp.status_code, 400)
+
+    def test_user_paging_with_total(self):
+        resp = self.client.get("/user?page=1&pagesize=1&with_total=1&filter=role == 'user'",
+                               headers={'content-type': 'application/json', 'Authorization': self.staff_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = [
+            {'email': 'tony.foltz@gmail.com', 'forename': 'Tony', 'surname': 'Foltz', 'username': 'tonyfoltz', 'role': 'user', 'token': self.user_token},
+        ]
+        self.assertEqual(expected, resp.json['data'])
+        self.assertEqual(3, resp.json['total'])
+
+    def test_user_fields(self):
+        resp = self.client.get("/user?fields=username,role&filter=role != 'user'",
+                               headers={'content-type': 'application/json', 'Authorization': self.staff_token})
+        self.assertEqual(resp.status_code, 200)
+
+        expected = [
+            {'username': 'yiluzhu', 'role': 'admin'},
+            {'username': 'alexzhu', 'role': 'staff'},
+        ]
+        self.assertEqual(expected, resp.json['data'])
+
+    def test_user_password_can_not_be_selected(self):
+        resp = self.client.get('/user?fields=username,password',
+                               headers={'content-type': 'application/json', 'Authorization': self.admin_token})
+        self.assertEqual(resp.status_code, 400)
@@ -1,6 +1,9 @@
 import datetime
 from unittest import TestCase
-from filtering.conversion import convert_str_to_filters
+from db.models import JoggingInfo
+from filtering.conversion import convert_str_to_filters, parse_fields, MAX_FILTER_DEPTH
+from filtering.filters import BadFilterFormat
+from filtering.models import FieldNotFound
 
 
 class TestFilterConversion(TestCase):
@@ -40,3 +43,105 @@ class TestFilterConversion(TestCase):
             ]
         }
         self.assertEqual(expected, result)
+
+    def test_deep_nesting(self):
+        filter_str = "((((weather == 'Rain') and (time > 30)) or (distance >= 1000)) and (date < '2016-05-01'))"
+        result = convert_str_to_filters(filter_str)
+
+        expected = {
+            'and': [
+                {
+                    'or': [
+                        {
+                            'and': [
+                                {'field': 'weather', 'op': '==', 'value': 'Rain'},
+                                {'field': 'time', 'op': '>', 'value': 30},
+                            ]
+                        },
+                        {'field': 'distance', 'op': '>=', 'value': 1000},
+                    ]
+                },
+                {'field': 'date', 'op': '<', 'value': datetime.date(2016, 5, 1)},
+            ]
+        }
+        self.assertEqual(expected, result)
+
+    def test_precedence_and_chains(self):
+        result = convert_str_to_filters('time > 1 or time > 2 and not time > 3 or time > 4')
+
+        expected = {
+            'or': [
+                {'field': 'time', 'op': '>', 'value': 1},
+                {
+                    'and': [
+                        {'field': 'time', 'op': '>', 'value': 2},
+                        {'not': [{'field': 'time', 'op': '>', 'value': 3}]},
+                    ]
+                },
+                {'field': 'time', 'op': '>', 'value': 4},
+            ]
+        }
+        self.assertEqual(expected, result)
+
+    def test_typed_values(self):
+        self.assertEqual({'field': 'distance', 'op': '>', 'value': -2.5e3}, convert_str_to_filters('distance > -2.5e3'))
+        self.assertEqual({'field': 'date', 'op': 'ge', 'value': datetime.date(2016, 5, 1)},
+                         convert_str_to_filters('date ge 2016-05-01'))
+        self.assertEqual({'field': 'weather', 'op': '==', 'value': 'Light  rain'},
+                         convert_str_to_filters('weather == "Light  rain"'))
+        self.assertEqual({'field': 'weather', 'op': '!=', 'value': "it's (not) 'and' rain"},
+                         convert_str_to_filters("weather != 'it\\'s (not) \\'and\\' rain'"))
+        self.assertEqual({'field': 'weather', 'op': '==', 'value': None}, convert_str_to_filters('weather == None'))
+        self.assertEqual({'field': 'weather', 'op': '==', 'value': '2016-13-01'},
+                         convert_str_to_filters("weather == '2016-13-01'"))
+
+    def test_in_lists(self):
+        self.assertEqual({'field': 'weather', 'op': 'in', 'value': ['Rain', 'Clear']},
+                         convert_str_to_filters("weather in ['Rain', 'Clear']"))
+        self.assertEqual({'field': 'distance', 'op': 'not_in', 'value': [1, 2.5]},
+                         convert_str_to_filters('distance not in (1, 2.5,)'))
+        self.assertEqual({'field': 'distance', 'op': 'in', 'value': []}, convert_str_to_filters('distance in []'))
+
+    def test_long_filter(self):
+        filter_str = ' or '.join(f'distance == {i}' for i in range(1000))
+        result = convert_str_to_filters(filter_str)
+
+        self.assertEqual(1000, len(result['or']))
+        self.assertEqual({'field': 'distance', 'op': '==', 'value': 999}, result['or'][-1])
+
+    def test_invalid_filters(self):
+        for filter_str in ['distance >', '(distance > 1', 'distance > 1)', 'distance = 1', '> 1',
+                           'distance > 1 time > 2', 'distance in [[1]]', "__import__('os') == 1", '']:
+            with self.subTest(filter_str=filter_str), self.assertRaises(BadFilterFormat):
+                convert_str_to_filters(filter_str)
+
+    def test_too_deep_filter(self):
+        depth = MAX_FILTER_DEPTH + 1
+        with self.assertRaises(BadFilterFormat):
+            convert_str_to_filters('(' * depth + 'time > 1' + ')' * depth)
+        with self.assertRaises(BadFilterFormat):
+            convert_str_to_filters('not ' * depth + 'time > 1')
+        with self.assertRaises(BadFilterFormat):
+            convert_str_to_filters('not (' * depth + 'time > 1' + ')' * depth)
+
+        filter_dict = convert_str_to_filters('not ' * MAX_FILTER_DEPTH + 'time > 1')
+        for _ in range(MAX_FILTER_DEPTH):
+            filter_dict = filter_dict['not'][0]
+        self.assertEqual({'field': 'time', 'op': '>', 'value': 1}, filter_dict)
+
+
+class TestFieldsParsing(TestCase):
+
+    def test_parse_fields(self):
+        self.assertEqual(['date', 'distance', 'time'], parse_fields('date, distance,time', JoggingInfo))
+
+    def test_parse_repeated_fields(self):
+        self.assertEqual(['date', 'distance'], parse_fields('date,date,distance, date', JoggingInfo))
+
+    def test_parse_no_fields(self):
+        self.assertIsNone(parse_fields(None, JoggingInfo))
+        self.assertIsNone(parse_fields(',', JoggingInfo))
+
+    def test_parse_unknown_field(self):
+        with self.assertRaises(FieldNotFound):
+            parse_fields('date,speed', JoggingInfo)
@@ -0,0 +1,65 @@
+import datetime
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import select
+from db.models import JoggingInfo
+from filtering.filters import apply_filters, compile_filters, BadFilterFormat, Filter
+from filtering.models import FieldNotFound, get_valid_field_names
+
+
+class TestApplyFilters(TestCase):
+
+    def to_sql(self, filter_dict):
+        query = apply_filters(select(JoggingInfo.rid), filter_dict, JoggingInfo)
+        sql = str(query.compile(compile_kwargs={'literal_binds': True}))
+        return sql.split('WHERE ')[1]
+
+    def test_filters_with_the_same_shape_share_a_compiled_filter(self):
+        compile_filters.cache_clear()
+        self.assertEqual('jogging_info.distance > 10', self.to_sql({'field': 'distance', 'op': '>', 'value': 10}))
+        self.assertEqual('jogging_info.distance > 20', self.to_sql({'field': 'distance', 'op': '>', 'value': 20}))
+
+        info = compile_filters.cache_info()
+        self.assertEqual((1, 1), (info.hits, info.misses))
+
+    def test_nested_filters(self):
+        filter_dict = {
+            'and': [
+                {'field': 'username', 'op': '==', 'value': 'helenkelly'},
+                {'or': [
+                    {'field': 'distance', 'op': '>', 'value': 2500},
+                    {'field': 'distance', 'op': '<', 'value': 1000},
+                ]},
+            ]
+        }
+        self.assertEqual("jogging_info.username = 'helenkelly' AND "
+                         "(jogging_info.distance > 2500 OR jogging_info.distance < 1000)", self.to_sql(filter_dict))
+
+    def test_in_filter(self):
+        self.assertEqual('jogging_info.rid IN (1, 2, 3)', self.to_sql({'field': 'rid', 'op': 'in', 'value': [1, 2, 3]}))
+        self.assertEqual('(jogging_info.rid NOT IN (4))', self.to_sql({'field': 'rid', 'op': 'not_in', 'value': [4]}))
+
+    def test_values_keep_their_type(self):
+        self.assertEqual("jogging_info.date = '2020-09-23'",
+                         self.to_sql({'field': 'date', 'op': '==', 'value': datetime.date(2020, 9, 23)}))
+        self.assertEqual("jogging_info.date >= '2020-09-23'",
+                         self.to_sql({'field': 'date', 'op': '>=', 'value': '2020-09-23'}))
+        self.assertEqual('jogging_info.weather IS NULL', self.to_sql({'field': 'weather', 'op': '==', 'value': None}))
+
+    def test_invalid_filters(self):
+        with self.assertRaises(FieldNotFound):
+            self.to_sql({'field': 'password', 'op': '==', 'value': 1})
+        with self.assertRaises(BadFilterFormat):
+            self.to_sql({'field': 'distance', 'op': '~', 'value': 1})
+        with self.assertRaises(BadFilterFormat):
+            self.to_sql({'and': {'field': 'distance', 'op': '>', 'value': 1}})
+
+    def test_errors_of_compiling_are_not_taken_for_unhashable_shapes(self):
+        compile_filters.cache_clear()
+        with patch.object(Filter, 'compile', side_effect=TypeError('failed to compile')):
+            with self.assertRaisesRegex(TypeError, 'failed to compile'):
+                self.to_sql({'field': 'distance', 'op': '>', 'value': 10})
+
+    def test_valid_field_names_are_worked_out_once(self):
+        self.assertIs(get_valid_field_names(JoggingInfo), get_valid_field_names(JoggingInfo))
+        self.assertEqual(set(JoggingInfo.FIELDS), get_valid_field_names(JoggingInfo))
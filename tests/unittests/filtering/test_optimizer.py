@@ -0,0 +1,162 @@
+import datetime
+from unittest import TestCase
+from sqlalchemy import create_engine, select
+from db.models import Base, JoggingInfo
+from filtering.conversion import convert_str_to_filters
+from filtering.filters import apply_filters, build_filters
+from filtering.optimizer import optimize, CONTRADICTION
+
+
+class TestOptimizer(TestCase):
+
+    def optimize(self, filter_str):
+        return optimize(convert_str_to_filters(filter_str), JoggingInfo)
+
+    def test_push_down_not(self):
+        self.assertEqual({'field': 'date', 'op': '>=', 'value': datetime.date(2020, 1, 1)},
+                         self.optimize("not (date < '2020-01-01')"))
+        self.assertEqual({'field': 'time', 'op': '>', 'value': 30}, self.optimize('not not not (time le 30)'))
+
+        expected = {
+            'or': [
+                {'field': 'username', 'op': '!=', 'value': 'a'},
+                {'and': [
+                    {'field': 'time', 'op': '<=', 'value': 30},
+                    {'field': 'weather', 'op': 'in', 'value': ['Rain']},
+                ]},
+            ]
+        }
+        self.assertEqual(expected, self.optimize("not (username == 'a' and (time > 30 or weather not in ['Rain']))"))
+
+    def test_flatten(self):
+        expected = {
+            'and': [
+                {'field': 'username', 'op': '==', 'value': 'a'},
+                {'field': 'time', 'op': '==', 'value': 30},
+                {'field': 'distance', 'op': '==', 'value': 1000},
+            ]
+        }
+        self.assertEqual(expected, self.optimize("(username == 'a') and ((time == 30) and (distance == 1000))"))
+        self.assertEqual(expected, optimize(expected['and'], JoggingInfo))
+
+    def test_fold_equalities_into_in(self):
+        self.assertEqual({'field': 'distance', 'op': 'in', 'value': [1, 2, 3]},
+                         self.optimize('distance == 1 or distance in [2, 1] or distance == 3'))
+
+        expected = {
+            'or': [
+                {'field': 'weather', 'op': '==', 'value': None},
+                {'field': 'weather', 'op': 'in', 'value': ['Rain', 'Snow']},
+                {'field': 'time', 'op': '>', 'value': 30},
+            ]
+        }
+        self.assertEqual(expected, self.optimize("weather == None or weather == 'Rain' or time > 30 or weather == 'Snow'"))
+
+    def test_merge_ranges(self):
+        self.assertEqual({'field': 'distance', 'op': 'between', 'value': [1000, 2000]},
+                         self.optimize('distance >= 500 and distance <= 2000 and distance >= 1000'))
+        self.assertEqual({'and': [{'field': 'distance', 'op': '>', 'value': 1000},
+                                  {'field': 'distance', 'op': '<=', 'value': 2000}]},
+                         self.optimize('distance >= 1000 and distance <= 2000 and distance > 1000'))
+        self.assertEqual({'field': 'distance', 'op': '==', 'value': 1000},
+                         self.optimize('distance >= 1000 and distance <= 1000'))
+        self.assertEqual({'field': 'distance', 'op': 'in', 'value': [2, 3]},
+                         self.optimize('distance in [1, 2, 3, 4] and distance > 1 and distance != 4'))
+        self.assertEqual({'and': [{'field': 'distance', 'op': '>', 'value': 1},
+                                  {'field': 'distance', 'op': 'not_in', 'value': [2, 3]}]},
+                         self.optimize('distance > 1 and distance != 0 and distance not in [2, 3]'))
+
+    def test_contradictions(self):
+        for filter_str in ['distance > 2000 and distance < 1000', 'distance > 1000 and distance <= 1000',
+                           "weather == 'Rain' and weather == 'Snow'", 'distance in [1, 2] and distance == 3',
+                           'distance == 1 and distance != 1', "not (username != 'a' or username != 'b')",
+                           '(time > 30 and time < 10) or (time == 1 and time == 2)']:
+            with self.subTest(filter_str=filter_str):
+                self.assertIs(CONTRADICTION, self.optimize(filter_str))
+
+        self.assertEqual({'field': 'time', 'op': '>', 'value': 30},
+                         self.optimize('(time > 1 and time < 0) or time > 30'))
+
+    def test_values_of_different_kinds_are_not_merged(self):
+        filter_dict = {'and': [{'field': 'weather', 'op': '==', 'value': 1},
+                               {'field': 'weather', 'op': '==', 'value': '1'}]}
+        self.assertEqual(filter_dict, optimize(filter_dict, JoggingInfo))
+
+    def test_values_of_another_kind_than_their_column_are_not_merged(self):
+        # SQLite compares them after converting them to the affinity of the column, e.g. '9' to 9
+        for filter_str in ["distance > '9' and distance < '10'", "username > 1 and username < 2",
+                           "distance == '1' or distance == '2'"]:
+            with self.subTest(filter_str=filter_str):
+                filter_dict = convert_str_to_filters(filter_str)
+                self.assertEqual(filter_dict, optimize(filter_dict, JoggingInfo))
+
+    def test_malformed_filters_are_left_alone(self):
+        for filter_dict in [{'and': {'field': 'distance'}}, {'field': 'distance', 'op': '~', 'value': 1}, {'or': []}]:
+            self.assertEqual(filter_dict, optimize(filter_dict, JoggingInfo))
+        self.assertEqual({'not': [{'field': 'distance'}]}, optimize({'not': [{'field': 'distance'}]}, JoggingInfo))
+
+
+class TestOptimizerQueryPlans(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine('sqlite://')
+        Base.metadata.create_all(cls.engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
+
+    def explain(self, query):
+        sql = str(query.compile(self.engine, compile_kwargs={'literal_binds': True}))
+        with self.engine.connect() as conn:
+            return [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql)]
+
+    def get_plans(self, filter_str):
+        """Return the query plans of a filter translated literally and after optimization"""
+        filter_dict = convert_str_to_filters(filter_str)
+        literal = select(JoggingInfo.rid).filter(
+            *[f.format_for_sqlalchemy(None, JoggingInfo) for f in build_filters(filter_dict)])
+        optimized = apply_filters(select(JoggingInfo.rid), filter_dict, JoggingInfo)
+        return self.explain(literal), self.explain(optimized)
+
+    def test_negated_range_uses_primary_key(self):
+        before, after = self.get_plans('not (rid > 10 or rid < 5)')
+        self.assertTrue(before[0].startswith('SCAN'))
+        self.assertEqual(['SEARCH jogging_info USING INTEGER PRIMARY KEY (rowid>? AND rowid<?)'], after)
+
+    def test_negated_conditions_use_index(self):
+        before, after = self.get_plans("not (username != 'a' or date < '2020-01-01')")
+        self.assertTrue(before[0].startswith('SCAN'))
+        self.assertEqual(['SEARCH jogging_info USING COVERING INDEX ix_jogging_info_username_date (username=? AND date>?)'],
+                         after)
+
+    def test_optimized_plans_are_no_worse(self):
+        for filter_str in ['rid == 1 or rid == 2 or rid == 3', "username == 'a' or username == 'b'",
+                           "username == 'a' and date >= '2020-01-01' and date <= '2020-02-01'"]:
+            with self.subTest(filter_str=filter_str):
+                before, after = self.get_plans(filter_str)
+                self.assertTrue(after[0].startswith('SEARCH'))
+                self.assertEqual(before, after)
+
+    def test_values_converted_by_sqlite_match_as_before(self):
+        with self.engine.begin() as conn:
+            conn.execute(JoggingInfo.__table__.insert(), [{'rid': 1, 'username': 'a', 'distance': 9.5},
+                                                          {'rid': 2, 'username': '15', 'distance': 20}])
+            try:
+                for filter_str in ["distance > '9' and distance < '10'", 'username > 1 and username < 2']:
+                    with self.subTest(filter_str=filter_str):
+                        filter_dict = convert_str_to_filters(filter_str)
+                        literal = select(JoggingInfo.rid).filter(
+                            *[f.format_for_sqlalchemy(None, JoggingInfo) for f in build_filters(filter_dict)])
+                        optimized = apply_filters(select(JoggingInfo.rid), filter_dict, JoggingInfo)
+                        expected = conn.execute(literal).scalars().all()
+                        self.assertTrue(expected)
+                        self.assertEqual(expected, conn.execute(optimized).scalars().all())
+            finally:
+                conn.execute(JoggingInfo.__table__.delete())
+
+    def test_contradiction_is_not_sent_as_is(self):
+        query = apply_filters(select(JoggingInfo.rid), convert_str_to_filters('rid > 5 and rid < 3'), JoggingInfo)
+        sql = str(query.compile(self.engine, compile_kwargs={'literal_binds': True}))
+        self.assertEqual('0 = 1', sql.split('WHERE ')[1])
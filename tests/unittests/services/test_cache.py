@@ -0,0 +1,156 @@
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+import services.cache
+from services.cache import LRUCache, SingleFlight, Generations
+
+
+class TestLRUCache(TestCase):
+
+    def test_get_and_set(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual({'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1}, cache.stats())
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+
+    def test_expired_entry_is_a_miss(self):
+        cache = LRUCache(2, ttl=10)
+        with patch('services.cache.time.monotonic', return_value=100):
+            cache.set('a', 1)
+        with patch('services.cache.time.monotonic', return_value=105):
+            self.assertEqual(1, cache.get('a'))
+        with patch('services.cache.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get('a'))
+
+        self.assertEqual(0, len(cache))
+
+    def test_discard_where(self):
+        cache = LRUCache(10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 1)
+        cache.discard_where(lambda key, value: value == 1)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(2, cache.get('b'))
+        self.assertIsNone(cache.get('c'))
+
+    def test_values_beyond_maxbytes_are_evicted(self):
+        cache = LRUCache(10, maxbytes=5)
+        cache.set('a', b'12')
+        cache.set('b', b'34')
+        cache.get('a')
+        cache.set('c', b'56')
+
+        self.assertEqual(b'12', cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(4, cache.stats()['bytes'])
+
+        cache.set('a', b'1')
+        cache.set('d', b'123456')
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(3, cache.stats()['bytes'])
+
+        cache.pop('a')
+        self.assertEqual(2, cache.stats()['bytes'])
+
+
+class TestGenerations(TestCase):
+
+    def test_bump(self):
+        generations = Generations()
+        self.assertEqual((0, 0), generations.get('records', ('records', 'a')))
+
+        generations.bump(('records', 'a'), ('records', 'b'))
+        generations.bump(('records', 'a'))
+        self.assertEqual((0, 2, 1), generations.get('records', ('records', 'a'), ('records', 'b')))
+
+
+class TestSingleFlight(TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+        # Count the callers that wait for a call in flight
+        self.waiting = threading.Semaphore(0)
+        waiting = self.waiting
+
+        class WaitingEvent(threading.Event):
+            def wait(self, timeout=None):
+                waiting.release()
+                return super().wait(timeout)
+
+        class Call(services.cache._Call):
+            def __init__(self):
+                super().__init__()
+                self.done = WaitingEvent()
+
+        patcher = patch.object(services.cache, '_Call', Call)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def slow_call(self):
+        self.calls += 1
+        self.release.wait(5)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    def call_concurrently(self, key, num):
+        results = []
+
+        def call():
+            try:
+                results.append(self.flight.do(key, self.slow_call))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(num)]
+        for thread in threads:
+            thread.start()
+        for _ in range(num - 1):
+            self.assertTrue(self.waiting.acquire(timeout=5), 'callers did not wait for the call in flight')
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+        return results
+
+    def test_concurrent_calls_share_one_result(self):
+        self.result = 'Rain'
+        results = self.call_concurrently('key', 5)
+
+        self.assertEqual(['Rain'] * 5, results)
+        self.assertEqual(1, self.calls)
+        self.assertEqual({'in_flight': 0, 'coalesced': 4}, self.flight.stats())
+
+    def test_error_is_raised_to_every_caller(self):
+        self.result = RuntimeError('API is down')
+        results = self.call_concurrently('key', 3)
+
+        self.assertEqual([self.result] * 3, results)
+        self.assertEqual(1, self.calls)
+
+    def test_later_calls_run_again(self):
+        self.release.set()
+        self.result = 'Rain'
+        self.flight.do('key', self.slow_call)
+        self.flight.do('key', self.slow_call)
+
+        self.assertEqual(2, self.calls)
+        self.assertEqual(0, self.flight.stats()['coalesced'])
@@ -0,0 +1,275 @@
+import os
+os.environ['IN_MEMORY_DB'] = 'Y'
+
+import datetime
+import sqlite3
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import Mock, patch
+from sqlalchemy import exc
+from db.statements import make_statement
+from filtering.filters import BadFilterFormat
+import services.db
+from services.db import DBService, retry_on_busy
+
+
+class TestDBInitialisation(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'old.db')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def get_index_names(self):
+        with sqlite3.connect(self.path) as conn:
+            rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'")
+            return {name for name, in rows}
+
+    def test_indexes_are_added_to_existing_db(self):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute('CREATE TABLE user_info (username VARCHAR NOT NULL, password VARCHAR, forename VARCHAR, '
+                         'surname VARCHAR, email VARCHAR, role VARCHAR, token VARCHAR, PRIMARY KEY (username))')
+            conn.execute("INSERT INTO user_info VALUES ('a', '', '', '', '', 'user', '')")
+            conn.execute("INSERT INTO user_info VALUES ('b', '', '', '', '', 'user', '')")
+
+        for _ in range(2):
+            service = DBService(self.path)
+            service.session.close()
+            service.engine.dispose()
+
+        self.assertEqual({'ix_user_info_token', 'ix_jogging_info_username_date'}, self.get_index_names())
+
+    def test_weekly_summary_is_filled_in_for_existing_db(self):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute('CREATE TABLE user_info (username VARCHAR NOT NULL, password VARCHAR, forename VARCHAR, '
+                         'surname VARCHAR, email VARCHAR, role VARCHAR, token VARCHAR, PRIMARY KEY (username))')
+            conn.execute('CREATE TABLE jogging_info (rid INTEGER NOT NULL, username VARCHAR NOT NULL, date DATE, '
+                         'lat FLOAT, lon FLOAT, distance INTEGER, time INTEGER, weather VARCHAR, PRIMARY KEY (rid))')
+            conn.execute("INSERT INTO user_info VALUES ('a', '', '', '', '', 'user', 'token-a')")
+            conn.execute("INSERT INTO jogging_info VALUES (1, 'a', '2020-09-21', 0, 0, 1000, 10, 'Clear')")
+            conn.execute("INSERT INTO jogging_info VALUES (2, 'a', '2020-09-22', 0, 0, NULL, NULL, 'Clear')")
+
+        service = DBService(self.path)
+        self.assertEqual({'speed': 100, 'total_distance(meters)': 1000, 'total_time(minutes)': 10, 'runs': 2},
+                         service.make_weekly_report('token-a', datetime.date(2020, 9, 21)))
+        service.session.remove()
+        service.engine.dispose()
+
+    def test_each_thread_has_its_own_session(self):
+        service = DBService(self.path)
+        sessions = [service.session()]
+        thread = threading.Thread(target=lambda: sessions.append(service.session()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(sessions[0], sessions[1])
+        self.assertIs(sessions[0], service.session())
+        service.session.remove()
+        service.engine.dispose()
+
+    def test_weather_cache_shares_the_db_file(self):
+        cwd = os.getcwd()
+        other = tempfile.TemporaryDirectory()
+        # Deep enough that the path relative to the repository root means another file from here
+        nested = os.path.join(other.name, 'a', 'b', 'c', 'd')
+        os.makedirs(nested)
+        os.chdir(nested)
+        try:
+            root = os.path.join(os.path.dirname(os.path.realpath(services.db.__file__)), '..')
+            service = DBService(os.path.relpath(self.path, root), profile='performance')
+            conn = service.weather_api.cache._conn
+            self.assertEqual(os.path.realpath(self.path), os.path.realpath(conn.execute('PRAGMA database_list').fetchone()[2]))
+            self.assertEqual(5000, conn.execute('PRAGMA busy_timeout').fetchone()[0])
+            self.assertEqual([], os.listdir(nested))
+            service.engine.dispose()
+        finally:
+            os.chdir(cwd)
+            other.cleanup()
+
+    def test_performance_profile(self):
+        service = DBService(self.path, profile='performance')
+        with service.engine.connect() as conn:
+            self.assertEqual('wal', conn.exec_driver_sql('PRAGMA journal_mode').scalar())
+            self.assertEqual(1, conn.exec_driver_sql('PRAGMA synchronous').scalar())  # NORMAL
+            self.assertEqual(5000, conn.exec_driver_sql('PRAGMA busy_timeout').scalar())
+            self.assertEqual(1, conn.exec_driver_sql('PRAGMA foreign_keys').scalar())
+        service.engine.dispose()
+
+
+class TestRetryOnBusy(TestCase):
+
+    def setUp(self):
+        self.locked = exc.OperationalError('INSERT', {}, Exception('database is locked'))
+
+    @patch('services.db.time.sleep')
+    def test_write_is_retried_until_it_succeeds(self, sleep):
+        service = Mock()
+        write = Mock(side_effect=[self.locked, self.locked, 'done'], __name__='write')
+
+        self.assertEqual('done', retry_on_busy(write)(service, 1))
+        self.assertEqual(3, write.call_count)
+        self.assertEqual(2, service.session.rollback.call_count)
+        self.assertEqual(2, sleep.call_count)
+
+    @patch('services.db.time.sleep')
+    def test_write_gives_up_after_retries(self, sleep):
+        write = Mock(side_effect=self.locked, __name__='write')
+
+        with self.assertRaises(exc.OperationalError):
+            retry_on_busy(write)(Mock())
+        self.assertEqual(6, write.call_count)
+
+    def test_other_errors_are_not_retried(self):
+        error = exc.OperationalError('INSERT', {}, Exception('no such table: user_info'))
+        write = Mock(side_effect=error, __name__='write')
+
+        with self.assertRaises(exc.OperationalError):
+            retry_on_busy(write)(Mock())
+        self.assertEqual(1, write.call_count)
+
+
+class TestReadPath(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.service = DBService(os.path.join(self.folder.name, 'read.db'))
+        self.service.create_admin_user({'username': 'jack', 'password': '', 'role': 'user'})
+        self.service.jogging_table.create_records([
+            {'username': 'jack', 'date': datetime.date(2020, 9, day), 'lat': 51.5, 'lon': -0.1,
+             'distance': 1000 * day, 'time': 10, 'weather': 'Clear'}
+            for day in range(1, 6)
+        ])
+
+    def tearDown(self):
+        self.service.session.remove()
+        self.service.engine.dispose()
+        self.folder.cleanup()
+
+    def test_records_are_read_without_orm_instances(self):
+        filters = {'field': 'distance', 'op': '>', 'value': 3000}
+        records = self.service.jogging_table.get_all_records(filters, fields=['rid', 'distance'])
+
+        self.assertEqual([{'rid': 4, 'distance': 4000}, {'rid': 5, 'distance': 5000}], records)
+        self.assertEqual(2, self.service.jogging_table.count_all_records(filters))
+        self.assertEqual(0, len(self.service.session.identity_map))
+
+    def test_users_are_read_without_orm_instances(self):
+        users = self.service.user_table.get_all_users({'field': 'role', 'op': '==', 'value': 'user'})
+
+        self.assertEqual([{'username': 'jack', 'forename': None, 'surname': None, 'email': None, 'role': 'user',
+                           'token': ''}], users)
+        self.assertEqual(1, self.service.user_table.count_all_users(None))
+        self.assertEqual(0, len(self.service.session.identity_map))
+
+    def test_repeated_shapes_reuse_statements(self):
+        table = self.service.jogging_table
+        make_statement.cache_clear()
+        compile_hits = self.service.compile_cache.hits
+
+        self.assertEqual([{'rid': 4}, {'rid': 5}], table.get_all_records({'field': 'distance', 'op': '>', 'value': 3000},
+                                                                         1, 2, ['rid']))
+        self.assertEqual([{'rid': 4}, {'rid': 5}], table.get_all_records({'field': 'distance', 'op': '>', 'value': 1000},
+                                                                         2, 2, ['rid']))
+
+        info = make_statement.cache_info()
+        self.assertEqual((1, 1), (info.hits, info.misses))
+        self.assertEqual(compile_hits + 1, self.service.compile_cache.hits)
+        self.assertEqual(info.hits, self.service.get_metrics()['statement_cache']['hits'])
+
+    def test_values_of_other_types_get_their_own_statement(self):
+        table = self.service.jogging_table
+        for value in ['2020-09-04', datetime.date(2020, 9, 4)]:
+            filters = {'field': 'date', 'op': '>=', 'value': value}
+            self.assertEqual([{'rid': 4}, {'rid': 5}], table.get_all_records(filters, fields=['rid']))
+            self.assertEqual([{'rid': 5}], table.seek_records(filters, (datetime.date(2020, 9, 4), 4), 10, 'jack', ['rid']))
+
+        filters = {'field': 'rid', 'op': 'in', 'value': [2, 3]}
+        self.assertEqual([{'rid': 2}, {'rid': 3}], table.get_all_records(filters, fields=['rid']))
+        filters = {'field': 'rid', 'op': 'in', 'value': [1, 3, 5]}
+        self.assertEqual([{'rid': 1}, {'rid': 3}, {'rid': 5}], table.get_all_records(filters, fields=['rid']))
+
+    def test_filters_that_can_not_match(self):
+        filters = {'and': [{'field': 'distance', 'op': '>', 'value': 3000}, {'field': 'distance', 'op': '<', 'value': 2000}]}
+        self.assertEqual([], self.service.jogging_table.get_all_records(filters))
+        self.assertEqual(0, self.service.jogging_table.count_records_of_a_user('jack', filters))
+
+    def test_bulk_insert_checks_the_rids_of_new_records(self):
+        table = self.service.jogging_table
+        rows = [{'username': 'jack', 'date': datetime.date(2020, 10, day), 'lat': 51.5, 'lon': -0.1,
+                 'distance': 1000, 'time': 10, 'weather': 'Clear'} for day in range(1, 3)]
+        self.assertEqual([6, 7], table.create_records(rows))
+
+        # A record inserted in the same transaction after the batch, so the batch no longer ends at the largest rid
+        execute = self.service.session.execute
+
+        def insert_another(statement, *args, **kwargs):
+            result = execute(statement, *args, **kwargs)
+            if getattr(statement, 'is_insert', False) and statement.table.name == 'jogging_info':
+                execute(statement, dict(rows[0], date=datetime.date(2020, 11, 1)))
+            return result
+
+        with patch.object(self.service.session, 'execute', insert_another):
+            with self.assertRaises(RuntimeError):
+                table.create_records(rows)
+        self.assertEqual(7, table.count_all_records(None))
+
+    def test_errors_of_building_are_not_taken_for_unhashable_shapes(self):
+        make_statement.cache_clear()
+        with patch('db.statements.bind_filters', side_effect=TypeError('failed to build')):
+            with self.assertRaisesRegex(TypeError, 'failed to build'):
+                self.service.jogging_table.get_all_records({'field': 'distance', 'op': '>', 'value': 3000})
+
+    def test_malformed_filters_are_reported(self):
+        with self.assertRaises(BadFilterFormat):
+            self.service.jogging_table.get_all_records({'and': {'field': 'distance', 'op': '>', 'value': 1}})
+
+
+class TestWeatherEnrichment(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.service = DBService(os.path.join(self.folder.name, 'weather.db'))
+        self.service.create_admin_user({'username': 'admin', 'password': '', 'role': 'admin', 'token': 'admin-token'})
+        self.service.create_admin_user({'username': 'jack', 'password': '', 'role': 'user'})
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.service.weather_enricher.join()
+        self.service.session.remove()
+        self.service.engine.dispose()
+        self.folder.cleanup()
+
+    def http_get(self, params):
+        self.release.wait(5)
+        return {'current': {'weather': [{'main': 'Rain'}]}}
+
+    def get_weathers(self):
+        return [r['weather'] for r in self.service.read_records('admin-token', None, fields=['weather'])]
+
+    def test_record_is_saved_before_its_weather_is_known(self):
+        row = {'username': 'jack', 'date': '2020-09-23', 'lat': 51.5, 'lon': -0.1, 'distance': 1000, 'time': 10}
+        with patch.object(self.service.weather_api, 'http_get', self.http_get):
+            self.service.create_a_record(row, 'admin-token')
+            self.service.create_records([row, dict(row, weather='Clear')], 'admin-token')
+            self.assertEqual(['Pending', 'Pending', 'Clear'], self.get_weathers())
+
+            self.release.set()
+            self.service.weather_enricher.join()
+
+        self.assertEqual(['Rain', 'Rain', 'Clear'], self.get_weathers())
+        self.assertEqual(2, self.service.get_metrics()['weather_enrichment']['resolved'])
+
+    def test_redrive_unknown_weather(self):
+        row = {'username': 'jack', 'date': '2020-09-23', 'lat': 51.5, 'lon': -0.1, 'distance': 1000, 'time': 10}
+        self.service.create_records([dict(row, weather='Unknown'), dict(row, weather='Clear')], 'admin-token')
+
+        self.release.set()
+        with patch.object(self.service.weather_api, 'http_get', self.http_get):
+            self.assertEqual(1, self.service.redrive_weather())
+            self.service.weather_enricher.join()
+
+        self.assertEqual(['Rain', 'Clear'], self.get_weathers())
@@ -0,0 +1,58 @@
+import datetime
+import threading
+from unittest import TestCase
+from services.enrichment import WeatherEnricher, WeatherTask
+
+
+class TestWeatherEnricher(TestCase):
+
+    def setUp(self):
+        self.writes = []
+        self.date = datetime.date(2020, 9, 23)
+
+    def get_weather(self, date, lat, lon):
+        return 'Rain' if lat > 0 else 'Clear'
+
+    def write(self, updates):
+        self.writes.append(updates)
+
+    def test_weather_is_saved_right_away_without_workers(self):
+        enricher = WeatherEnricher(self.get_weather, self.write, workers=0, batch_size=2)
+        enricher.submit(WeatherTask(rid, self.date, rid - 2, 0) for rid in range(1, 6))
+
+        self.assertEqual([[{'rid': 1, 'weather': 'Clear'}, {'rid': 2, 'weather': 'Clear'}],
+                          [{'rid': 3, 'weather': 'Rain'}, {'rid': 4, 'weather': 'Rain'}],
+                          [{'rid': 5, 'weather': 'Rain'}]], self.writes)
+        self.assertEqual({'queue_depth': 0, 'workers': 0, 'resolved': 5, 'failed': 0}, enricher.stats())
+
+    def test_workers_save_weather_in_batches(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def write(updates):
+            started.set()
+            release.wait(5)
+            self.writes.append(updates)
+
+        enricher = WeatherEnricher(self.get_weather, write, workers=1, batch_size=10)
+        enricher.submit([WeatherTask(0, self.date, 1, 0)])
+        started.wait(5)
+        # The worker is busy, so these queue up and are written together
+        enricher.submit(WeatherTask(rid, self.date, 1, 0) for rid in range(1, 21))
+        self.assertEqual(20, enricher.stats()['queue_depth'])
+
+        release.set()
+        enricher.join()
+        self.assertEqual([1, 10, 10], [len(updates) for updates in self.writes])
+        self.assertEqual(list(range(21)), [u['rid'] for updates in self.writes for u in updates])
+        self.assertEqual({'queue_depth': 0, 'workers': 1, 'resolved': 21, 'failed': 0}, enricher.stats())
+
+    def test_failed_batches_are_counted(self):
+        def write(updates):
+            raise RuntimeError('database is gone')
+
+        enricher = WeatherEnricher(self.get_weather, write, workers=2, batch_size=10)
+        enricher.submit(WeatherTask(rid, self.date, 1, 0) for rid in range(3))
+        enricher.join()
+
+        self.assertEqual(3, enricher.stats()['failed'])
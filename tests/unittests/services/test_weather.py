@@ -1,6 +1,13 @@
+import os
+import json
+import time
 import datetime
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest import TestCase
-from services.weather import WeatherAPI
+from unittest.mock import patch
+from services.weather import WeatherAPI, WeatherCache, CircuitBreaker
 
 
 class TestWeatherAPI(TestCase):
@@ -22,3 +29,168 @@ class TestWeatherAPI(TestCase):
         result = self.api.get_weather(date, 50.3, 0.7)  # London
 
         self.assertEqual(result, 'Unknown')
+
+
+class TestWeatherCache(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'weather.db')
+        self.cache = WeatherCache(self.path, resolution=0.1, maxsize=10)
+        self.date = datetime.date(2020, 9, 23)
+
+    def tearDown(self):
+        self.cache.close()
+        self.folder.cleanup()
+
+    def test_nearby_locations_share_a_grid_cell(self):
+        self.cache.set(self.date, 51.501, -0.121, 'Rain')
+
+        self.assertEqual('Rain', self.cache.get(self.date, 51.498, -0.118))
+        self.assertIsNone(self.cache.get(self.date, 51.6, -0.12))
+        self.assertIsNone(self.cache.get(self.date + datetime.timedelta(days=1), 51.5, -0.12))
+
+    def test_cache_survives_restarts(self):
+        self.cache.set(self.date, 51.5, -0.12, 'Rain')
+        self.cache.close()
+
+        self.cache = WeatherCache(self.path, resolution=0.1, maxsize=10)
+        self.assertEqual('Rain', self.cache.get(self.date, 51.5, -0.12))
+        self.assertEqual('Rain', self.cache.get(self.date, 51.5, -0.12))
+        self.assertIsNone(self.cache.get(self.date, 10, 10))
+
+        stats = self.cache.stats()
+        self.assertEqual((1, 1, 1), (stats['memory_hits'], stats['disk_hits'], stats['misses']))
+        self.assertAlmostEqual(2 / 3, stats['hit_rate'])
+
+    def test_api_is_only_called_on_a_miss(self):
+        api = WeatherAPI(self.cache)
+        data = {'current': {'weather': [{'main': 'Clear'}]}}
+        with patch.object(api, 'http_get', return_value=data) as http_get:
+            self.assertEqual('Clear', api.get_weather(self.date, 51.5, -0.12))
+            self.assertEqual('Clear', api.get_weather(self.date, 51.51, -0.12))
+        self.assertEqual(1, http_get.call_count)
+
+    def test_unknown_weather_is_not_cached(self):
+        api = WeatherAPI(self.cache)
+        with patch.object(api, 'http_get', return_value=None) as http_get:
+            self.assertEqual('Unknown', api.get_weather(self.date, 51.5, -0.12))
+            self.assertEqual('Unknown', api.get_weather(self.date, 51.5, -0.12))
+        self.assertEqual(2, http_get.call_count)
+
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    """Answer with the next of the server's `responses`, a (status, delay in seconds) tuple, repeating the last one"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        server.clients.add(self.client_address)
+        status, delay = server.responses[min(server.requests, len(server.responses)) - 1]
+        time.sleep(delay)
+
+        body = json.dumps({'current': {'weather': [{'main': 'Clear'}]}} if status == 200 else {'cod': status}).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except ConnectionError:
+            # The client gave up waiting
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestWeatherAPIWithStubServer(TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubWeatherHandler)
+        self.server.requests = 0
+        self.server.clients = set()
+        self.server.responses = [(200, 0)]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.url = f'http://127.0.0.1:{self.server.server_port}/timemachine'
+        self.date = datetime.date(2020, 9, 23)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_api(self, **kwargs):
+        kwargs = dict({'url': self.url, 'timeout': (1, 1), 'retries': 2, 'backoff': 0,
+                       'breaker': CircuitBreaker(threshold=3, reset_timeout=60)}, **kwargs)
+        return WeatherAPI(**kwargs)
+
+    def test_connection_is_kept_alive(self):
+        api = self.make_api()
+        for lat in range(3):
+            self.assertEqual('Clear', api.get_weather(self.date, lat, 0))
+
+        self.assertEqual(3, self.server.requests)
+        self.assertEqual(1, len(self.server.clients))
+
+    def test_server_errors_are_retried(self):
+        self.server.responses = [(503, 0), (500, 0), (200, 0)]
+        api = self.make_api()
+
+        self.assertEqual('Clear', api.get_weather(self.date, 51.5, -0.12))
+        self.assertEqual(3, self.server.requests)
+        self.assertEqual('closed', api.breaker.state)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.responses = [(400, 0)]
+        api = self.make_api()
+
+        self.assertEqual('Unknown', api.get_weather(self.date, 51.5, -0.12))
+        self.assertEqual(1, self.server.requests)
+        self.assertEqual(0, api.breaker.failures)
+
+    def test_slow_response_times_out(self):
+        self.server.responses = [(200, 0.5)]
+        api = self.make_api(timeout=(1, 0.1), retries=0)
+
+        start = time.monotonic()
+        self.assertEqual('Unknown', api.get_weather(self.date, 51.5, -0.12))
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(1, api.breaker.failures)
+
+    def test_circuit_opens_when_api_keeps_failing(self):
+        self.server.responses = [(500, 0)]
+        api = self.make_api(retries=0)
+
+        for _ in range(5):
+            self.assertEqual('Unknown', api.get_weather(self.date, 51.5, -0.12))
+        self.assertEqual(3, self.server.requests)
+        self.assertEqual({'state': 'open', 'failures': 3, 'rejected': 2}, api.breaker.stats())
+
+    def test_circuit_closes_once_api_recovers(self):
+        self.server.responses = [(500, 0), (500, 0), (500, 0), (200, 0)]
+        api = self.make_api(retries=0, breaker=CircuitBreaker(threshold=3, reset_timeout=0.1))
+        for _ in range(3):
+            api.get_weather(self.date, 51.5, -0.12)
+        self.assertEqual('open', api.breaker.state)
+
+        time.sleep(0.1)
+        self.assertEqual('half-open', api.breaker.state)
+        self.assertEqual('Clear', api.get_weather(self.date, 51.5, -0.12))
+        self.assertEqual('closed', api.breaker.state)
+
+    def test_concurrent_lookups_of_a_cell_share_one_request(self):
+        self.server.responses = [(200, 0.3)]
+        api = self.make_api(cache=WeatherCache(':memory:', resolution=0.1, maxsize=10))
+        results = []
+        threads = [threading.Thread(target=lambda lat=lat: results.append(api.get_weather(self.date, lat, -0.12)))
+                   for lat in [51.50, 51.51, 51.52, 51.49, 51.5]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(['Clear'] * 5, results)
+        self.assertEqual(1, self.server.requests)
+        self.assertEqual(4, api.stats()['coalesced'])